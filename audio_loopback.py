@@ -0,0 +1,170 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import namedtuple
+
+from commands import start_command, finish_command
+from scheduler import require, MissingDependency
+
+SAMPLE_RATE = 48000
+# Test tones in Hz. All are multiples of 200 Hz, so their sum repeats every 5 ms and every 10 ms block of a clean
+# capture has the same level, and none is a harmonic of another, so distortion doesn't land on a tone.
+TONES = [400, 1000, 2200, 4600, 8600]
+# Amplitude of each tone (full scale is 1), keeping the sum clear of clipping on a line or mic input
+TONE_LEVEL = 0.1
+SIGNAL_SECONDS = 1.0
+# Silence recorded around the signal, to cover the time the player takes to start and the output's latency
+CAPTURE_MARGIN = 0.6
+PLAY_TIMEOUT = 10
+
+BLOCK = SAMPLE_RATE // 100
+# A capture quieter than this (about -60 dBFS) has no signal in it; a 10 ms block below DROPOUT_LEVEL of the median
+# level within the signal is a dropout
+SILENCE = 0.001
+DROPOUT_LEVEL = 0.25
+
+# Stand-in backends, for trying the test without audio hardware: "pipe" or e.g. "pipe:dropout" plays the signal into a
+# named pipe that the recorder reads, going through the same side by side play and record as a sound card, and
+# "file:PATH" analyses a raw capture (S16_LE at 48 kHz, as `arecord -f S16_LE -r 48000 -t raw` writes it)
+#   clean: a perfect loopback    dropout: 50 ms of the signal lost    silent: nothing comes back
+PIPE_IMPAIRMENTS = ["clean", "dropout", "silent"]
+
+# One capture channel's analysis
+#   level: median level of the signal in dBFS   snr: {tone Hz: signal to noise ratio in dB}
+#   dropouts: gaps in the signal                 seconds: how long the signal lasted
+ChannelStats = namedtuple("ChannelStats", ["level", "snr", "dropouts", "seconds"])
+
+
+class AudioError(Exception):
+    """Playing or recording failed, or the capture holds no signal to analyse."""
+
+
+def test_signal(channels=2):
+    """The tones as interleaved S16_LE samples, with 10 ms fades so the start and end don't click."""
+    np = require("numpy")
+    t = np.arange(int(SAMPLE_RATE * SIGNAL_SECONDS)) / SAMPLE_RATE
+    signal = TONE_LEVEL * np.sin(2 * np.pi * np.outer(TONES, t)).sum(axis=0)
+    fade = np.linspace(0, 1, BLOCK)
+    signal[:BLOCK] *= fade
+    signal[-BLOCK:] *= fade[::-1]
+    samples = np.round(signal * 32767).astype("<i2")
+    return np.repeat(samples, channels).tobytes()
+
+
+def play_command(device):
+    return ["aplay", "-q", "-D", device, "-f", "S16_LE", "-r", str(SAMPLE_RATE), "-c", "2", "-t", "raw", "-"]
+
+
+def record_command(device, channels):
+    samples = int(SAMPLE_RATE * (SIGNAL_SECONDS + CAPTURE_MARGIN))
+    return ["arecord", "-q", "-D", device, "-f", "S16_LE", "-r", str(SAMPLE_RATE), "-c", str(channels), "-t", "raw",
+            "-s", str(samples)]
+
+
+def _last_line(result):
+    errors = result.stderr.decode("utf-8", "replace").strip()
+    return errors.splitlines()[-1] if errors else f"exit code {result.returncode}"
+
+
+def _play_and_record(play, record, signal):
+    """Run the player and the recorder side by side, draining the recording while the signal is written."""
+    recorder = start_command(record, text=False)
+    recording = {}
+    drain = threading.Thread(target=lambda: recording.update(
+        result=finish_command(recorder, SIGNAL_SECONDS + CAPTURE_MARGIN + PLAY_TIMEOUT)), daemon=True)
+    drain.start()
+    try:
+        played = finish_command(start_command(play, stdin=True, text=False), PLAY_TIMEOUT, signal)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        drain.join()
+        raise AudioError(f"{play[0]} failed: {e}")
+    drain.join()
+    if "result" not in recording:
+        raise AudioError(f"{record[0]} didn't finish recording.")
+    if played.returncode != 0:
+        raise AudioError(f"{play[0]} failed: {_last_line(played)}")
+    if recording["result"].returncode != 0:
+        raise AudioError(f"{record[0]} failed: {_last_line(recording['result'])}")
+    return recording["result"].stdout
+
+
+def _pipe_loopback(impairment):
+    if impairment not in PIPE_IMPAIRMENTS:
+        raise ValueError(f"Unknown impairment {impairment}, expected one of {', '.join(PIPE_IMPAIRMENTS)}")
+    np = require("numpy")
+    signal = np.frombuffer(test_signal(), "<i2").copy()
+    if impairment == "silent":
+        signal[:] = 0
+    elif impairment == "dropout":
+        start = signal.size // 2
+        signal[start:start + 2 * SAMPLE_RATE // 20] = 0
+    # Laid out the way a recorder would catch it: a little silence, the signal, then silence up to the length recorded
+    lead = np.zeros(2 * SAMPLE_RATE // 10, "<i2")
+    tail = np.zeros(2 * int(SAMPLE_RATE * CAPTURE_MARGIN) - lead.size, "<i2")
+    data = np.concatenate([lead, signal, tail]).tobytes()
+    directory = tempfile.mkdtemp(prefix="diag-audio-")
+    fifo = os.path.join(directory, "loopback")
+    try:
+        os.mkfifo(fifo)
+        return _play_and_record(["tee", fifo], ["cat", fifo], data)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def loopback(backend="alsa", playback="default", capture="", channels=1):
+    """
+    Play the test signal and record it at the same time. `backend` is "alsa" (aplay on `playback` and arecord on
+    `capture`), "pipe[:impairment]" or "file:PATH". Returns (S16_LE capture bytes, channels in the capture).
+    """
+    if backend.startswith("pipe"):
+        return _pipe_loopback(backend.partition(":")[2] or "clean"), 2
+    if backend.startswith("file:"):
+        with open(backend.partition(":")[2], "rb") as f:
+            return f.read(), channels
+    if backend != "alsa":
+        raise ValueError(f"Unknown audio backend {backend}")
+    missing = [tool for tool in ("aplay", "arecord") if not shutil.which(tool)]
+    if missing:
+        raise MissingDependency(f"{' and '.join(missing)} not installed (alsa-utils).")
+    return _play_and_record(play_command(playback), record_command(capture, channels), test_signal()), channels
+
+
+def analyse_channel(samples):
+    """Level, per-tone SNR and dropouts of one channel of a capture, as floats in -1..1."""
+    np = require("numpy")
+    levels = np.sqrt(np.mean(samples[:samples.size // BLOCK * BLOCK].reshape(-1, BLOCK) ** 2, axis=1))
+    if not levels.size or levels.max() < SILENCE:
+        raise AudioError("No signal captured.")
+    active = np.flatnonzero(levels > levels.max() / 10)
+    # The fades at either end aren't part of the steady signal
+    first, last = active[0] + 2, active[-1] - 1
+    if last - first < 10:
+        raise AudioError(f"Only {(active[-1] - active[0] + 1) * BLOCK / SAMPLE_RATE:.2f}s of signal captured.")
+    span = levels[first:last]
+    low = span < DROPOUT_LEVEL * np.median(span)
+    dropouts = int(np.count_nonzero(low[1:] & ~low[:-1]) + low[0])
+
+    # Hann windowed spectrum of the steady part. A tone's power is summed over the bins the window spreads it across,
+    # and compared with the median bin between the tones, which harmonics and hum barely move.
+    segment = samples[first * BLOCK:last * BLOCK]
+    power = np.abs(np.fft.rfft(segment * np.hanning(segment.size))) ** 2
+    frequencies = np.fft.rfftfreq(segment.size, 1 / SAMPLE_RATE)
+    bins = np.round(np.array(TONES) * segment.size / SAMPLE_RATE).astype(int)
+    tone_power = np.array([power[k - 3:k + 4].sum() for k in bins])
+    noise_bins = (frequencies > 100) & (frequencies < 0.45 * SAMPLE_RATE)
+    for k in bins:
+        noise_bins[k - 10:k + 11] = False
+    noise = max(float(np.median(power[noise_bins])) * 7, 1e-20)
+    snr = 10 * np.log10(np.maximum(tone_power, 1e-20) / noise)
+    level = 20 * np.log10(max(float(np.median(span)), 1e-10))
+    return ChannelStats(round(float(level), 1), dict(zip(TONES, snr.round(1).tolist())), dropouts,
+                        float(last - first) * BLOCK / SAMPLE_RATE)
+
+
+def analyse_capture(data, channels=1):
+    """ChannelStats for each channel of an interleaved S16_LE capture."""
+    np = require("numpy")
+    samples = np.frombuffer(data[:len(data) // (2 * channels) * 2 * channels], "<i2").astype(np.float32) / 32768
+    return [analyse_channel(samples[channel::channels]) for channel in range(channels)]
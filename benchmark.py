@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from camera import capture_command, DEFAULT_WIDTH, DEFAULT_HEIGHT
+from scheduler import MissingDependency
+from system_reader import SystemReader
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_ITERATIONS = 5
+# A test has regressed when its median wall time grows by more than this fraction of the baseline, and by more
+# than REGRESSION_MIN_MS, so sub-millisecond tests don't trip on scheduling noise
+DEFAULT_THRESHOLD = float(os.environ.get("DIAG_BENCH_THRESHOLD", 0.25))
+REGRESSION_MIN_MS = float(os.environ.get("DIAG_BENCH_MIN_MS", 5))
+
+# The tree and baseline committed with the harness: a Pi 4 Model B with a display, a USB 3 stick and Wi-Fi, and the
+# results of timing it
+BENCH_TREE = os.path.join(SCRIPT_DIR, "fixtures", "bench-pi4")
+BENCH_BASELINE = os.path.join(SCRIPT_DIR, "fixtures", "bench-pi4-baseline.json")
+
+# Where a recorded tree keeps the output of the command line tools, next to its proc and sys directories, and the
+# file in there holding the Wi-Fi test's nl80211 replies
+TOOLS_DIR = "bench-tools"
+WIFI_REPLIES = "nl80211.json"
+
+# Command line tools the tests run, with the arguments their output is recorded with, and the output the stubs give
+# when a recorded tree has none
+STUB_TOOLS = {
+    # A YUV420 frame with a vertical gradient
+    "rpicam-still": (capture_command("rpicam-still"),
+                     b"".join(bytes([40 + y * 160 // DEFAULT_HEIGHT]) * DEFAULT_WIDTH for y in range(DEFAULT_HEIGHT))
+                     + b"\x80" * (DEFAULT_WIDTH * DEFAULT_HEIGHT // 2)),
+}
+
+# Settings that keep a bench pass short and free of real hardware access; anything already set is kept
+BENCH_ENVIRONMENT = {
+    "DIAG_BURN_IN_SECONDS": "1",
+    "DIAG_STORAGE_MB": "8",
+    "DIAG_STORAGE_SECONDS": "2",
+    "DIAG_USB_BENCH_MB": "2",
+    "DIAG_GPIO_BACKEND": "simulated",
+    "DIAG_AUDIO_BACKEND": "pipe",
+    "DIAG_BLUETOOTH_BACKEND": "sysfs",
+    "DIAG_DISPLAY_INTERACTIVE": "0",
+    "DIAG_SPEED_SERVER": "",
+    "DIAG_PROBE_TARGETS": "",
+}
+
+
+class RecordingReader(SystemReader):
+    """Reads the real system, copying every file and directory listing it's asked for into `destination`."""
+
+    def __init__(self, destination, root="/", max_file_size=1024 * 1024):
+        super().__init__(root)
+        self.destination = destination
+        self.max_file_size = max_file_size
+        self.recorded = set()
+
+    def _copy_file(self, source, target):
+        try:
+            if os.path.getsize(source) > self.max_file_size:
+                return
+            with open(source, "rb") as f:
+                data = f.read(self.max_file_size)
+        except OSError:
+            # Write-only attributes, or files the kernel refuses to read back
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+
+    def path(self, path):
+        source = super().path(path)
+        if path not in self.recorded:
+            self.recorded.add(path)
+            target = os.path.join(self.destination, path.lstrip("/"))
+            if os.path.isdir(source):
+                # Recreate the listing with empty entries, so list_dir sees the same names when replayed. Only the
+                # files that are read get their contents copied; some, like /proc/kmsg, block when read.
+                os.makedirs(target, exist_ok=True)
+                for entry in os.listdir(source):
+                    if os.path.isdir(os.path.join(source, entry)):
+                        os.makedirs(os.path.join(target, entry), exist_ok=True)
+                    else:
+                        open(os.path.join(target, entry), "a").close()
+            elif os.path.isfile(source):
+                self._copy_file(source, target)
+        return source
+
+
+def _load_diagnostics(root):
+    # The diagnostics read their settings when imported
+    for name, value in BENCH_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ["DIAG_ROOT"] = root
+    import diagnostics
+    diagnostics.log = lambda message: None
+    return diagnostics
+
+
+def _select(tests, names):
+    if not names:
+        return tests
+    unknown = set(names) - {test.name for test in tests}
+    if unknown:
+        raise SystemExit(f"Unknown test(s): {', '.join(sorted(unknown))}")
+    return [test for test in tests if test.name in names]
+
+
+def record(destination, names=()):
+    """Run the tests once against this machine, recording what they read from /proc and /sys and the tools' output."""
+    diagnostics = _load_diagnostics("/")
+    diagnostics.reader = RecordingReader(destination)
+    for test in _select(diagnostics.build_tests(), names):
+        print(f"Recording {test.name}...")
+        try:
+            test.func()
+        except Exception as e:
+            print(f"  {test.name} raised {e}")
+
+    tools = os.path.join(destination, TOOLS_DIR)
+    os.makedirs(tools, exist_ok=True)
+    for tool, (command, _) in STUB_TOOLS.items():
+        if command and shutil.which(tool):
+            process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=30)
+            with open(os.path.join(tools, f"{tool}.out"), "wb") as f:
+                f.write(process.stdout)
+    if "wlan0" in diagnostics.reader.net_interfaces():
+        import wifi
+        try:
+            wifi.record("wlan0", os.path.join(tools, WIFI_REPLIES))
+        except OSError as e:
+            print(f"Could not record the nl80211 replies: {e}")
+    print(f"Recorded {len(diagnostics.reader.recorded)} paths into {destination}")
+
+
+def make_stubs(root, directory):
+    """Write a stub script for each tool into `directory`, printing the tree's recorded output or the default."""
+    for tool, (_, default) in STUB_TOOLS.items():
+        output = os.path.join(root, TOOLS_DIR, f"{tool}.out")
+        if not os.path.exists(output):
+            output = os.path.join(directory, f"{tool}.out")
+            with open(output, "wb" if isinstance(default, bytes) else "w") as f:
+                f.write(default)
+        path = os.path.join(directory, tool)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\ncat "{output}"\n')
+        os.chmod(path, 0o755)
+    # sudo just runs the command, after its own options
+    path = os.path.join(directory, "sudo")
+    with open(path, "w") as f:
+        f.write('#!/bin/sh\nwhile [ "${1#-}" != "$1" ]; do shift; done\nexec "$@"\n')
+    os.chmod(path, 0o755)
+
+
+class _CountingPopen(subprocess.Popen):
+    # Every subprocess helper (run, getoutput, check_output) goes through subprocess.Popen
+    started = 0
+
+    def __init__(self, *args, **kwargs):
+        _CountingPopen.started += 1
+        super().__init__(*args, **kwargs)
+
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _memory_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(func):
+    """Run func once. Returns (wall ms, CPU ms including child processes, peak RSS growth KiB, subprocesses, result)."""
+    can_reset = _reset_peak_rss()
+    rss_before = _memory_kb("VmRSS") if can_reset else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = _CountingPopen.started
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.perf_counter()
+    try:
+        result = func()
+    except Exception as e:
+        result = e
+    wall = time.perf_counter() - wall_start
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = sum(getattr(after, field) - getattr(before, field)
+              for before, after in ((self_before, self_after), (children_before, children_after))
+              for field in ("ru_utime", "ru_stime"))
+    peak = _memory_kb("VmHWM") if can_reset else self_after.ru_maxrss
+    return wall * 1000, cpu * 1000, max(0, peak - rss_before), _CountingPopen.started - started, result
+
+
+def run_benchmark(root, iterations=DEFAULT_ITERATIONS, names=()):
+    """
+    Run each test `iterations` times, one at a time, against the recorded tree at `root` with the tools stubbed.
+    Returns {test name: {"wall_ms", "cpu_ms", "rss_kb", "subprocesses", "status"}} with median times, the largest
+    memory growth and the subprocesses started per run.
+    """
+    if not os.path.isdir(os.path.join(root, "proc")) and not os.path.isdir(os.path.join(root, "sys")):
+        raise SystemExit(f"{root} has no recorded proc or sys tree; make one with 'benchmark.py record {root}'")
+    stubs = tempfile.mkdtemp(prefix="diag-bench-")
+    scratch = tempfile.mkdtemp(prefix="diag-bench-storage-")
+    os.environ.setdefault("DIAG_STORAGE_DIR", scratch)
+    # The tree's own recording when it has one, else the bundled fixture, so the Wi-Fi test never scans
+    replies = os.path.join(root, TOOLS_DIR, WIFI_REPLIES)
+    os.environ.setdefault("DIAG_WIFI_REPLAY", replies if os.path.exists(replies) else "1")
+    diagnostics = _load_diagnostics(root)
+    path, popen = os.environ.get("PATH", ""), subprocess.Popen
+    os.environ["PATH"] = stubs + os.pathsep + path
+    subprocess.Popen = _CountingPopen
+    try:
+        make_stubs(root, stubs)
+        report = {}
+        for test in _select(diagnostics.build_tests(), names):
+            runs = [measure(test.func) for _ in range(iterations)]
+            result = runs[-1][4]
+            if isinstance(result, MissingDependency):
+                status = "skip"
+            else:
+                status = getattr(result, "status", "error")
+            report[test.name] = {
+                "wall_ms": round(statistics.median(run[0] for run in runs), 3),
+                "cpu_ms": round(statistics.median(run[1] for run in runs), 3),
+                "rss_kb": max(run[2] for run in runs),
+                "subprocesses": max(run[3] for run in runs),
+                "status": status,
+            }
+        return report
+    finally:
+        subprocess.Popen = popen
+        os.environ["PATH"] = path
+        shutil.rmtree(stubs, ignore_errors=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD, min_ms=REGRESSION_MIN_MS):
+    """Return a message for each test that got slower than the baseline allows or started more subprocesses."""
+    regressions = []
+    for name, current in report.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        growth = current["wall_ms"] - previous["wall_ms"]
+        if growth > min_ms and current["wall_ms"] > previous["wall_ms"] * (1 + threshold):
+            regressions.append(f"{name}: {previous['wall_ms']:.1f} ms -> {current['wall_ms']:.1f} ms")
+        if current["subprocesses"] > previous["subprocesses"]:
+            regressions.append(f"{name}: {previous['subprocesses']} -> {current['subprocesses']} subprocesses")
+    return regressions
+
+
+def print_report(report, baseline=None):
+    baseline = baseline or {}
+    print(f"{'Test':<30}{'Wall ms':>10}{'CPU ms':>10}{'RSS KiB':>10}{'Procs':>7}{'vs base':>9}  Status")
+    for name, row in report.items():
+        previous = baseline.get(name)
+        change = f"{(row['wall_ms'] / previous['wall_ms'] - 1) * 100:+.0f}%" if previous and previous["wall_ms"] else ""
+        print(f"{name[:29]:<30}{row['wall_ms']:>10.1f}{row['cpu_ms']:>10.1f}{row['rss_kb']:>10}"
+              f"{row['subprocesses']:>7}{change:>9}  {row['status']}")
+    total = sum(row["wall_ms"] for row in report.values())
+    print(f"{'Total':<30}{total:>10.1f}{sum(row['cpu_ms'] for row in report.values()):>10.1f}"
+          f"{'':>10}{sum(row['subprocesses'] for row in report.values()):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the diagnostics themselves against a recorded /proc and /sys")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="record this machine's /proc, /sys and tool output")
+    record_parser.add_argument("root", help="directory to record into")
+    record_parser.add_argument("--test", action="append", default=[], help="only record this test (repeatable)")
+    run_parser = subparsers.add_parser("run", help="time every test against a recorded tree")
+    run_parser.add_argument("root", nargs="?", default=BENCH_TREE, help="recorded tree (default: the bundled one)")
+    run_parser.add_argument("--test", action="append", default=[], help="only time this test (repeatable)")
+    run_parser.add_argument("-n", "--iterations", type=int, default=DEFAULT_ITERATIONS,
+                            help=f"runs per test (default {DEFAULT_ITERATIONS})")
+    run_parser.add_argument("--baseline", metavar="FILE", nargs="?", const=BENCH_BASELINE,
+                            help="compare against a baseline saved with --save (default: the bundled tree's)")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help=f"allowed slowdown as a fraction of the baseline (default {DEFAULT_THRESHOLD})")
+    run_parser.add_argument("--budget", type=float, metavar="SECONDS",
+                            help="fail when one pass of all the tests takes longer than this")
+    run_parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    run_parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.root, args.test)
+        return 0
+
+    report = run_benchmark(args.root, args.iterations, args.test)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["tests"]
+    if args.json:
+        print(json.dumps({"tests": report}, indent=2))
+    else:
+        print_report(report, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"iterations": args.iterations, "tests": report}, f, indent=2)
+
+    failures = compare(report, baseline, args.threshold) if baseline else []
+    total = sum(row["wall_ms"] for row in report.values()) / 1000
+    if args.budget is not None and total > args.budget:
+        failures.append(f"A full pass takes {total:.2f}s, over the {args.budget:g}s budget")
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
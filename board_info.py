@@ -0,0 +1,148 @@
+import functools
+import types
+from collections import namedtuple
+
+# Immutable snapshot of the board's identity, built once per run from /proc/cpuinfo.
+#   cores:    one read-only mapping per "processor" block, e.g. {"processor": "0", "BogoMIPS": "108.00", ...}
+#   fields:   every other cpuinfo key (Hardware, Revision, Serial, Model, ...)
+#   revision: the decoded revision code, see RevisionInfo
+BoardInfo = namedtuple("BoardInfo", ["revision_code", "serial", "model", "hardware", "cores", "fields", "revision"])
+
+RevisionInfo = namedtuple("RevisionInfo", ["code", "new_style", "type_id", "board_type", "board_revision", "processor",
+                                           "manufacturer", "memory_mb", "description"])
+
+# Board type field of the revision code -> (short name, marketing name)
+BOARD_TYPES = {
+    0x00: ("A", "Raspberry Pi Model A"),
+    0x01: ("B", "Raspberry Pi Model B"),
+    0x02: ("A+", "Raspberry Pi Model A+"),
+    0x03: ("B+", "Raspberry Pi Model B+"),
+    0x04: ("2B", "Raspberry Pi 2 Model B"),
+    0x05: ("Alpha", "Raspberry Pi Alpha"),
+    0x06: ("CM1", "Raspberry Pi Compute Module 1"),
+    0x08: ("3B", "Raspberry Pi 3 Model B"),
+    0x09: ("Zero", "Raspberry Pi Zero"),
+    0x0a: ("CM3", "Raspberry Pi Compute Module 3"),
+    0x0c: ("Zero W", "Raspberry Pi Zero W"),
+    0x0d: ("3B+", "Raspberry Pi 3 Model B+"),
+    0x0e: ("3A+", "Raspberry Pi 3 Model A+"),
+    0x10: ("CM3+", "Raspberry Pi Compute Module 3+"),
+    0x11: ("4B", "Raspberry Pi 4 Model B"),
+    0x12: ("Zero 2 W", "Raspberry Pi Zero 2 W"),
+    0x13: ("400", "Raspberry Pi 400"),
+    0x14: ("CM4", "Raspberry Pi Compute Module 4"),
+    0x15: ("CM4S", "Raspberry Pi Compute Module 4S"),
+    0x17: ("5", "Raspberry Pi 5"),
+    0x18: ("CM5", "Raspberry Pi Compute Module 5"),
+    0x19: ("500", "Raspberry Pi 500"),
+    0x1a: ("CM5 Lite", "Raspberry Pi Compute Module 5 Lite"),
+}
+
+PROCESSORS = {0: "BCM2835", 1: "BCM2836", 2: "BCM2837", 3: "BCM2711", 4: "BCM2712"}
+
+MANUFACTURERS = {0: "Sony UK", 1: "Egoman", 2: "Embest", 3: "Sony Japan", 4: "Embest", 5: "Stadium"}
+
+MEMORY_SIZES_MB = {0: 256, 1: 512, 2: 1024, 3: 2048, 4: 4096, 5: 8192, 6: 16384}
+
+# Old-style revision codes predate the bitfield encoding and have to be looked up.
+# code -> (board type, board revision, memory in MB, manufacturer)
+OLD_STYLE_REVISIONS = {
+    0x0002: (0x01, "1.0", 256, "Egoman"),
+    0x0003: (0x01, "1.0", 256, "Egoman"),
+    0x0004: (0x01, "2.0", 256, "Sony UK"),
+    0x0005: (0x01, "2.0", 256, "Qisda"),
+    0x0006: (0x01, "2.0", 256, "Egoman"),
+    0x0007: (0x00, "2.0", 256, "Egoman"),
+    0x0008: (0x00, "2.0", 256, "Sony UK"),
+    0x0009: (0x00, "2.0", 256, "Qisda"),
+    0x000d: (0x01, "2.0", 512, "Egoman"),
+    0x000e: (0x01, "2.0", 512, "Sony UK"),
+    0x000f: (0x01, "2.0", 512, "Egoman"),
+    0x0010: (0x03, "1.2", 512, "Sony UK"),
+    0x0011: (0x06, "1.0", 512, "Sony UK"),
+    0x0012: (0x02, "1.1", 256, "Sony UK"),
+    0x0013: (0x03, "1.2", 512, "Embest"),
+    0x0014: (0x06, "1.0", 512, "Embest"),
+    0x0015: (0x02, "1.1", 256, "Embest"),
+}
+
+NEW_STYLE_FLAG = 1 << 23
+
+
+def _memory_label(memory_mb):
+    return f"{memory_mb // 1024}GB" if memory_mb >= 1024 else f"{memory_mb}MB"
+
+
+def decode_revision(code):
+    """
+    Decode a /proc/cpuinfo revision code such as "c03114" into a RevisionInfo.
+
+    New-style codes are a bitfield (NOQuuuWuFMMMCCCCPPPPTTTTTTTTRRRR); old-style codes are looked up in
+    OLD_STYLE_REVISIONS. Returns None if the code can't be decoded.
+    """
+    try:
+        value = int(code, 16)
+    except (TypeError, ValueError):
+        return None
+
+    if value & NEW_STYLE_FLAG:
+        type_id = (value >> 4) & 0xff
+        board_revision = f"1.{value & 0xf}"
+        processor = PROCESSORS.get((value >> 12) & 0xf, "Unknown")
+        manufacturer = MANUFACTURERS.get((value >> 16) & 0xf, "Unknown")
+        memory_mb = MEMORY_SIZES_MB.get((value >> 20) & 0x7)
+        new_style = True
+    else:
+        # Bit 24 is set on old-style codes when the warranty bit has been blown (e.g. "1000002")
+        old_style = OLD_STYLE_REVISIONS.get(value & 0xffffff)
+        if old_style is None:
+            return None
+        type_id, board_revision, memory_mb, manufacturer = old_style
+        processor = "BCM2835"
+        new_style = False
+
+    board_type, name = BOARD_TYPES.get(type_id, (f"Unknown type 0x{type_id:02x}", "Unknown Model"))
+    description = f"{name} Rev {board_revision}"
+    if memory_mb:
+        description += f" ({_memory_label(memory_mb)} RAM)"
+    return RevisionInfo(code.lower(), new_style, type_id, board_type, board_revision, processor, manufacturer,
+                        memory_mb, description)
+
+
+def parse_cpuinfo(text):
+    """Parse /proc/cpuinfo in a single pass into (fields, cores)."""
+    fields = {}
+    cores = []
+    block = {}
+    for line in text.splitlines() + [""]:
+        if not line.strip():
+            if "processor" in block:
+                cores.append(types.MappingProxyType(block))
+            else:
+                fields.update(block)
+            block = {}
+            continue
+        key, sep, value = line.partition(":")
+        if sep:
+            block[key.strip()] = value.strip()
+    return types.MappingProxyType(fields), tuple(cores)
+
+
+@functools.lru_cache(maxsize=None)
+def _snapshot(reader):
+    fields, cores = parse_cpuinfo(reader.read_text("/proc/cpuinfo", ""))
+    revision_code = fields.get("Revision", "").lower() or None
+    return BoardInfo(
+        revision_code=revision_code,
+        serial=fields.get("Serial"),
+        model=fields.get("Model"),
+        hardware=fields.get("Hardware"),
+        cores=cores,
+        fields=fields,
+        revision=decode_revision(revision_code) if revision_code else None,
+    )
+
+
+def board_info(reader):
+    """Return the BoardInfo snapshot for a SystemReader, reading /proc/cpuinfo only the first time."""
+    return _snapshot(reader)
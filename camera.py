@@ -0,0 +1,139 @@
+import shutil
+import subprocess
+import time
+from collections import namedtuple
+
+from commands import run_command
+from scheduler import require, MissingDependency
+
+# A small frame is plenty to tell a working sensor from a dead, covered or noisy one, and analyses in milliseconds
+DEFAULT_WIDTH = 320
+DEFAULT_HEIGHT = 240
+# Milliseconds the tools run the sensor before capturing, so exposure and gain have settled
+SETTLE_MS = 500
+CAPTURE_TIMEOUT = 10
+
+# Capture tools in order of preference. All write a YUV420 frame to stdout.
+#   rpicam-still / libcamera-still: libcamera stack (Bookworm and Bullseye), rows written unpadded
+#   raspiyuv:                       legacy MMAL stack, rows padded to 32 pixels and the frame to 16 rows
+CAPTURE_TOOLS = ["rpicam-still", "libcamera-still", "raspiyuv"]
+
+# Synthetic frame patterns, for trying the test without a camera: source "synthetic" or e.g. "synthetic:black"
+#   scene: smooth gradient with shapes and slight sensor noise (passes)
+#   black: a dead or covered sensor    noise: a sensor returning garbage    stuck: a scene with hot and dead pixels
+SYNTHETIC_PATTERNS = ["scene", "black", "noise", "stuck"]
+
+# Frame checks: mean luma below MIN_BRIGHTNESS is a black frame (video black is 16), a standard deviation below
+# MIN_CONTRAST a blank one and pixel noise above MAX_NOISE a garbage one. A pixel differing from its neighbours by
+# more than STUCK_THRESHOLD while at the bottom or top of the range is dead or hot; more than MAX_STUCK_FRACTION of
+# them is worth a warning.
+MIN_BRIGHTNESS = 20.0
+MIN_CONTRAST = 3.0
+MAX_NOISE = 25.0
+STUCK_THRESHOLD = 64
+MAX_STUCK_FRACTION = 0.0005
+
+# Luma statistics of one frame
+#   brightness: mean luma (0-255)   contrast: standard deviation of luma   noise: estimated per-pixel noise sigma
+FrameStats = namedtuple("FrameStats", ["width", "height", "brightness", "contrast", "noise", "hot_pixels",
+                                       "dead_pixels", "seconds"])
+
+
+class CameraError(Exception):
+    """The capture tool ran but didn't produce a frame."""
+
+
+class NoCameraError(CameraError):
+    """The capture tool found no camera on the port."""
+
+
+def capture_command(tool, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+    if tool == "raspiyuv":
+        return [tool, "-n", "-t", str(SETTLE_MS), "-w", str(width), "-h", str(height), "-o", "-"]
+    return [tool, "-n", "-t", str(SETTLE_MS), "--width", str(width), "--height", str(height),
+            "--encoding", "yuv420", "-o", "-"]
+
+
+def find_tool(source="auto"):
+    """The capture tool to use: the first installed one for "auto", otherwise the named tool."""
+    candidates = CAPTURE_TOOLS if source == "auto" else [source]
+    for tool in candidates:
+        if shutil.which(tool):
+            return tool
+    raise MissingDependency(f"No camera capture tool installed ({', '.join(candidates)}).")
+
+
+def _align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def luma_plane(data, width, height):
+    """The Y plane of a YUV420 frame as a height x width uint8 array, allowing for the legacy tools' padding."""
+    np = require("numpy")
+    for stride, rows in [(width, height), (_align(width, 32), _align(height, 16)), (_align(width, 64), height)]:
+        if len(data) == stride * rows * 3 // 2:
+            return np.frombuffer(data, np.uint8, stride * rows).reshape(rows, stride)[:height, :width]
+    raise CameraError(f"Expected a {width}x{height} YUV420 frame but got {len(data)} bytes.")
+
+
+def synthetic_frame(pattern="scene", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, seed=0):
+    """A YUV420 frame as a capture tool would write it, for testing without a camera."""
+    np = require("numpy")
+    if pattern not in SYNTHETIC_PATTERNS:
+        raise ValueError(f"Unknown synthetic pattern {pattern}, expected one of {', '.join(SYNTHETIC_PATTERNS)}")
+    rng = np.random.default_rng(seed)
+    if pattern == "noise":
+        luma = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    else:
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        if pattern == "black":
+            scene = np.full((height, width), 16.0, np.float32)
+        else:
+            scene = 40 + 140 * (x / width) + 40 * (y / height)
+            scene[(x - width * 0.3) ** 2 + (y - height * 0.5) ** 2 < (height * 0.2) ** 2] = 220
+            scene[int(height * 0.6):int(height * 0.8), int(width * 0.6):int(width * 0.9)] = 60
+        luma = np.clip(scene + rng.normal(0, 1.5, scene.shape), 0, 255).astype(np.uint8)
+        if pattern == "stuck":
+            count = max(1, width * height // 1000)
+            luma[rng.integers(1, height - 1, count), rng.integers(1, width - 1, count)] = 255
+            luma[rng.integers(1, height - 1, count), rng.integers(1, width - 1, count)] = 0
+    chroma = np.full(width * height // 2, 128, np.uint8)
+    return luma.tobytes() + chroma.tobytes()
+
+
+def capture_frame(source="auto", width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+    """
+    Capture one frame straight into memory. `source` is "auto", a capture tool's name or "synthetic[:pattern]".
+    Returns (YUV420 bytes, the source used).
+    """
+    if source.startswith("synthetic"):
+        return synthetic_frame(source.partition(":")[2] or "scene", width, height), source
+    tool = find_tool(source)
+    try:
+        process = run_command(capture_command(tool, width, height), CAPTURE_TIMEOUT, text=False)
+    except subprocess.TimeoutExpired:
+        raise CameraError(f"{tool} didn't return a frame within {CAPTURE_TIMEOUT}s.")
+    errors = process.stderr.decode("utf-8", "replace")
+    if process.returncode != 0 or not process.stdout:
+        if "no cameras available" in errors.lower() or "not detected" in errors:
+            raise NoCameraError(f"{tool} found no camera.")
+        last_line = errors.strip().splitlines()[-1] if errors.strip() else f"exit code {process.returncode}"
+        raise CameraError(f"{tool} failed: {last_line}")
+    return process.stdout, tool
+
+
+def analyse_frame(luma):
+    """Brightness, contrast, noise and stuck pixel statistics of a luma array, all vectorized."""
+    np = require("numpy")
+    start = time.perf_counter()
+    frame = luma.astype(np.float32)
+    inner = frame[1:-1, 1:-1]
+    # How far each pixel is from the mean of its four neighbours. For independent noise of sigma s this residual has
+    # a standard deviation of s * sqrt(1.25); the median absolute deviation keeps stuck pixels and edges out of it.
+    residual = inner - (frame[:-2, 1:-1] + frame[2:, 1:-1] + frame[1:-1, :-2] + frame[1:-1, 2:]) / 4
+    noise = 1.4826 * float(np.median(np.abs(residual))) / 1.118
+    hot = int(np.count_nonzero((inner >= 250) & (residual > STUCK_THRESHOLD)))
+    dead = int(np.count_nonzero((inner <= 5) & (residual < -STUCK_THRESHOLD)))
+    height, width = luma.shape
+    return FrameStats(width, height, float(frame.mean()), float(frame.std()), noise, hot, dead,
+                      time.perf_counter() - start)
@@ -0,0 +1,112 @@
+import functools
+from collections import namedtuple
+
+from board_info import board_info
+from results import skipped
+
+# What a board model has fitted. Counts are 0 and flags False when the board doesn't have the part, and None when it
+# depends on the variant or carrier board (e.g. wireless on a Compute Module 4), in which case the tests still run.
+#   header_pins: size of the GPIO header (0 when the pins are only on a module connector)
+#   codecs:      hardware video codecs, named as in the Hardware Codecs test
+Capabilities = namedtuple("Capabilities", ["header_pins", "ethernet", "wifi", "bluetooth", "dsi_ports", "csi_ports",
+                                           "hdmi_ports", "audio_jack", "codecs"])
+
+# Board type id (see board_info.BOARD_TYPES) ->
+#   (header pins, ethernet, wifi, bluetooth, DSI ports, CSI ports, HDMI ports, audio jack)
+# The Compute Module 4 and 5 entries describe the official IO boards.
+BOARD_CAPABILITIES = {
+    0x00: (26, False, False, False, 1, 1, 1, True),      # A
+    0x01: (26, True, False, False, 1, 1, 1, True),       # B
+    0x02: (40, False, False, False, 1, 1, 1, True),      # A+
+    0x03: (40, True, False, False, 1, 1, 1, True),       # B+
+    0x04: (40, True, False, False, 1, 1, 1, True),       # 2B
+    0x05: (26, True, False, False, 1, 1, 1, True),       # Alpha
+    0x06: (0, False, False, False, 2, 2, 1, False),      # CM1
+    0x08: (40, True, True, True, 1, 1, 1, True),         # 3B
+    0x09: (40, False, False, False, 0, 1, 1, False),     # Zero
+    0x0a: (0, False, False, False, 2, 2, 1, False),      # CM3
+    0x0c: (40, False, True, True, 0, 1, 1, False),       # Zero W
+    0x0d: (40, True, True, True, 1, 1, 1, True),         # 3B+
+    0x0e: (40, False, True, True, 1, 1, 1, True),        # 3A+
+    0x10: (0, False, False, False, 2, 2, 1, False),      # CM3+
+    0x11: (40, True, True, True, 1, 1, 2, True),         # 4B
+    0x12: (40, False, True, True, 0, 1, 1, False),       # Zero 2 W
+    0x13: (40, True, True, True, 0, 0, 2, False),        # 400
+    0x14: (40, True, None, None, 2, 2, 2, False),        # CM4
+    0x15: (0, False, False, False, 2, 2, 1, False),      # CM4S
+    0x17: (40, True, True, True, 2, 2, 2, False),        # 5 (two combined CSI/DSI ports)
+    0x18: (40, True, None, None, 2, 2, 2, False),        # CM5
+    0x19: (40, True, True, True, 0, 0, 2, False),        # 500
+    0x1a: (40, True, None, None, 2, 2, 2, False),        # CM5 Lite
+}
+
+# Board revisions that differ from their type's entry: (type id, board revision) -> {field: value}
+REVISION_OVERRIDES = {
+    (0x09, "1.2"): {"csi_ports": 0},                    # The camera connector arrived with the Zero v1.3
+}
+
+# Hardware video codecs per processor
+PROCESSOR_CODECS = {
+    "BCM2835": ("H264", "MPG2", "WVC1", "MJPG"),
+    "BCM2836": ("H264", "MPG2", "WVC1", "MJPG"),
+    "BCM2837": ("H264", "MPG2", "WVC1", "MJPG"),
+    "BCM2711": ("H264", "HEVC"),
+    "BCM2712": ("HEVC",),
+}
+
+# Used when the revision code can't be decoded: nothing is ruled out
+UNKNOWN = Capabilities(None, None, None, None, None, None, None, None, None)
+
+
+@functools.lru_cache(maxsize=None)
+def lookup(type_id, board_revision, processor):
+    """The Capabilities of a board, keyed by the decoded revision fields that decide them."""
+    row = BOARD_CAPABILITIES.get(type_id)
+    if row is None:
+        return UNKNOWN
+    capabilities = Capabilities(*row, codecs=PROCESSOR_CODECS.get(processor))
+    return capabilities._replace(**REVISION_OVERRIDES.get((type_id, board_revision), {}))
+
+
+def board_capabilities(reader):
+    revision = board_info(reader).revision
+    if revision is None:
+        return UNKNOWN
+    return lookup(revision.type_id, revision.board_revision, revision.processor)
+
+
+def describe(capabilities):
+    """Short list of what's fitted, e.g. "40 pin header, Ethernet, Wi-Fi, Bluetooth, 2 HDMI, 1 DSI, 1 CSI"."""
+    parts = []
+    if capabilities.header_pins:
+        parts.append(f"{capabilities.header_pins} pin header")
+    for field, label in [("ethernet", "Ethernet"), ("wifi", "Wi-Fi"), ("bluetooth", "Bluetooth"),
+                         ("audio_jack", "audio jack")]:
+        value = getattr(capabilities, field)
+        if value:
+            parts.append(label)
+        elif value is None and capabilities.header_pins is not None:
+            parts.append(f"{label} (variant dependent)")
+    for field, label in [("hdmi_ports", "HDMI"), ("dsi_ports", "DSI"), ("csi_ports", "CSI")]:
+        if getattr(capabilities, field):
+            parts.append(f"{getattr(capabilities, field)} {label}")
+    return ", ".join(parts)
+
+
+def select_tests(tests, capabilities, requires):
+    """
+    Split tests into those that can run on this board and those that can't.
+    `requires` maps a test name to the Capabilities fields it needs. Returns (runnable tests, {name: TestResult})
+    with a skipped result for each test whose hardware isn't fitted. Dependencies on skipped tests are dropped.
+    """
+    runnable = []
+    not_fitted = {}
+    for test in tests:
+        missing = [field for field in requires.get(test.name, ()) if getattr(capabilities, field) in (0, False)]
+        if missing:
+            not_fitted[test.name] = skipped(f"Not fitted on this board ({', '.join(missing)}).")
+        else:
+            runnable.append(test)
+    runnable = [test._replace(depends=tuple(dep for dep in test.depends if dep not in not_fitted))
+                for test in runnable]
+    return runnable, not_fitted
@@ -0,0 +1,114 @@
+import os
+import signal
+import subprocess
+import threading
+
+# Seconds any one command may run before it's killed, unless the caller asks for longer
+COMMAND_TIMEOUT = float(os.environ.get("DIAG_COMMAND_TIMEOUT", 15))
+
+# Commands that are still running, by the thread that started them, so a watchdog can kill a test's commands
+_lock = threading.Lock()
+_running = {}
+# Whether commands get a session of their own; see share_session
+_own_sessions = True
+
+
+def share_session():
+    """
+    Start commands in this process's own process group from now on, for a worker process that is killed as a whole
+    group, so its commands go with it.
+    """
+    global _own_sessions
+    _own_sessions = False
+
+
+def kill_group(process):
+    """Kill a command started by run_command and everything it started in turn."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Not a group leader (see share_session), so only the command itself can be killed
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+def kill_commands(thread_id):
+    """Kill the commands a thread is waiting on. Returns how many were killed."""
+    with _lock:
+        processes = list(_running.get(thread_id, ()))
+    for process in processes:
+        kill_group(process)
+    return len(processes)
+
+
+def kill_all_commands():
+    """Kill every command still running, whichever thread started it."""
+    with _lock:
+        processes = [process for processes in _running.values() for process in processes]
+    for process in processes:
+        kill_group(process)
+
+
+def privileged(command):
+    # -n makes sudo fail straight away instead of waiting for a password nobody is there to type
+    return command if os.geteuid() == 0 else ["sudo", "-n"] + command
+
+
+def start_command(command, stdin=False, text=True):
+    """
+    Start a command the way run_command runs it but without waiting for it, for commands that have to run side by
+    side. It gets a pipe to write to when `stdin` is set. Finish it with finish_command.
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text,
+                               start_new_session=_own_sessions)
+    with _lock:
+        _running.setdefault(threading.get_ident(), set()).add(process)
+    return process
+
+
+def finish_command(process, timeout=COMMAND_TIMEOUT, input=None, check=False):
+    """Feed `input` to a command from start_command and wait for it, with the same results and errors as run_command."""
+    try:
+        stdout, stderr = process.communicate(input, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_group(process)
+        process.communicate()
+        raise
+    finally:
+        with _lock:
+            for thread_id, processes in list(_running.items()):
+                processes.discard(process)
+                if not processes:
+                    del _running[thread_id]
+    result = subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result
+
+
+def run_command(command, timeout=COMMAND_TIMEOUT, input=None, check=False, text=True):
+    """
+    Run a command (an argument list) in a session of its own, so it and anything it starts can be killed as one
+    process group, when it overruns `timeout` or when the test that started it is stopped by the watchdog.
+    Returns a CompletedProcess with stdout and stderr as text, or bytes when `text` is False. Raises
+    subprocess.TimeoutExpired, or CalledProcessError when `check` is set and the command fails.
+    """
+    return finish_command(start_command(command, input is not None, text), timeout, input, check)
+
+
+def command_output(command, timeout=COMMAND_TIMEOUT):
+    """
+    A command's stdout and stderr together, without the trailing newline, like subprocess.getoutput. A missing
+    command gives "<name>: not found" and one that overruns `timeout` gives "<name>: timed out" rather than raising.
+    """
+    try:
+        result = run_command(command, timeout)
+    except FileNotFoundError:
+        return f"{command[0]}: not found"
+    except subprocess.TimeoutExpired:
+        return f"{command[0]}: timed out after {timeout:g}s"
+    output = result.stdout + result.stderr
+    return output[:-1] if output.endswith("\n") else output
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from results import to_record
+
+DEFAULT_SOCKET = os.environ.get("DIAG_SOCKET", "/run/pi-diagnostics.sock")
+# Seconds between scheduled runs; 0 only runs on request
+DEFAULT_INTERVAL = float(os.environ.get("DIAG_DAEMON_INTERVAL", 0))
+
+
+def sd_notify(state):
+    """Tell systemd about our state (e.g. "READY=1") when started as a Type=notify service."""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.sendto(state.encode(), address)
+
+
+class DiagnosticsDaemon:
+    """
+    Keeps the diagnostics imported and the board's static facts cached, and runs the test suite on request or on a
+    schedule. Only one run happens at a time; requests that arrive during a run get its results.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, db=None, run_at_start=True):
+        import diagnostics
+        self.diagnostics = diagnostics
+        self.interval = interval
+        self.db = db
+        self.started_at = time.time()
+        self.facts = self._probe_facts()
+        self.run_lock = threading.Lock()
+        self.running = False
+        self.last_run = None
+        # The first run starts straight away, so results are available soon after boot, or one interval in when
+        # run_at_start is off
+        self.next_run = time.time() if run_at_start else (time.time() + interval if interval else None)
+        self.stop = threading.Event()
+
+    def _probe_facts(self):
+        # Probed once per boot: none of these change while the board is running
+        from board_info import board_info
+        from capabilities import board_capabilities
+        info = board_info(self.diagnostics.reader)
+        capabilities = board_capabilities(self.diagnostics.reader)
+        return {
+            "serial": info.serial,
+            "revision": info.revision_code,
+            "model": self.diagnostics.board_version()["description"],
+            "capabilities": capabilities._asdict(),
+            "gpio_pins": self.diagnostics.get_gpio_testable_pins(capabilities.header_pins),
+        }
+
+    def run(self):
+        """Run the test suite, or wait for the run already in progress. Returns the run record."""
+        if not self.run_lock.acquire(blocking=False):
+            # Someone else is running the suite; their results are as fresh as ours would be
+            with self.run_lock:
+                return self.last_run
+        try:
+            self.running = True
+            started_at = time.time()
+            results = self.diagnostics.master_test()
+            self.last_run = {
+                "started_at": started_at,
+                "seconds": round(time.time() - started_at, 3),
+                "results": [to_record(result) for result in results.values()],
+            }
+            if self.db:
+                import results_db
+                connection = results_db.connect(self.db)
+                results_db.save_run(connection, self.facts["serial"], self.facts["revision"], self.facts["model"],
+                                    results.values(), started_at)
+                connection.close()
+            return self.last_run
+        finally:
+            self.running = False
+            self.run_lock.release()
+
+    def status(self):
+        return {
+            "running": self.running,
+            "uptime": round(time.time() - self.started_at, 1),
+            "last_run": self.last_run["started_at"] if self.last_run else None,
+            "next_run": self.next_run,
+        }
+
+    def handle(self, request):
+        command = request.get("command")
+        if command == "run":
+            return {"ok": True, "run": self.run()}
+        if command == "last":
+            return {"ok": True, "run": self.last_run}
+        if command == "status":
+            return {"ok": True, "status": self.status()}
+        if command == "facts":
+            return {"ok": True, "facts": self.facts}
+        return {"ok": False, "error": f"Unknown command {command}"}
+
+    def schedule(self):
+        """Run the suite when due, then every `interval` seconds, until stopped."""
+        while self.next_run is not None and not self.stop.wait(max(0.0, self.next_run - time.time())):
+            try:
+                self.run()
+            except Exception as e:
+                # A failed run mustn't stop the schedule; the next one may well succeed
+                print(f"Scheduled diagnostics run failed: {e!r}", file=sys.stderr, flush=True)
+            self.next_run = time.time() + self.interval if self.interval else None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # One JSON request per line, answered with one JSON line
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.diagnostics_daemon.handle(json.loads(line))
+            except ValueError as e:
+                response = {"ok": False, "error": f"Bad request: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.diagnostics_daemon = daemon
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _Handler)
+        # Root and members of the socket's group may talk to the daemon
+        os.chmod(path, 0o660)
+
+
+def serve(path=DEFAULT_SOCKET, interval=DEFAULT_INTERVAL, db=None, run_at_start=True):
+    daemon = DiagnosticsDaemon(interval, db, run_at_start)
+    with DaemonServer(path, daemon) as server:
+        threading.Thread(target=daemon.schedule, name="schedule", daemon=True).start()
+        # systemctl stop sends SIGTERM; shutdown() has to be called from another thread than serve_forever's
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        sd_notify("READY=1")
+        print(f"Listening on {path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.stop.set()
+            os.remove(path)
+
+
+def request(command, path=DEFAULT_SOCKET, timeout=None):
+    """Send one command to the daemon and return its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps({"command": command}) + "\n").encode())
+        with sock.makefile("r") as f:
+            return json.loads(f.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raspberry Pi diagnostics daemon and its client")
+    parser.add_argument("command", choices=["serve", "run", "last", "status", "facts"],
+                        help="serve starts the daemon; the others ask a running daemon")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket (default {DEFAULT_SOCKET})")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help="serve: seconds between scheduled runs, 0 to only run on request")
+    parser.add_argument("--db", nargs="?", const="", metavar="PATH",
+                        help="serve: store every run in the results database")
+    parser.add_argument("--no-initial-run", action="store_true", help="serve: don't run the suite on start-up")
+    parser.add_argument("--json", action="store_true", help="print the raw response")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        db = args.db
+        if db == "":
+            import results_db
+            db = results_db.DEFAULT_DB
+        serve(args.socket, args.interval, db, not args.no_initial_run)
+        return 0
+
+    try:
+        response = request(args.command, args.socket)
+    except OSError as e:
+        print(f"Can't reach the diagnostics daemon on {args.socket}: {e}", file=sys.stderr)
+        return 2
+    if args.json or not response["ok"]:
+        print(json.dumps(response, indent=2))
+        return 0 if response["ok"] else 1
+
+    if args.command in ("run", "last"):
+        run = response["run"]
+        if run is None:
+            print("No run has finished yet.")
+            return 0
+        from results import from_record, format_result
+        print(f"Run started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started_at']))}, "
+              f"took {run['seconds']:.1f}s")
+        for record in run["results"]:
+            result = from_record(record)
+            print(f"{result.name}: {format_result(result)}")
+        return 1 if any(record["status"] == "fail" for record in run["results"]) else 0
+    for key, value in response[args.command].items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
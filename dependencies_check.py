@@ -1,77 +1,153 @@
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import shutil
+import site
 import subprocess
+import sys
 
-def check_and_install_dependencies():
-    dependencies = {
-         "hciconfig": {"installer": install_via_apt, "type": "tool", "package": "bluez"},
-        "iwconfig": {"installer": install_via_apt, "type": "tool", "package": "wireless-tools"},
-        "hcitool": {"installer": install_via_apt, "type": "tool"},
-        "speedtest": {"installer": install_via_apt, "type": "tool", "package": "speedtest-cli"},
-        "RPi.GPIO": {"installer": install_via_pip, "type": "pip_package"},
-        "raspistill": {"installer": install_via_apt, "type": "tool", "package": "libraspberrypi-bin"},
-        "pygame": {"installer": install_via_pip, "type": "pip_package"},
-        "amixer": {"installer": install_via_apt, "type": "tool", "package": "alsa-utils"},
-        "aplay": {"installer": install_via_apt, "type": "tool", "package": "alsa-utils"},
+# Command line tools are found with shutil.which and installed with apt; Python packages are looked up by their
+# distribution name and installed with pip.
+DEPENDENCIES = {
+    "rpicam-still": {"type": "tool", "package": "rpicam-apps"},
+    "pygame": {"type": "pip_package"},
+    "numpy": {"type": "pip_package"},
+    "aplay": {"type": "tool", "package": "alsa-utils"},
+    "arecord": {"type": "tool", "package": "alsa-utils"},
 # doesn't seem to exist on the lastest raspbian so remove the dependency
-#        "vcgencmd": {"installer": install_via_apt, "type": "tool", "package": "libraspberrypi-bin"},
-        "netstat": {"installer": install_via_apt, "type": "tool", "package": "net-tools"},
-        "psutil": {"installer": install_via_pip, "type": "python-lib", "package": "psutil"},
-        "lxterminal": {"installer": install_via_apt, "type": "tool"},
-        "xterm": {"installer": install_via_apt, "type": "tool"},
-        "wmctrl": {"installer": install_via_apt, "type": "tool"}
-    }
+#    "vcgencmd": {"type": "tool", "package": "libraspberrypi-bin"},
+    "psutil": {"type": "pip_package"},
+}
 
-    for name, details in dependencies.items():
-        if details["type"] == "tool":
-            if not is_tool_installed(name):
-                print(f"{name} is not installed.")
-                choice = input(f"Do you want to install {name} via apt? (yes/no): ").lower()
-                if choice in ['yes', 'y']:
-                    package = details.get("package", name)
-                    details["installer"](package)
-                elif choice not in ['no', 'n']:
-                    print(f"Invalid choice for {name}. Skipping...")
-
-        elif details["type"] == "pip_package":
-            try:
-                # Check if the pip package is installed
-                subprocess.run(['pip', 'show', name], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            except subprocess.CalledProcessError:
-                print(f"{name} is not installed.")
-                choice = input(f"Do you want to install {name} via pip? (yes/no): ").lower()
-                if choice in ['yes', 'y']:
-                    details["installer"](name)
-                elif choice not in ['no', 'n']:
-                    print(f"Invalid choice for {name}. Skipping...")
-
-def is_tool_installed(tool):
+# The last plan, with a fingerprint of the image it was made on
+PLAN_CACHE = os.environ.get("DIAG_DEPS_CACHE",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dependency_plan.json"))
+
+
+def _is_python_package_installed(name):
     try:
-        subprocess.run(["which", tool], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        importlib.metadata.distribution(name)
         return True
-    except subprocess.CalledProcessError:
-        return False  # Tool is not installed
+    except importlib.metadata.PackageNotFoundError:
+        return False
+
+
+def make_plan(dependencies=DEPENDENCIES):
+    """
+    Check every dependency in one pass, without running any commands.
+    Returns {"apt": [packages], "pip": [packages]} listing what needs installing, each package once.
+    """
+    plan = {"apt": [], "pip": []}
+    for name, details in dependencies.items():
+        package = details.get("package", name)
+        if details["type"] == "tool":
+            if shutil.which(name) is None and package not in plan["apt"]:
+                plan["apt"].append(package)
+        elif not _is_python_package_installed(name) and package not in plan["pip"]:
+            plan["pip"].append(package)
+    return plan
 
-def prompt_installation(tool):
-    answer = input(f"Do you want to install {tool}? [Y/n]: ")
-    return answer.lower() in ["y", "yes", ""]
 
+def image_fingerprint(dependencies=DEPENDENCIES):
+    """
+    A hash that changes whenever the dependency list, the installed apt packages, the Python installation or the
+    directories tools are found in change, so a cached plan is only reused on an unchanged image.
+    """
+    paths = (["/var/lib/dpkg/status"] + os.environ.get("PATH", "").split(os.pathsep) + site.getsitepackages()
+             + [site.getusersitepackages()])
+    digest = hashlib.sha256(json.dumps(dependencies, sort_keys=True).encode())
+    digest.update(sys.version.encode())
+    for path in paths:
+        try:
+            st = os.stat(path or ".")
+            digest.update(f"{path}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+        except OSError:
+            digest.update(f"{path}:missing\n".encode())
+    return digest.hexdigest()
 
-def install_via_apt(package):
-    print(f"Installing {package} via apt...")
+
+def load_cached_plan(fingerprint, path=PLAN_CACHE):
     try:
-        subprocess.run(["sudo", "apt-get", "update"], check=True)
-        subprocess.run(["sudo", "apt-get", "install", "-y", package], check=True)
-        print(f"{package} installed successfully!")
-    except subprocess.CalledProcessError:
-        print(f"Failed to install {package}.")
+        with open(path, "r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached["plan"] if cached.get("fingerprint") == fingerprint else None
 
 
-def install_via_pip(package):
-    print(f"Installing {package} via pip...")
+def save_plan(plan, fingerprint, path=PLAN_CACHE):
     try:
-        subprocess.run(["pip", "install", package], check=True)
-        print(f"{package} installed successfully!")
-    except subprocess.CalledProcessError:
-        print(f"Failed to install {package}.")
+        with open(path, "w") as f:
+            json.dump({"fingerprint": fingerprint, "plan": plan}, f)
+    except OSError as e:
+        print(f"Could not cache the dependency plan in {path}: {e}")
+
+
+def _privileged(command):
+    return command if os.geteuid() == 0 else ["sudo"] + command
+
+
+def install(plan):
+    """Install everything in the plan with one apt-get update, one apt-get install and one pip install."""
+    ok = True
+    if plan["apt"]:
+        print(f"Installing {', '.join(plan['apt'])} via apt...")
+        env = dict(os.environ, DEBIAN_FRONTEND="noninteractive")
+        try:
+            subprocess.run(_privileged(["apt-get", "update"]), check=True, env=env)
+            subprocess.run(_privileged(["apt-get", "install", "-y", "--no-install-recommends"] + plan["apt"]),
+                           check=True, env=env)
+        except subprocess.CalledProcessError:
+            print(f"Failed to install {', '.join(plan['apt'])}.")
+            ok = False
+    if plan["pip"]:
+        print(f"Installing {', '.join(plan['pip'])} via pip...")
+        try:
+            subprocess.run([sys.executable, "-m", "pip", "install"] + plan["pip"], check=True)
+        except subprocess.CalledProcessError:
+            print(f"Failed to install {', '.join(plan['pip'])}.")
+            ok = False
+    return ok
+
+
+def check_and_install_dependencies(assume_yes=False, plan_only=False, use_cache=True):
+    """
+    Work out what's missing and install it. Asks once before installing unless `assume_yes`; with `plan_only` the
+    plan is printed as JSON and nothing is installed. Returns True when nothing is left missing.
+    """
+    fingerprint = image_fingerprint()
+    plan = load_cached_plan(fingerprint) if use_cache else None
+    if plan is None:
+        plan = make_plan()
+        save_plan(plan, fingerprint)
+    if plan_only:
+        print(json.dumps(plan, indent=2))
+        return not plan["apt"] and not plan["pip"]
+    if not plan["apt"] and not plan["pip"]:
+        print("All dependencies are installed.")
+        return True
+
+    for manager in ("apt", "pip"):
+        if plan[manager]:
+            print(f"Missing {manager} packages: {', '.join(plan[manager])}")
+    if not assume_yes:
+        choice = input("Do you want to install them? (yes/no): ").lower()
+        if choice not in ['yes', 'y']:
+            return False
+
+    install(plan)
+    # Check again, so the cached plan describes the image as it is now
+    plan = make_plan()
+    save_plan(plan, image_fingerprint())
+    return not plan["apt"] and not plan["pip"]
+
 
 if __name__ == "__main__":
-    check_and_install_dependencies()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Check for and install the tools and packages the diagnostics use")
+    parser.add_argument("--yes", "-y", action="store_true", help="install everything missing without asking")
+    parser.add_argument("--plan", action="store_true", help="print what would be installed as JSON and exit")
+    parser.add_argument("--no-cache", action="store_true", help="ignore the cached plan from the last check")
+    args = parser.parse_args()
+    sys.exit(0 if check_and_install_dependencies(args.yes, args.plan, not args.no_cache) else 1)
@@ -1,114 +1,246 @@
+import argparse
+import errno
 import os
-import subprocess
-import json
-import RPi.GPIO as GPIO
-import pygame
+import signal
+import sys
 import datetime
-import psutil
-
-def master_test():
-    results = {}  # Central JSON object to collect the outputs of each test
-
-    tests = [
-        ("Raspberry Pi Version", raspberry_pi_version),
-        ("Memory Info", memory_info),
-        ("CPU Info", cpu_info),
-# commented out as I don't need to run this every time, can be re-enable by anyone wanting to use it though
-#        ("SD Card Performance", sd_card_performance),
-        ("Ethernet Port Status", ethernet_port_status),
-        ("Ethernet Speed", ethernet_speed),
-        ("Wifi Adapter Status", wifi_adapter_status),
-        ("Wifi Availability", wifi_availability),
-        ("Bluetooth Availability", bluetooth_availability),
-        ("USB Ports", usb_ports),
-        ("USB Ports Test", usb_ports_test),
-        ("GPIO Pins", gpio_pins),
-        ("GPIO Pins Test", gpio_pins_test),
-        ("Camera Port Test", camera_port_test),
-        ("Display Port", display_port_test),
-        ("HDMI Port", hdmi_port_test),
-        ("Audio Jack", audio_jack_test),
-        ("CPU Temperature", get_cpu_temperature),
-        ("Voltages", get_voltages),
-        ("CPU Utilization", get_cpu_utilization),
-        ("GPU Memory", get_gpu_memory),
-        ("Clock Frequencies", get_clock_frequencies),
-        ("Disk I/O", get_disk_io),
-        ("Hardware Codecs", get_hardware_codecs),
-        ("IRQ (Interrupts) Statistics", get_irq_statistics),
-        ("Network Statistics", get_network_stats),
-        ("Bluetooth Info", get_bluetooth_info),
-        ("Storage Space", get_storage_space),
-        ("Uptime", get_uptime),
+import time
+from results import Metric, FAIL, passed, warning, failed, skipped, format_result, write_json_lines, to_event_line
+from scheduler import Test, schedule, require, MissingDependency, DEFAULT_WORKERS, EXCLUSIVE, kill_all
+from system_reader import SystemReader, human_size
+from board_info import board_info
+from capabilities import board_capabilities, describe, select_tests
+from monitor import run_monitor, DEFAULT_THRESHOLDS
+from drm import list_connectors, describe_connector
+from gpio_jig import DEFAULT_JIG as DEFAULT_GPIO_JIG
+
+# Heavy or hardware specific modules (pygame, psutil) and the larger helpers are imported by the tests that
+# use them, so headless runs start quickly and a missing module only skips the tests that need it.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+# Number of tests allowed to run at the same time. Tests that share a resource tag are always serialized.
+MAX_WORKERS = int(os.environ.get("DIAG_WORKERS", DEFAULT_WORKERS))
+
+# Seconds a test may run before the watchdog stops it (tests with a configured length get that on top), and the
+# limit for the whole run, after which running tests are stopped and the rest skipped
+TEST_TIMEOUT = float(os.environ.get("DIAG_TEST_TIMEOUT", 30))
+RUN_TIMEOUT = float(os.environ.get("DIAG_RUN_TIMEOUT", 600))
+# Run the tests that can hang in Python code (pygame, GPIO) in worker processes the watchdog can kill
+ISOLATE_TESTS = os.environ.get("DIAG_ISOLATE", "1") == "1"
+
+# Length of the CPU/memory burn-in and the share of available memory it sweeps
+BURN_IN_SECONDS = float(os.environ.get("DIAG_BURN_IN_SECONDS", 30))
+BURN_IN_MEMORY_FRACTION = float(os.environ.get("DIAG_BURN_IN_MEMORY_FRACTION", 0.25))
+
+# Where the storage benchmark writes its scratch file, how much it writes and how long it may take
+STORAGE_BENCH_DIR = os.environ.get("DIAG_STORAGE_DIR", "/var/tmp")
+STORAGE_BENCH_MB = int(os.environ.get("DIAG_STORAGE_MB", 64))
+STORAGE_BENCH_SECONDS = float(os.environ.get("DIAG_STORAGE_SECONDS", 8))
+
+# USB Ports Test reads up to DIAG_USB_BENCH_MB (0 skips it) from each USB stick for at most DIAG_USB_BENCH_SECONDS and
+# fails one reading slower than DIAG_USB_MIN_MB_S (0 accepts any speed; set it from a known test stick). With
+# DIAG_USB_ALL_PORTS=1 a physical port with nothing plugged in fails too, for a jig with a stick in every port.
+USB_BENCH_MB = int(os.environ.get("DIAG_USB_BENCH_MB", 64))
+USB_BENCH_SECONDS = float(os.environ.get("DIAG_USB_BENCH_SECONDS", 3))
+USB_MIN_MB_S = float(os.environ.get("DIAG_USB_MIN_MB_S", 0))
+USB_ALL_PORTS = os.environ.get("DIAG_USB_ALL_PORTS", "0") == "1"
+
+# Connectivity probe targets (see net_probe.py), e.g. "gateway,dns" or "tcp:10.0.0.5:5201", and the per-probe timeout
+PROBE_TARGETS = os.environ.get("DIAG_PROBE_TARGETS", "gateway,dns")
+PROBE_TIMEOUT = float(os.environ.get("DIAG_PROBE_TIMEOUT", 0.5))
+
+# Wi-Fi: a recorded nl80211 fixture to replay instead of scanning (see wifi.py; 1 replays the one in fixtures/), the
+# channels to scan (all by default; e.g. "1,6,11" scans in a fraction of the time), a network whose signal grades the
+# antenna instead of the link's, and the weakest signal that passes in dBm
+WIFI_REPLAY = os.environ.get("DIAG_WIFI_REPLAY", "")
+WIFI_CHANNELS = [int(channel) for channel in os.environ.get("DIAG_WIFI_CHANNELS", "").split(",") if channel.strip()]
+WIFI_REFERENCE_SSID = os.environ.get("DIAG_WIFI_REFERENCE_SSID", "")
+WIFI_MIN_SIGNAL = float(os.environ.get("DIAG_WIFI_MIN_SIGNAL", -70))
+
+# Bluetooth: how the controller is reached (see hci.py): auto (a raw HCI socket, or /sys/class/bluetooth without
+# one), hci, sysfs or fake (a simulated controller for trying the tests without one), and how many seconds Bluetooth
+# Info scans for LE advertisers to grade the antenna; 0 skips the scan
+BLUETOOTH_BACKEND = os.environ.get("DIAG_BLUETOOTH_BACKEND", "auto")
+BLUETOOTH_SCAN_SECONDS = float(os.environ.get("DIAG_BLUETOOTH_SCAN_SECONDS", 0))
+
+# Bench host running 'throughput.py server' (host or host:port), the number of parallel streams, seconds per direction,
+# and the share of the negotiated link speed that counts as sustaining line rate
+SPEED_SERVER = os.environ.get("DIAG_SPEED_SERVER", "")
+SPEED_STREAMS = int(os.environ.get("DIAG_SPEED_STREAMS", 4))
+SPEED_SECONDS = float(os.environ.get("DIAG_SPEED_SECONDS", 5))
+SPEED_MIN_FRACTION = float(os.environ.get("DIAG_SPEED_MIN_FRACTION", 0.8))
+# Interface the streams are bound to; set to lo to try the test against a server on this machine
+SPEED_INTERFACE = os.environ.get("DIAG_SPEED_INTERFACE", "eth0")
+
+# Pairs of header pins wired together by the GPIO loopback jig (see gpio_jig.py), and how the pins are driven:
+# auto, gpiochip, gpiomem or simulated (a fault-free jig, for trying the test without one)
+GPIO_JIG = os.environ.get("DIAG_GPIO_JIG", DEFAULT_GPIO_JIG)
+GPIO_BACKEND = os.environ.get("DIAG_GPIO_BACKEND", "auto")
+
+# Where the camera test gets its frame: auto (the first of rpicam-still, libcamera-still and raspiyuv installed), one
+# of those tools, or synthetic[:scene|black|noise|stuck] for trying the test without a camera
+CAMERA_SOURCE = os.environ.get("DIAG_CAMERA_SOURCE", "auto")
+
+# Audio loopback: the jack plays a set of tones on DIAG_AUDIO_PLAYBACK while DIAG_AUDIO_CAPTURE records them, through
+# a cable into a USB sound card (e.g. plughw:CARD=Device) or the snd-aloop loopback (plughw:Loopback,1, playing on
+# plughw:Loopback,0). Without a capture device the test is skipped. Tones below DIAG_AUDIO_MIN_SNR dB fail.
+# DIAG_AUDIO_BACKEND=pipe[:clean|dropout|silent] or file:PATH tries the test without audio hardware (see
+# audio_loopback.py).
+AUDIO_BACKEND = os.environ.get("DIAG_AUDIO_BACKEND", "alsa")
+AUDIO_PLAYBACK = os.environ.get("DIAG_AUDIO_PLAYBACK", "plughw:CARD=Headphones")
+AUDIO_CAPTURE = os.environ.get("DIAG_AUDIO_CAPTURE", "")
+AUDIO_CAPTURE_CHANNELS = int(os.environ.get("DIAG_AUDIO_CAPTURE_CHANNELS", 1))
+AUDIO_MIN_SNR = float(os.environ.get("DIAG_AUDIO_MIN_SNR", 40))
+
+# Show a test pattern on connected displays and wait up to DIAG_DISPLAY_TIMEOUT seconds for a key press. Off by
+# default, so unattended runs only check the DRM state and EDID.
+DISPLAY_INTERACTIVE = os.environ.get("DIAG_DISPLAY_INTERACTIVE", "0") == "1"
+DISPLAY_TIMEOUT = float(os.environ.get("DIAG_DISPLAY_TIMEOUT", 30))
+
+# Tests whose failure makes the rest of the run moot; --fail-fast (and run.py --fail-fast) stop at the first to fail
+CRITICAL_TESTS = {name.strip() for name in os.environ.get(
+    "DIAG_CRITICAL_TESTS", "Memory Info,CPU Info,SD Card Performance,Storage Space").split(",") if name.strip()}
+
+# Human readable progress goes to stdout, or to stderr when stdout carries JSON lines (--json, --events)
+log_stream = sys.stdout
+
+
+def log(message):
+    print(message, file=log_stream)
+
+
+# All /proc and /sys access goes through this reader. Point DIAG_ROOT at a copy of those trees to test against it.
+reader = SystemReader(os.environ.get("DIAG_ROOT", "/"))
+
+
+# Capabilities fields (see capabilities.py) a test needs; it's skipped on boards where they're 0 or False
+TEST_REQUIREMENTS = {
+    "Ethernet Port Status": ("ethernet",),
+    "Ethernet Speed": ("ethernet",),
+    "Wifi Adapter Status": ("wifi",),
+    "Wifi Availability": ("wifi",),
+    "Bluetooth Availability": ("bluetooth",),
+    "Bluetooth Info": ("bluetooth",),
+    "GPIO Pins Test": ("header_pins",),
+    "Camera Port Test": ("csi_ports",),
+    "Display Port": ("dsi_ports",),
+    "HDMI Port": ("hdmi_ports",),
+    "Audio Jack": ("audio_jack",),
+}
+
+
+def build_tests():
+    # The display tests wait for a key press when interactive
+    display_timeout = DISPLAY_TIMEOUT + TEST_TIMEOUT if DISPLAY_INTERACTIVE else TEST_TIMEOUT
+    return [
+        Test("Raspberry Pi Version", raspberry_pi_version),
+        Test("Memory Info", memory_info),
+        Test("CPU Info", cpu_info),
+        Test("SD Card Performance", sd_card_performance, {"storage"}, timeout=STORAGE_BENCH_SECONDS + TEST_TIMEOUT),
+        Test("Ethernet Port Status", ethernet_port_status, {"network"}),
+        # No point measuring throughput until the port status check has had the link to itself
+        Test("Ethernet Speed", ethernet_speed, {"network"}, ("Ethernet Port Status",),
+             timeout=2 * SPEED_SECONDS + TEST_TIMEOUT),
+        Test("Wifi Adapter Status", wifi_adapter_status, {"network", "wifi"}),
+        Test("Wifi Availability", wifi_availability, {"wifi"}),
+        Test("Bluetooth Availability", bluetooth_availability, {"bluetooth"}),
+        Test("USB Ports", usb_ports, {"usb"}),
+        # Room for a stick in each of four ports
+        Test("USB Ports Test", usb_ports_test, {"usb"}, timeout=4 * USB_BENCH_SECONDS + TEST_TIMEOUT),
+        Test("GPIO Pins", gpio_pins),
+        Test("GPIO Pins Test", gpio_pins_test, {"gpio"}, isolate=True),
+        Test("Camera Port Test", camera_port_test, {"camera"}),
+        Test("Display Port", display_port_test, {"display"}, timeout=display_timeout, isolate=True),
+        Test("HDMI Port", hdmi_port_test, {"display"}, timeout=display_timeout, isolate=True),
+        Test("Audio Jack", audio_jack_test, {"audio"}),
+        Test("CPU Temperature", get_cpu_temperature, {"cpu"}),
+        Test("Voltages", get_voltages),
+        Test("CPU Utilization", get_cpu_utilization, {"cpu"}),
+        Test("GPU Memory", get_gpu_memory),
+        Test("Clock Frequencies", get_clock_frequencies, {"cpu"}),
+        Test("Disk I/O", get_disk_io, {"storage"}),
+        Test("Hardware Codecs", get_hardware_codecs),
+        Test("IRQ (Interrupts) Statistics", get_irq_statistics),
+        Test("Network Statistics", get_network_stats),
+        Test("Bluetooth Info", get_bluetooth_info, {"bluetooth"}, timeout=BLUETOOTH_SCAN_SECONDS + TEST_TIMEOUT),
+        Test("Storage Space", get_storage_space),
+        Test("Uptime", get_uptime),
+        # Loads every core and sweeps memory, so it runs alone: alongside other tests it would skew their throughput
+        # and readings, and they its ops/s and throttle verdict
+        Test("CPU/Memory Burn-in", burn_in_test, {EXCLUSIVE}, timeout=BURN_IN_SECONDS + TEST_TIMEOUT),
     ]
 
-    for test_name, test_func in tests:
-        print(f"Running {test_name} test...")
-        result = test_func()
-        results[test_name] = result
-        print(f"Outcome for {test_name}: {result}")
-        print("=" * 40)
 
-    return results
+def iter_results(tests=None, on_start=None):
+    """
+    Run the tests and yield (test, TestResult) as each one finishes, starting with the tests skipped because this
+    board model doesn't have their hardware. Stop iterating to abandon the run; running tests are left to finish.
+    """
+    tests = build_tests() if tests is None else tests
+    # Tests for hardware this board model doesn't have are skipped up front instead of probing for it
+    runnable, not_fitted = select_tests(tests, board_capabilities(reader), TEST_REQUIREMENTS)
+    if not_fitted:
+        log(f"Skipping {len(not_fitted)} tests for hardware this board doesn't have: {', '.join(not_fitted)}")
+    for test in tests:
+        if test.name in not_fitted:
+            yield test, not_fitted[test.name]._replace(name=test.name, duration=0.0)
+    yield from schedule(runnable, MAX_WORKERS, on_start, TEST_TIMEOUT, RUN_TIMEOUT, ISOLATE_TESTS)
 
 
-def raspberry_pi_version():
-    # Create a dictionary of known Raspberry Pi revision codes and their descriptions
-    revisions = {
-        "0002": "Raspberry Pi Model B Rev 1",
-        "0003": "Raspberry Pi Model B Rev 1 ECN0001 (no fuses, D14 removed)",
-        "0004": "Raspberry Pi Model B Rev 2",
-        "0005": "Raspberry Pi Model B Rev 2",
-        "0006": "Raspberry Pi Model B Rev 2",
-        "0007": "Raspberry Pi Model A",
-        "0008": "Raspberry Pi Model A",
-        "0009": "Raspberry Pi Model A",
-        "000d": "Raspberry Pi Model B Rev 2",
-        "000e": "Raspberry Pi Model B Rev 2",
-        "000f": "Raspberry Pi Model B Rev 2",
-        "0010": "Raspberry Pi Model B+ Rev 1.2",
-        "0011": "Raspberry Pi Compute Module 1",
-        "0012": "Raspberry Pi Model A+ Rev 1.1",
-        "0013": "Raspberry Pi Model B+ Rev 1.2",
-        "0014": "Raspberry Pi Compute Module 1",
-        "0015": "Raspberry Pi Model A+ Rev 1.1",
-        "a01040": "Raspberry Pi 2 Model B Rev 1.0",
-        "a01041": "Raspberry Pi 2 Model B Rev 1.1",
-        "a21041": "Raspberry Pi 2 Model B Rev 1.1",
-        "a22042": "Raspberry Pi 2 Model B Rev 1.2",
-        "900021": "Raspberry Pi Model A+ Rev 1.1",
-        "900032": "Raspberry Pi Model B+ Rev 1.2",
-        "900092": "Raspberry Pi Zero Rev 1.2",
-        "900093": "Raspberry Pi Zero Rev 1.3",
-        "9000c1": "Raspberry Pi Zero W",
-        "9020e0": "Raspberry Pi 3 Model A+",
-        "a02082": "Raspberry Pi 3 Model B Rev 1.2",
-        "a020a0": "Raspberry Pi Compute Module 3 Rev 1.0",
-        "a020d3": "Raspberry Pi 3 Model B+",
-        "a22082": "Raspberry Pi 3 Model B Rev 1.2",
-        "a220a0": "Raspberry Pi Compute Module 3 Rev 1.0",
-        "a32082": "Raspberry Pi 3 Model B Rev 1.2",
-        "a52082": "Raspberry Pi 3 Model B Rev 1.2",
-        "a22083": "Raspberry Pi 3 Model B Rev 1.3",
-        "a02100": "Raspberry Pi Compute Module 3+ Rev 1.0",
-        "a03111": "Raspberry Pi 4 Model B Rev 1.1 (1GB RAM)",
-        "b03111": "Raspberry Pi 4 Model B Rev 1.1 (2GB RAM)",
-        "c03111": "Raspberry Pi 4 Model B Rev 1.1 (4GB RAM)",
-        "c03112": "Raspberry Pi 4 Model B Rev 1.2 (4GB RAM)"
-        # Add newer models as they're released and documented.
-    }
+def is_critical_failure(result):
+    return result.status == FAIL and result.name in CRITICAL_TESTS
+
+
+def master_test(tests=None, on_start=None, on_result=None, fail_fast=False):
+    """
+    Run the tests and return their TestResults keyed by name, in the order of the tests list. on_start(test) and
+    on_result(test, result) are called as each test starts and finishes. With fail_fast the run stops at the first
+    critical failure, and the tests that hadn't finished are left out of the results.
+    """
+    tests = build_tests() if tests is None else tests
+
+    def report_start(test):
+        log(f"Running {test.name} test...")
+        if on_start:
+            on_start(test)
+
+    start = time.perf_counter()
+    results = {}
+    for test, result in iter_results(tests, report_start):
+        results[test.name] = result
+        log(f"Outcome for {test.name} ({result.duration:.2f}s): {format_result(result)}")
+        log("=" * 40)
+        if on_result:
+            on_result(test, result)
+        if fail_fast and is_critical_failure(result):
+            log(f"Stopping after the critical {test.name} test failed")
+            break
+    test_time = sum(result.duration for result in results.values())
+    log(f"Finished {len(results)} tests in {time.perf_counter() - start:.2f}s ({test_time:.2f}s of test time)")
+
+    return {test.name: results[test.name] for test in tests if test.name in results}
+
+
+def board_version():
+    """Return {"code": revision code, "description": model name} for this board."""
+    revision = board_info(reader).revision
+    if revision is None:
+        code = board_info(reader).revision_code or "N/A"
+        return {"code": code, "description": "Unknown Model"}
+    return {"code": revision.code, "description": revision.description}
+
 
-    with open('/proc/cpuinfo', 'r') as f:
-        for line in f:
-            if line.startswith('Revision'):
-                revision = line.split(":")[1].strip().lower()
-                model = revisions.get(revision, "Unknown Model")
-                return {"code": revision, "description": model}
-    return {"code": "N/A", "description": "Unknown Model"}
+def raspberry_pi_version():
+    version = board_version()
+    if version["description"] == "Unknown Model":
+        return warning(f"Unknown model (revision code {version['code']}).")
+    return passed(f"{version['description']} (revision code {version['code']}). "
+                  f"{describe(board_capabilities(reader))}.")
 
 
 def memory_info():
     """Return memory usage information."""
+    psutil = require("psutil")
     memory = psutil.virtual_memory()
 
     total_mem = memory.total / (1024 ** 2)  # Convert bytes to MB
@@ -116,167 +248,287 @@ def memory_info():
     used_mem = memory.used / (1024 ** 2)
     memory_percentage = memory.percent
 
-    return f"Total Memory: {total_mem:.2f} MB, Used: {used_mem:.2f} MB, Available: {available_mem:.2f} MB, Usage: {memory_percentage}%"
+    return passed(f"Total Memory: {total_mem:.2f} MB, Used: {used_mem:.2f} MB, Available: {available_mem:.2f} MB, "
+                  f"Usage: {memory_percentage}%",
+                  total=Metric(round(total_mem, 2), "MB"), used=Metric(round(used_mem, 2), "MB"),
+                  available=Metric(round(available_mem, 2), "MB"), usage=Metric(memory_percentage, "%"))
 
 
 def cpu_info():
-    try:
-        with open('/proc/cpuinfo', 'r') as f:
-            for line in f:
-                if line.startswith('model name'):
-                    return line.strip().split(":")[1].strip()
-        return "Unknown"
-    except Exception:
-        return "Error fetching CPU info."
+    info = board_info(reader)
+    cores = Metric(len(info.cores), "cores")
+    if info.cores and "model name" in info.cores[0]:
+        return passed(info.cores[0]["model name"], cores=cores)
+    # 64-bit kernels don't report a model name, so fall back to the SoC decoded from the revision code
+    if info.revision is not None:
+        return passed(f"{info.revision.processor} ({len(info.cores)} cores)", cores=cores)
+    return warning("Unknown CPU.", cores=cores)
 
 
 def sd_card_performance():
-    # This will measure a simple write and read performance. It's not comprehensive.
+    # Sequential and 4K random read/write, bypassing the page cache so the numbers reflect the card itself
+    from storage_bench import run_storage_benchmark
     try:
-        write_speed = subprocess.getoutput("dd if=/dev/zero of=tempfile bs=1M count=1024 conv=fdatasync,notrunc")
-        read_speed = subprocess.getoutput("dd if=tempfile of=/dev/null bs=1M count=1024")
-        os.remove("tempfile")
-        return (write_speed.split()[-1], read_speed.split()[-1])
-    except Exception:
-        return ("Error measuring write speed", "Error measuring read speed")
+        result = run_storage_benchmark(STORAGE_BENCH_DIR, STORAGE_BENCH_MB * 1024 * 1024, STORAGE_BENCH_SECONDS)
+        return passed(f"Sequential Write: {result['seq_write_mb_s']:.1f} MB/s, "
+                      f"Sequential Read: {result['seq_read_mb_s']:.1f} MB/s, "
+                      f"4K Random Read: {result['rand_read_iops']:.0f} IOPS, "
+                      f"4K Random Write: {result['rand_write_iops']:.0f} IOPS "
+                      f"({result['bytes_tested'] / (1024 ** 2):.0f} MB tested)",
+                      seq_write=Metric(round(result["seq_write_mb_s"], 2), "MB/s"),
+                      seq_read=Metric(round(result["seq_read_mb_s"], 2), "MB/s"),
+                      rand_read=Metric(round(result["rand_read_iops"]), "IOPS"),
+                      rand_write=Metric(round(result["rand_write_iops"]), "IOPS"),
+                      tested=Metric(result["bytes_tested"], "B"))
+    except Exception as e:
+        return failed(f"Error measuring storage performance: {e}")
+
 
 def ethernet_port_status():
     try:
         # 1. Check if the eth0 interface exists
-        interfaces_output = subprocess.getoutput('ls /sys/class/net')
-        if 'eth0' not in interfaces_output:
-            return "Ethernet interface (eth0) not found."
+        if 'eth0' not in reader.net_interfaces():
+            return failed("Ethernet interface (eth0) not found.")
 
         # 2. Check link detection for eth0
-        link_detected_output = subprocess.getoutput('cat /sys/class/net/eth0/carrier')
-        if link_detected_output.strip() == "0":
-            return "Ethernet interface (eth0) is present but no link detected."
-
-        # 3. Check the ability to communicate over the network with a simple ping
-        ping_google = subprocess.run(['ping', '-c', '1', '8.8.8.8'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if ping_google.returncode == 0:
-            return "Ethernet interface (eth0) is functional and has internet connectivity."
+        if not reader.carrier('eth0'):
+            return failed("Ethernet interface (eth0) is present but no link detected.")
+
+        # 3. Check the probe targets are reachable through eth0 itself
+        reachable, details, metrics = probe_connectivity('eth0')
+        if reachable:
+            return passed(f"Ethernet interface (eth0) is functional. {details}", **metrics)
         else:
-            return "Ethernet interface (eth0) is present, link detected but no internet connectivity."
+            return warning(f"Ethernet interface (eth0) is present, link detected but not all targets are reachable. "
+                           f"{details}", **metrics)
 
     except Exception as e:
-        return f"Error checking Ethernet status: {e}"
+        return failed(f"Error checking Ethernet status: {e}")
 
 
-def ethernet_speed():
-    try:
-        # Run speedtest-cli and get JSON output
-        speedtest_output = subprocess.getoutput('speedtest-cli --json')
-        speedtest_data = json.loads(speedtest_output)
+def probe_connectivity(interface):
+    """
+    Probe the configured targets through one interface, all at once.
+    Returns (all reachable, summary text, metrics).
+    """
+    # asyncio is slow to import, so only runs that probe the network pay for it
+    from net_probe import probe_interfaces, format_probe
+    probes = probe_interfaces([interface], reader, PROBE_TARGETS, PROBE_TIMEOUT)[interface]
+    if not probes:
+        return False, "No probe targets (no default route or nameserver).", {}
+    reachable = [probe for probe in probes if probe.reachable]
+    details = "; ".join(format_probe(probe) for probe in probes) + "."
+    if any(probe.bind_errno == errno.EPERM for probe in probes):
+        details += f" Probes could not be bound to {interface} (needs root), so they followed the routing table."
+    metrics = {"reachable": Metric(len(reachable), "targets"), "targets": Metric(len(probes), "targets")}
+    if reachable:
+        metrics["max_latency"] = Metric(round(max(probe.seconds for probe in reachable) * 1000, 2), "ms")
+    return len(reachable) == len(probes), details, metrics
 
-        download_speed_mbps = speedtest_data["download"] / 1_000_000  # Convert from bits to Mbps
-        upload_speed_mbps = speedtest_data["upload"] / 1_000_000      # Convert from bits to Mbps
-        ping = speedtest_data["ping"]
 
-        return (f"Download Speed: {download_speed_mbps:.2f} Mbps",
-                f"Upload Speed: {upload_speed_mbps:.2f} Mbps",
-                f"Ping: {ping} ms")
+def ethernet_speed():
+    try:
+        if not SPEED_SERVER:
+            return skipped("No throughput server configured. Run 'python3 throughput.py server' on a bench host and "
+                           "set DIAG_SPEED_SERVER to its address.")
+        from throughput import measure, DEFAULT_PORT
+        host, _, port = SPEED_SERVER.partition(":")
+        result = measure(host, int(port or DEFAULT_PORT), SPEED_STREAMS, SPEED_SECONDS, SPEED_INTERFACE)
+
+        download_speed_mbps = result["download_mbps"]
+        upload_speed_mbps = result["upload_mbps"]
+        message = (f"Download Speed: {download_speed_mbps:.2f} Mbps, Upload Speed: {upload_speed_mbps:.2f} Mbps, "
+                   f"Latency: {result['latency_ms']:.2f} ms, Jitter: {result['jitter_ms']:.3f} ms")
+        metrics = {"download": Metric(round(download_speed_mbps, 2), "Mbps"),
+                   "upload": Metric(round(upload_speed_mbps, 2), "Mbps"),
+                   "latency": Metric(round(result["latency_ms"], 3), "ms"),
+                   "jitter": Metric(round(result["jitter_ms"], 3), "ms")}
+
+        # Compare against the rate the port negotiated, when the driver reports it
+        link_speed = reader.read_int(f"/sys/class/net/{SPEED_INTERFACE}/speed")
+        if link_speed and link_speed > 0:
+            metrics["link_speed"] = Metric(link_speed, "Mbps")
+            if min(download_speed_mbps, upload_speed_mbps) < link_speed * SPEED_MIN_FRACTION:
+                return warning(f"{message}. Below {SPEED_MIN_FRACTION:.0%} of the {link_speed} Mbps link speed.",
+                               **metrics)
+        return passed(message, **metrics)
     except Exception as e:
-        return (f"Error running speedtest-cli: {e}", "", "")
+        return failed(f"Error measuring throughput to {SPEED_SERVER}: {e}")
+
 
 def wifi_adapter_status():
     try:
         # 1. Check if the wlan0 interface exists
-        interfaces_output = subprocess.getoutput('ls /sys/class/net')
-        if 'wlan0' not in interfaces_output:
-            return "WiFi interface (wlan0) not found."
-
-        # 2. Scan for available networks. Requires the user to be in the 'netdev' group or running as root.
-        scan_output = subprocess.getoutput('sudo iwlist wlan0 scan')
-        if 'No scan results' in scan_output:
-            return "WiFi interface (wlan0) is present but can't detect networks. Ensure WiFi is enabled and permissions are set."
-
-        # 3. Check if the adapter is connected to a network
-        connection_check = subprocess.getoutput('iwconfig wlan0 | grep "ESSID:off/any"')
-        if 'ESSID:off/any' in connection_check:
-            connection_status = "Not connected to any WiFi network."
+        if 'wlan0' not in reader.net_interfaces():
+            return failed("WiFi interface (wlan0) not found.")
+
+        # 2. One scan and the link's state over nl80211, or the link's signal from /proc/net/wireless
+        from wifi import survey, grade, format_bss, channel_frequency
+        report = survey('wlan0', reader, True if WIFI_REPLAY == "1" else WIFI_REPLAY or None,
+                        frequencies=[channel_frequency(channel) for channel in WIFI_CHANNELS])
+        metrics = {"networks": Metric(len(report.networks), "networks"),
+                   "survey_time": Metric(round(report.seconds * 1000, 1), "ms")}
+        lines = []
+        if report.source != "proc":
+            if not report.networks:
+                return warning("WiFi interface (wlan0) is present but can't detect networks. Ensure WiFi is enabled.",
+                               **metrics)
+            scanned = "found" if report.scanned else "in the cached scan results"
+            lines.append(f"{len(report.networks)} networks {scanned}, strongest: "
+                         f"{', '.join(format_bss(bss) for bss in report.networks[:3])}.")
+
+        # 3. Grade the signal of the reference network when there is one, otherwise of the link
+        link = report.link
+        signal = link.signal_dbm if link else None
+        if WIFI_REFERENCE_SSID:
+            reference = next((bss for bss in report.networks if bss.ssid == WIFI_REFERENCE_SSID), None)
+            if reference is None:
+                return warning(f"Reference network {WIFI_REFERENCE_SSID} not found. {' '.join(lines)}", **metrics)
+            signal = reference.signal_dbm
+            lines.append(f"Reference network {WIFI_REFERENCE_SSID} at {signal:g} dBm ({grade(signal)}).")
+        if signal is not None:
+            metrics["signal"] = Metric(signal, "dBm")
+
+        if link:
+            name = link.ssid or link.bssid or "a network"
+            details = [f"{link.signal_dbm:g} dBm ({grade(link.signal_dbm)})" if link.signal_dbm is not None else None,
+                       f"{link.tx_bitrate_mbps:g} Mbit/s" if link.tx_bitrate_mbps else None]
+            if link.tx_packets:
+                retry_rate = link.tx_retries / link.tx_packets * 100
+                details.append(f"{retry_rate:.1f}% retries")
+                metrics["tx_retries"] = Metric(round(retry_rate, 2), "%")
+            if link.tx_bitrate_mbps:
+                metrics["tx_bitrate"] = Metric(link.tx_bitrate_mbps, "Mbit/s")
+            lines.append(f"Connected to {name}: {', '.join(detail for detail in details if detail)}.")
         else:
-            connection_status = "Connected to a WiFi network."
+            lines.append("Not connected to any WiFi network.")
 
-        # 4. Check the ability to communicate over the network with a simple ping
-        ping_google = subprocess.run(['ping', '-c', '1', '8.8.8.8'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if ping_google.returncode == 0:
-            internet_status = "Has internet connectivity."
-        else:
-            internet_status = "No internet connectivity."
+        # 4. Check the probe targets are reachable through wlan0 itself
+        online, details, probe_metrics = probe_connectivity('wlan0')
+        metrics.update(probe_metrics)
 
-        return f"WiFi interface (wlan0) is functional. {connection_status} {internet_status}"
+        message = f"WiFi interface (wlan0) is functional. {' '.join(lines)} {details}"
+        if signal is not None and signal < WIFI_MIN_SIGNAL:
+            return warning(f"Weak WiFi signal ({signal:g} dBm, below {WIFI_MIN_SIGNAL:g}). {message}", **metrics)
+        return passed(message, **metrics) if link and online else warning(message, **metrics)
 
     except Exception as e:
-        return f"Error checking WiFi status: {e}"
+        return failed(f"Error checking WiFi status: {e}")
+
 
 def wifi_availability():
     try:
-        output = subprocess.getoutput('iwconfig 2>&1 | grep "no wireless"')
-        return "Not available" if "no wireless" in output else "Available"
-    except Exception:
-        return "Error checking wifi."
+        # Wireless interfaces expose a phy80211 link (cfg80211 drivers) or a wireless directory (wext drivers)
+        wireless = [iface for iface in reader.net_interfaces()
+                    if reader.exists(f"/sys/class/net/{iface}/phy80211")
+                    or reader.exists(f"/sys/class/net/{iface}/wireless")]
+        if wireless:
+            return passed(f"Available ({', '.join(wireless)})", interfaces=Metric(len(wireless), "interfaces"))
+        return failed("Not available")
+    except Exception as e:
+        return failed(f"Error checking wifi: {e}")
 
 
 def bluetooth_availability():
+    from hci import open_backend, format_controller
     try:
-        output = subprocess.getoutput('hcitool dev')
-        return "Available" if "hci" in output else "Not available"
-    except Exception:
-        return "Error checking bluetooth."
+        with open_backend(BLUETOOTH_BACKEND, reader) as backend:
+            controllers = backend.controllers()
+    except OSError as e:
+        return failed(f"Error checking bluetooth: {e}")
+    if not controllers:
+        return failed("Not available")
+    message = "Available: " + "; ".join(format_controller(controller) for controller in controllers)
+    count = Metric(len(controllers), "controllers")
+    # up is None when only sysfs was readable, which can't tell
+    if any(controller.blocked or controller.up is False for controller in controllers):
+        return warning(message, controllers=count)
+    return passed(message, controllers=count)
 
 
 def usb_ports():
-    # This will check for USB devices. The presence of devices doesn't guarantee functionality.
-    try:
-        output = subprocess.getoutput('lsusb')
-        return output
-    except Exception:
-        return "Error checking USB ports."
-
-def usb_ports_test():
-    base_path = '/sys/bus/usb/devices'
-    usb_ports = [dir for dir in os.listdir(base_path) if dir.startswith("usb")]
-
-    if not usb_ports:
-        return "No USB ports found."
+    # Every device on every bus, from sysfs. The presence of devices doesn't guarantee functionality.
+    from usb_tree import root_hubs, list_devices, format_device, format_speed, PORT_MAPS
+    hubs = root_hubs(reader)
+    if not hubs:
+        return failed("No USB buses found.")
+    revision = board_info(reader).revision
+    port_map = PORT_MAPS.get(revision.type_id, {}) if revision else {}
+    devices = list_devices(reader, hubs)
+    lines = [f"Bus {bus}: {format_speed(speed)}, {ports} port{'' if ports == 1 else 's'}"
+             for bus, (speed, ports) in sorted(hubs.items())]
+    lines += [format_device(device, port_map) for device in devices]
+    power = sum(device.max_power or 0 for device in devices)
+    return passed("\n".join(lines), buses=Metric(len(hubs), "buses"), devices=Metric(len(devices), "devices"),
+                  power=Metric(power, "mA"))
 
-    usb_status = {}
 
-    for port in usb_ports:
-        port_path = os.path.join(base_path, port)
-        try:
-            # Check if there's a product file. This generally means a device is connected.
-            with open(os.path.join(port_path, 'product'), 'r') as f:
-                device_name = f.read().strip()
-            usb_status[port] = f"Device connected: {device_name}"
-        except FileNotFoundError:
-            usb_status[port] = "No device connected"
-
-    readable_output = "\n".join([f"Port {port}: {status}" for port, status in usb_status.items()])
-    return readable_output
+def usb_ports_test():
+    # Each device's negotiated speed against what it and its port support, plus a read benchmark of any USB stick
+    from usb_tree import root_hubs, list_devices, physical_port, fell_back, format_speed, PORT_MAPS
+    from storage_bench import run_read_benchmark
+    hubs = root_hubs(reader)
+    if not hubs:
+        return failed("No USB ports found.")
+    revision = board_info(reader).revision
+    port_map = PORT_MAPS.get(revision.type_id, {}) if revision else {}
+    devices = list_devices(reader, hubs)
+    lines, failures, warnings, metrics = [], [], [], {}
+    for device in devices:
+        if device.is_hub:
+            continue
+        port = physical_port(device, port_map)
+        label = f"{device.name} ({port[0]})" if port else device.name
+        line = f"{label}: {device.product or 'unnamed device'} at {format_speed(device.speed)}"
+        fallback = fell_back(device, port_map, hubs)
+        if fallback:
+            failures.append(f"{label} is a USB 3 port but {device.product or 'the device'} came up at "
+                            f"{format_speed(device.speed)}")
+        elif fallback is None:
+            warnings.append(f"{label}: USB 3 device at {format_speed(device.speed)}, possibly on a USB 2 port")
+        for disk in device.block_devices if USB_BENCH_MB > 0 else ():
+            try:
+                result = run_read_benchmark(reader.path(f"/dev/{disk}"), USB_BENCH_MB * 1024 * 1024,
+                                            USB_BENCH_SECONDS)
+            except OSError as e:
+                warnings.append(f"{label}: couldn't read /dev/{disk}: {e.strerror}")
+                continue
+            speed = result["seq_read_mb_s"]
+            line += f", {disk} reads {speed:.1f} MB/s"
+            metrics[f"{(port[0] if port else device.name).replace(' ', '_').lower()}_read"] = \
+                Metric(round(speed, 2), "MB/s")
+            if speed < USB_MIN_MB_S:
+                failures.append(f"{label}: {disk} read {speed:.1f} MB/s, below {USB_MIN_MB_S:g} MB/s")
+        lines.append(line)
+    if USB_ALL_PORTS:
+        used = {physical_port(device, port_map) for device in devices}
+        for empty in sorted({port[0] for port in port_map.values()} - {port[0] for port in used if port}):
+            failures.append(f"Nothing detected on {empty}")
+    metrics["devices"] = Metric(len(lines), "devices")
+    message = "\n".join(failures + warnings + (lines or ["No devices connected"]))
+    if failures:
+        return failed(message, **metrics)
+    if warnings:
+        return warning(message, **metrics)
+    return passed(message, **metrics)
 
 
 def gpio_pins():
     # This will inform about the GPIO pin count based on Raspberry Pi version.
-    version = raspberry_pi_version()
-
-    # Mapping based on GPIO pin count
-    pins_26 = {"Beta", "0002", "0003", "0004", "0005", "0006", "0007", "0008", "0009", "000d", "000e", "000f"}
-    pins_40 = {"a01040", "a01041", "a02082", "a020a0", "a020d3", "a21041", "a22042", "a22082", "a32082", "a52082",
-               "a02083", "b03111", "c03111", "c03112", "c03114", "c03130"}
+    header_pins = board_capabilities(reader).header_pins
 
-    if version['code'] in pins_26:
-        return (1, 26)
-    elif version['code'] in pins_40:
-        return (1, 40)
+    if header_pins:
+        return passed(f"1 GPIO header with {header_pins} pins.", headers=Metric(1, "headers"),
+                      pins=Metric(header_pins, "pins"))
+    elif header_pins == 0:
+        return passed("No GPIO header, the pins are on the module connector.", headers=Metric(0, "headers"))
     else:
-        return ("Unknown model", "Unknown pin count")
+        return warning("Unknown model, unknown pin count.")
 
 
-def get_gpio_testable_pins(version_code):
+def get_gpio_testable_pins(header_pins):
     """
-    Returns a list of GPIO pins (in BOARD numbering) that are safe to test for the given Raspberry Pi version.
+    Returns a list of GPIO pins (in BOARD numbering) that are safe to test on a header with the given number of pins.
     """
     # These are physical pin numbers in BOARD mode.
 
@@ -287,290 +539,502 @@ def get_gpio_testable_pins(version_code):
     # 40-pin layout, for newer models.
     layout_40_pin = [3, 5, 7, 8, 10, 11, 12, 13, 15, 16, 18, 19, 21, 22, 23, 24, 26, 27, 28, 29, 31, 32, 33, 35, 36, 37, 38, 40]
 
-    # Raspberry Pi versions with 26-pin GPIO
-    pi_26_pin_versions = {"a21041", "a22042"}
-
-    # Raspberry Pi versions with 40-pin GPIO (Adding some example codes, you might want to expand on this list)
-    pi_40_pin_versions = {"a01040", "a01041", "a02082", "a22082", "a32082", "a020d3"}
-
-    if version_code in pi_26_pin_versions:
+    if header_pins == 26:
         return layout_26_pin
-    elif version_code in pi_40_pin_versions:
+    elif header_pins == 40:
         return layout_40_pin
     else:
         return []
 
 
-
-
 def gpio_pins_test():
-    version = raspberry_pi_version()
-    testable_pins = get_gpio_testable_pins(version['code'])
+    testable_pins = get_gpio_testable_pins(board_capabilities(reader).header_pins)
 
     if not testable_pins:
-        return f"Model {version} not recognized. Cannot perform GPIO test."
-
-    GPIO.setmode(GPIO.BOARD)
-    GPIO.setwarnings(False)
+        return skipped(f"{board_version()['description']} has no known GPIO header layout. Cannot perform GPIO test.")
 
-    failed_pins = []
+    from gpio_jig import parse_jig, open_bank, run_jig_test, format_fault
+    pairs = [pair for pair in parse_jig(GPIO_JIG) if pair[0] in testable_pins and pair[1] in testable_pins]
+    if not pairs:
+        return skipped("None of the jig pairs in DIAG_GPIO_JIG are on this board's header.")
 
-    for pin in testable_pins:
-        try:
-            GPIO.setup(pin, GPIO.OUT)
-            GPIO.output(pin, GPIO.HIGH)
-            GPIO.setup(pin, GPIO.IN)
-            if not GPIO.input(pin):
-                failed_pins.append(pin)
-        except Exception as e:
-            failed_pins.append(pin)
-
-    GPIO.cleanup()
-
-    if not failed_pins:
-        return "All GPIO pins are functioning correctly."
+    revision = board_info(reader).revision
+    try:
+        with open_bank(GPIO_BACKEND, revision.processor if revision else None, pairs) as bank:
+            faults, seconds = run_jig_test(bank, pairs)
+    except OSError as e:
+        return failed(f"Can't access the GPIO pins: {e}")
+
+    failed_pins = sorted({pin for fault in faults for pair in fault.pairs for pin in pair})
+    metrics = {"tested": Metric(len(pairs) * 2, "pins"), "failed": Metric(len(failed_pins), "pins"),
+               "test_time": Metric(round(seconds * 1000, 2), "ms")}
+    if not faults:
+        return passed(f"All {len(pairs)} jig pairs pass walking ones and zeros in both directions.", **metrics)
     else:
-        return f"GPIO pins with potential issues: {', '.join(map(str, failed_pins))}"
+        return failed(f"GPIO jig faults: {'; '.join(format_fault(fault) for fault in faults)}", **metrics)
 
 
 def camera_port_test():
+    # A small YUV frame captured straight into memory and checked for a dead, covered, noisy or blemished sensor
+    from camera import capture_frame, luma_plane, analyse_frame, CameraError, NoCameraError, DEFAULT_WIDTH, \
+        DEFAULT_HEIGHT, MIN_BRIGHTNESS, MIN_CONTRAST, MAX_NOISE, MAX_STUCK_FRACTION
+    start = time.perf_counter()
     try:
-        # Try capturing a test image
-        test_image_path = "/tmp/test_image.jpg"
-        capture_process = subprocess.run(['raspistill', '-o', test_image_path, '-t', '1'], stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE, timeout=10)
-
-        # If the capture succeeds, the camera is working.
-        if capture_process.returncode == 0 and os.path.exists(test_image_path):
-            image_size = os.path.getsize(test_image_path)
-            os.remove(test_image_path)  # Clean up the test image
-            return f"Camera is functioning correctly. Test image size: {image_size} bytes."
-
-        # If capturing fails, check the error to determine the reason.
-        elif "not detected" in capture_process.stderr.decode("utf-8"):
-            return "No camera detected on the camera port."
-
-        else:
-            return f"Camera capture failed with error: {capture_process.stderr.decode('utf-8')}"
-
-    except subprocess.TimeoutExpired:
-        return "Camera capture timed out. Check if the camera module is functioning correctly."
-
-    except Exception as e:
-        return f"Error during camera test: {e}"
+        data, source = capture_frame(CAMERA_SOURCE, DEFAULT_WIDTH, DEFAULT_HEIGHT)
+        capture_seconds = time.perf_counter() - start
+        stats = analyse_frame(luma_plane(data, DEFAULT_WIDTH, DEFAULT_HEIGHT))
+    except NoCameraError:
+        return failed("No camera detected on the camera port.")
+    except CameraError as e:
+        return failed(f"Camera capture failed: {e}")
+
+    stuck = stats.hot_pixels + stats.dead_pixels
+    metrics = {"brightness": Metric(round(stats.brightness, 1), ""), "contrast": Metric(round(stats.contrast, 1), ""),
+               "noise": Metric(round(stats.noise, 2), ""), "hot_pixels": Metric(stats.hot_pixels, "pixels"),
+               "dead_pixels": Metric(stats.dead_pixels, "pixels"),
+               "capture_time": Metric(round(capture_seconds * 1000, 1), "ms"),
+               "analysis_time": Metric(round(stats.seconds * 1000, 2), "ms")}
+    details = (f"{stats.width}x{stats.height} frame from {source}: brightness {stats.brightness:.0f}, "
+               f"contrast {stats.contrast:.1f}, noise {stats.noise:.1f}, {stats.hot_pixels} hot and "
+               f"{stats.dead_pixels} dead pixels.")
+    if stats.brightness < MIN_BRIGHTNESS:
+        return failed(f"The camera returns a black frame; check the lens cover and ribbon cable. {details}", **metrics)
+    if stats.noise > MAX_NOISE:
+        return failed(f"The camera returns noise rather than an image. {details}", **metrics)
+    if stats.contrast < MIN_CONTRAST:
+        return failed(f"The camera returns a blank frame. {details}", **metrics)
+    if stuck > MAX_STUCK_FRACTION * stats.width * stats.height:
+        return warning(f"The camera works but has stuck pixels. {details}", **metrics)
+    return passed(f"Camera is functioning correctly. {details}", **metrics)
 
 
 def display_port_test():
     try:
-        # Check if DSI display is connected using DRM
-        if not is_dsi_display_connected():
-            return "No display detected on the DSI port. If you're using a non-official screen, manual inspection is recommended."
-
-        # Display a test pattern using pygame with feedback
-        import pygame
-        pygame.init()
-        screen = pygame.display.set_mode((800, 480))
-        screen.fill((255, 0, 0))
-        font = pygame.font.Font(None, 36)
-        text_surface = font.render("If you see this, press any key.", True, (255, 255, 255))
-        screen.blit(text_surface, (100, 240))
-        pygame.display.flip()
-
-        waiting_for_input = True
-        while waiting_for_input:
-            for event in pygame.event.get():
-                if event.type == pygame.KEYDOWN:
-                    waiting_for_input = False
-
-        pygame.quit()
-        return "A display appears to be connected to the DSI port."
-
+        connectors = [connector for connector in list_connectors(reader) if connector.kind == "DSI"]
+        connected = [connector for connector in connectors if connector.status == "connected"]
+        if not connected:
+            return warning("No display detected on the DSI port. If you're using a non-official screen, manual "
+                           "inspection is recommended.",
+                           connectors=Metric(len(connectors), "connectors"))
+
+        # Official DSI panels have no EDID, so only a bad one counts against them
+        return display_result("DSI", connectors, connected, (255, 0, 0), require_edid=False)
+
+    except MissingDependency:
+        raise
     except Exception as e:
-        return f"Error during display port test: {e}"
-
-
-def is_dsi_display_connected():
-    return os.path.exists('/sys/class/drm/card0-DSI-1/status') and \
-        open('/sys/class/drm/card0-DSI-1/status').read().strip() == 'connected'
+        return failed(f"Error during display port test: {e}")
 
 
 def hdmi_port_test():
     try:
-        # Check if HDMI display is connected using DRM
-        if not is_hdmi_display_connected():
-            return "HDMI port is not active or no monitor is detected."
-
-        # Display a test pattern using pygame with feedback on HDMI
-        import pygame
-        pygame.init()
+        connectors = [connector for connector in list_connectors(reader) if connector.kind.startswith("HDMI")]
+        if not connectors:
+            return warning("No HDMI connectors found in /sys/class/drm. "
+                           "Is the KMS display driver (vc4-kms-v3d) enabled?")
+        connected = [connector for connector in connectors if connector.status == "connected"]
+        if not connected:
+            return warning("HDMI port is not active or no monitor is detected.",
+                           connectors=Metric(len(connectors), "connectors"))
+
+        return display_result("HDMI", connectors, connected, (0, 255, 0), require_edid=True)
+
+    except MissingDependency:
+        raise
+    except Exception as e:
+        return failed(f"Error during HDMI port test: {e}")
+
+
+def display_result(label, connectors, connected, colour, require_edid):
+    """Grade the connected displays of one kind from their DRM state and EDID, then optionally ask the operator."""
+    details = "; ".join(describe_connector(connector) for connector in connectors)
+    metrics = {"connected": Metric(len(connected), "displays"), "connectors": Metric(len(connectors), "connectors")}
+    mode = connected[0].mode or (connected[0].edid.preferred_mode if connected[0].edid else None)
+    if mode:
+        metrics["width"] = Metric(mode[0], "px")
+        metrics["height"] = Metric(mode[1], "px")
+
+    # A missing or corrupt EDID on a connected monitor points at the cable or the DDC lines of the port
+    bad_edid = [connector.name for connector in connected
+                if (connector.edid and not connector.edid.checksum_ok) or (require_edid and not connector.edid)]
+    if bad_edid:
+        return warning(f"{label} display connected but its EDID is missing or corrupt on {', '.join(bad_edid)}. "
+                       f"{details}", **metrics)
+
+    if DISPLAY_INTERACTIVE:
+        if not show_test_pattern(colour, f"If you see this on {label}, press any key.", DISPLAY_TIMEOUT):
+            return warning(f"{label} display connected but no key was pressed within {DISPLAY_TIMEOUT:g}s of showing "
+                           f"the test pattern. {details}", **metrics)
+        return passed(f"{label} display connected and the operator confirmed the test pattern. {details}", **metrics)
+    return passed(f"{label} display connected. {details}", **metrics)
+
+
+def show_test_pattern(colour, text, timeout):
+    """
+    Fill the screen with a colour and wait for a key press, sleeping in the event queue rather than polling it.
+    Returns True if a key was pressed within `timeout` seconds.
+    """
+    pygame = require("pygame")
+    pygame.init()
+    try:
         info = pygame.display.Info()  # Get current screen resolution
-        screen = pygame.display.set_mode((info.current_w, info.current_h),
-                                         pygame.FULLSCREEN)  # Use current resolution in fullscreen
-        screen.fill((0, 255, 0))  # Fill screen with green color
+        screen = pygame.display.set_mode((info.current_w, info.current_h), pygame.FULLSCREEN)
+        screen.fill(colour)
         font = pygame.font.Font(None, 36)
-        text_surface = font.render("If you see this on HDMI, press any key.", True, (255, 255, 255))
+        text_surface = font.render(text, True, (255, 255, 255))
         screen.blit(text_surface, (info.current_w // 4, info.current_h // 2))
         pygame.display.flip()
 
-        waiting_for_input = True
-        while waiting_for_input:
-            for event in pygame.event.get():
-                if event.type == pygame.KEYDOWN:
-                    waiting_for_input = False
-
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if pygame.event.wait(int(remaining * 1000) + 1).type == pygame.KEYDOWN:
+                return True
+    finally:
         pygame.quit()
 
-        return f"A display appears to be connected to the HDMI port. A green test pattern was displayed on a screen with resolution {info.current_w}x{info.current_h}."
-
-    except Exception as e:
-        return f"Error during HDMI port test: {e}"
-
-
-def is_hdmi_display_connected():
-    # Usually, Raspberry Pi's HDMI outputs are labeled HDMI-A-1 and HDMI-A-2
-    for hdmi_output in ['HDMI-A-1', 'HDMI-A-2']:
-        if os.path.exists(f'/sys/class/drm/card0-{hdmi_output}/status') and \
-                open(f'/sys/class/drm/card0-{hdmi_output}/status').read().strip() == 'connected':
-            return True
-    return False
-
 
 def audio_jack_test():
+    # Plays generated tones and records them at the same time, then checks each tone in the captured spectrum
+    from audio_loopback import loopback, analyse_capture, AudioError
+    if AUDIO_BACKEND == "alsa" and not AUDIO_CAPTURE:
+        return skipped("No capture device to loop the audio jack into; set DIAG_AUDIO_CAPTURE.")
     try:
-        # Check the current audio output using amixer
-        amixer_output = subprocess.getoutput('amixer cget numid=3')
-        if "values=1" not in amixer_output:
-            # Switch to audio jack output
-            subprocess.run(['amixer', 'cset', 'numid=3', '1'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Play a test sound (assuming a .wav file named 'test_sound.wav' is present in the current directory)
-        subprocess.run(['aplay', 'test_sound.wav'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Provide results and instructions
-        results = [
-            "Attempted to play a test sound through the audio jack.",
-            "Please confirm if the sound played correctly from connected speakers or headphones."
-        ]
-
-        return "\n".join(results)
+        data, channels = loopback(AUDIO_BACKEND, AUDIO_PLAYBACK, AUDIO_CAPTURE, AUDIO_CAPTURE_CHANNELS)
+        captured = analyse_capture(data, channels)
+    except (AudioError, OSError) as e:
+        return failed(f"Audio loopback failed: {e}")
+    lines, problems, metrics = [], [], {}
+    for channel, stats in enumerate(captured):
+        name = ("left", "right")[channel] if channels == 2 else f"channel {channel + 1}"
+        prefix = f"{name.replace(' ', '')}_" if channels > 1 else ""
+        tones = ", ".join(f"{tone} Hz {snr:.0f} dB" for tone, snr in stats.snr.items())
+        lines.append(f"{name.capitalize()}: {stats.level:.1f} dBFS, SNR {tones}, "
+                     f"{stats.dropouts} dropout{'' if stats.dropouts == 1 else 's'}")
+        weak = [f"{tone} Hz" for tone, snr in stats.snr.items() if snr < AUDIO_MIN_SNR]
+        if weak:
+            problems.append(f"{name.capitalize()}: {', '.join(weak)} below {AUDIO_MIN_SNR:g} dB SNR")
+        if stats.dropouts:
+            problems.append(f"{name.capitalize()}: {stats.dropouts} dropout{'' if stats.dropouts == 1 else 's'}")
+        metrics[f"{prefix}level"] = Metric(stats.level, "dBFS")
+        metrics[f"{prefix}dropouts"] = Metric(stats.dropouts, "dropouts")
+        for tone, snr in stats.snr.items():
+            metrics[f"{prefix}snr_{tone}hz"] = Metric(snr, "dB")
+    message = "\n".join(problems + lines)
+    return failed(message, **metrics) if problems else passed(message, **metrics)
 
-    except subprocess.CalledProcessError as e:
-        return f"Error during audio jack test: {e.output.decode('utf-8')}"
-
-    except Exception as e:
-        return f"Error during audio jack test: {e}"
 
 def get_cpu_temperature():
     """Return CPU temperature."""
-    with open("/sys/class/thermal/thermal_zone0/temp", "r") as temp_file:
-        # Read the temperature and convert it from millidegrees to degrees Celsius.
-        temp_c = int(temp_file.read()) / 1000.0
-    return f"CPU Temperature: {temp_c}°C"
+    # Read the temperature and convert it from millidegrees to degrees Celsius.
+    millidegrees = reader.read_int("/sys/class/thermal/thermal_zone0/temp")
+    if millidegrees is None:
+        return failed("CPU temperature not available")
+    temp_c = millidegrees / 1000.0
+    message = f"CPU Temperature: {temp_c}°C"
+    if temp_c >= DEFAULT_THRESHOLDS["temp_c"]:
+        return warning(f"{message} (at or above the throttle point)", temperature=Metric(temp_c, "°C"))
+    return passed(message, temperature=Metric(temp_c, "°C"))
 
 
 def get_cpu_voltage():
-    try:
-        with open("/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_voltage", "r") as f:
-            cpu_voltage = f.readline().strip()
-            return f"CPU Voltage: {cpu_voltage} V"
-    except FileNotFoundError:
-        return "Cannot retrieve CPU voltage. File not found."
-    except Exception as e:
-        return f"Error retrieving CPU voltage: {e}"
+    """Return the core voltage in volts, or None if the kernel doesn't expose it."""
+    cpu_voltage = reader.read_value("/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_voltage")
+    return None if cpu_voltage is None else float(cpu_voltage)
+
 
 def get_voltages():
     cpu_voltage = get_cpu_voltage()
-    # We can't get exact values for other voltages without vcgencmd
-    # Placeholders:
-    sdram_c_voltage = "Unavailable"
-    sdram_i_voltage = "Unavailable"
-    sdram_p_voltage = "Unavailable"
-    return f"Core Voltage (CPU): {cpu_voltage}\nSDRAM_C Voltage: {sdram_c_voltage}\nSDRAM_I Voltage: {sdram_i_voltage}\nSDRAM_P Voltage: {sdram_p_voltage}"
+    # We can't get the SDRAM voltages without vcgencmd
+    if cpu_voltage is None:
+        return skipped("Cannot retrieve CPU voltage. File not found. SDRAM voltages are unavailable without vcgencmd.")
+    return passed(f"Core Voltage (CPU): {cpu_voltage} V. SDRAM voltages are unavailable without vcgencmd.",
+                  core=Metric(cpu_voltage, "V"))
+
 
 def get_cpu_utilization():
-    utilization = psutil.cpu_percent()
-    return f"CPU Utilization: {utilization}%"
+    psutil = require("psutil")
+    # Without an interval psutil compares against its previous call, which on the first call means nothing
+    utilization = psutil.cpu_percent(interval=0.5)
+    return passed(f"CPU Utilization: {utilization}%", utilization=Metric(utilization, "%"))
+
+
+def burn_in_test():
+    psutil = require("psutil")
+    from stress import run_burn_in
+    memory_bytes = int(psutil.virtual_memory().available * BURN_IN_MEMORY_FRACTION)
+    result = run_burn_in(reader, BURN_IN_SECONDS, memory_bytes)
+
+    per_core = ", ".join(f"{ops:.0f}" for ops in result["ops_per_second"])
+    lines = [
+        f"Per-core ops/s: {per_core}",
+        f"Memory bandwidth: {result['memory_gb_per_second']:.2f} GB/s over {memory_bytes / (1024 ** 2):.0f} MB",
+    ]
+    metrics = {f"core{core}": Metric(round(ops), "ops/s") for core, ops in enumerate(result["ops_per_second"])}
+    metrics["memory_bandwidth"] = Metric(round(result["memory_gb_per_second"], 3), "GB/s")
+    metrics["compute_errors"] = Metric(result["compute_errors"], "errors")
+    metrics["memory_mismatches"] = Metric(result["memory_mismatches"], "chunks")
+    if result["min_freq_mhz"] is not None:
+        metrics["min_freq"] = Metric(result["min_freq_mhz"], "MHz")
+    if result["max_temp_c"] is not None:
+        metrics["max_temperature"] = Metric(result["max_temp_c"], "°C")
+        metrics["temperature_p95"] = Metric(result["temp_p95_c"], "°C")
+
+    errors = []
+    if result["compute_errors"]:
+        errors.append(f"{result['compute_errors']} compute errors")
+    if result["memory_mismatches"]:
+        errors.append(f"{result['memory_mismatches']} memory pattern mismatches")
+    throttling = []
+    if result["freq_dropped"]:
+        throttling.append(f"ARM clock dropped to {result['min_freq_mhz']:.0f} MHz "
+                          f"(max {result['max_freq_mhz']:.0f} MHz)")
+    if result["over_temp"]:
+        throttling.append(f"temperature reached {result['max_temp_c']:.1f}°C")
+    if result["firmware_throttled"]:
+        throttling.append("firmware reported under-voltage or throttling")
+
+    if errors or throttling:
+        lines.append(f"Problems: {'; '.join(errors + throttling)}")
+    else:
+        lines.append("No throttling or errors detected.")
+    status = failed if errors else warning if throttling else passed
+    return status("\n".join(lines), **metrics)
+
 
 def get_gpu_memory():
-    try:
-        with open("/boot/config.txt", "r") as file:
-            for line in file.readlines():
-                if line.startswith("gpu_mem="):
-                    memory = line.split("=")[1].strip()
-                    return f"GPU Memory: {memory}M"
-        return "GPU Memory info not found in /boot/config.txt."
-    except FileNotFoundError:
-        return "Cannot retrieve GPU memory. /boot/config.txt not found."
-    except Exception as e:
-        return f"Error retrieving GPU memory: {e}"
+    config = reader.read_text("/boot/config.txt")
+    if config is None:
+        return skipped("Cannot retrieve GPU memory. /boot/config.txt not found.")
+    for line in config.splitlines():
+        if line.startswith("gpu_mem="):
+            memory = line.split("=")[1].strip()
+            return passed(f"GPU Memory: {memory}M", gpu_memory=Metric(int(memory), "MB"))
+    return passed("GPU Memory info not found in /boot/config.txt, the firmware default applies.")
 
 
 def get_clock_frequencies():
     try:
-        with open("/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq", "r") as f:
-            arm_freq_khz = int(f.readline().strip())  # Read the frequency in KHz
-            arm_freq_mhz = arm_freq_khz / 1000  # Convert to MHz
+        # Read the frequency in KHz
+        arm_freq_khz = reader.read_int("/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq")
+        if arm_freq_khz is None:
+            return failed("Error: CPU frequency path not found.")
+        arm_freq_mhz = arm_freq_khz / 1000  # Convert to MHz
 
         # Since the GPU and Core frequencies aren't exposed through sysfs by default,
         # we'll indicate that in the output.
-        return f"ARM Clock Frequency: {arm_freq_mhz} MHz\nGPU Clock Frequency: Not Available\nCore Clock Frequency: Not Available"
+        return passed(f"ARM Clock Frequency: {arm_freq_mhz} MHz\nGPU Clock Frequency: Not Available\n"
+                      "Core Clock Frequency: Not Available",
+                      arm=Metric(arm_freq_mhz, "MHz"))
 
-    except FileNotFoundError:
-        return "Error: CPU frequency path not found."
     except Exception as e:
-        return f"Error retrieving clock frequencies: {e}"
+        return failed(f"Error retrieving clock frequencies: {e}")
 
 
 def get_disk_io():
+    psutil = require("psutil")
     io_counters = psutil.disk_io_counters(perdisk=False)
-    return f"Disk Read Count: {io_counters.read_count}\nDisk Write Count: {io_counters.write_count}\nBytes Read: {io_counters.read_bytes}\nBytes Written: {io_counters.write_bytes}"
+    return passed(f"Disk Read Count: {io_counters.read_count}\nDisk Write Count: {io_counters.write_count}\n"
+                  f"Bytes Read: {io_counters.read_bytes}\nBytes Written: {io_counters.write_bytes}",
+                  read_count=Metric(io_counters.read_count, "ops"), write_count=Metric(io_counters.write_count, "ops"),
+                  read_bytes=Metric(io_counters.read_bytes, "B"), write_bytes=Metric(io_counters.write_bytes, "B"))
+
 
 def get_hardware_codecs():
-    # Map of codec names to their potential corresponding kernel modules.
-    # Note: This mapping might not be perfect and may need adjustments based on Raspberry Pi model and OS version.
-    codecs_map = {
-        'MPG2': 'mpeg2_v4l2_m2m',
-        'WVC1': None,  # As of my last update, there's no direct kernel module for WVC1
-        'VP8': 'vp8_v4l2_m2m',
-        'VP9': 'vp9_v4l2_m2m',
-        'H264': 'h264_v4l2_m2m',
-        'MJPG': 'mjpeg_v4l2_m2m'
+    # Kernel modules that provide each codec through V4L2. HEVC moved from rpivid_hevc to rpi_hevc_dec in newer kernels.
+    codec_modules = {
+        'H264': ('bcm2835_codec',),
+        'MPG2': ('bcm2835_codec',),
+        'WVC1': ('bcm2835_codec',),
+        'MJPG': ('bcm2835_codec',),
+        'HEVC': ('rpi_hevc_dec', 'rpivid_hevc'),
     }
 
+    # Only the codecs this board's processor has are expected; unknown boards are checked for all of them
+    expected = board_capabilities(reader).codecs or tuple(codec_modules)
+    loaded_modules = reader.loaded_modules()
+
     results = []
-    for codec, module in codecs_map.items():
-        if module:
-            # Check if the module is loaded
-            module_status = subprocess.getoutput(f"lsmod | grep {module}")
-            if module_status:
-                results.append(f"{codec} codec is enabled.")
-            else:
-                results.append(f"{codec} codec is not enabled.")
+    missing = []
+    for codec in expected:
+        # Drivers built into the kernel don't show up in /proc/modules but still have a /sys/module entry
+        if any(module in loaded_modules or reader.exists(f"/sys/module/{module}") for module in codec_modules[codec]):
+            results.append(f"{codec} codec is enabled.")
         else:
-            results.append(f"{codec} codec status cannot be determined.")
+            results.append(f"{codec} codec is not enabled.")
+            missing.append(codec)
+
+    metrics = {"enabled": Metric(len(expected) - len(missing), "codecs"), "expected": Metric(len(expected), "codecs")}
+    if missing and board_capabilities(reader).codecs:
+        return warning('\n'.join(results), **metrics)
+    return passed('\n'.join(results), **metrics)
 
-    return '\n'.join(results)
 
 def get_irq_statistics():
-    with open("/proc/interrupts", "r") as f:
-        return '\n'.join(f.readlines()[:10])
+    lines = reader.read_lines("/proc/interrupts")
+    # Sum the per-CPU counts of every numbered interrupt line
+    cpus = len(lines[0].split()) if lines else 0
+    total = 0
+    for line in lines[1:]:
+        counts = line.split()[1:cpus + 1]
+        total += sum(int(count) for count in counts if count.isdigit())
+    return passed('\n'.join(lines[:10]), total=Metric(total, "interrupts"))
+
 
 def get_network_stats():
-    return subprocess.getoutput("netstat -i")
+    # Same layout as `netstat -i`, built from /proc/net/dev
+    lines = [f"{'Iface':<16}{'MTU':>6}{'RX-OK':>11}{'RX-ERR':>7}{'RX-DRP':>7}{'RX-OVR':>7}"
+             f"{'TX-OK':>11}{'TX-ERR':>7}{'TX-DRP':>7}{'TX-OVR':>7}"]
+    metrics = {}
+    for interface, c in reader.net_dev().items():
+        mtu = reader.interface_attr(interface, "mtu", "-")
+        lines.append(f"{interface:<16}{mtu:>6}{c['rx_packets']:>11}{c['rx_errs']:>7}{c['rx_drop']:>7}{c['rx_fifo']:>7}"
+                     f"{c['tx_packets']:>11}{c['tx_errs']:>7}{c['tx_drop']:>7}{c['tx_fifo']:>7}")
+        if interface != "lo":
+            metrics[f"{interface}_rx_errors"] = Metric(c["rx_errs"], "packets")
+            metrics[f"{interface}_tx_errors"] = Metric(c["tx_errs"], "packets")
+    message = '\n'.join(lines)
+    if any(metric.value for metric in metrics.values()):
+        return warning(message, **metrics)
+    return passed(message, **metrics)
+
 
 def get_bluetooth_info():
-    return subprocess.getoutput("hciconfig")
+    from hci import open_backend, format_controller, summarise_scan
+    with open_backend(BLUETOOTH_BACKEND, reader) as backend:
+        controllers = backend.controllers()
+        if not controllers:
+            return failed("No Bluetooth controllers listed.")
+        lines = [format_controller(controller) for controller in controllers]
+        controller = controllers[0]
+        if BLUETOOTH_SCAN_SECONDS <= 0 or not controller.up:
+            return passed("\n".join(lines))
+        try:
+            scan = summarise_scan(backend.le_scan(controller.dev_id, BLUETOOTH_SCAN_SECONDS), BLUETOOTH_SCAN_SECONDS)
+        except OSError as e:
+            lines.append(f"LE scan failed: {e}")
+            return warning("\n".join(lines))
+    metrics = {"devices": Metric(len(scan.devices), "devices")}
+    if not scan.devices:
+        lines.append(f"No LE advertisers heard in {scan.seconds:g}s")
+        return warning("\n".join(lines), **metrics)
+    lines.append(f"{len(scan.devices)} LE advertisers in {scan.seconds:g}s, "
+                 f"RSSI {scan.rssi_min} to {scan.rssi_max} dBm (mean {scan.rssi_mean:.0f})")
+    metrics.update(rssi_min=Metric(scan.rssi_min, "dBm"), rssi_max=Metric(scan.rssi_max, "dBm"),
+                   rssi_spread=Metric(scan.rssi_max - scan.rssi_min, "dB"))
+    return passed("\n".join(lines), **metrics)
+
 
 def get_storage_space():
-    return subprocess.getoutput("df -h")
+    # Same layout as `df -h`, skipping pseudo filesystems with no blocks and repeated mounts
+    lines = [f"{'Filesystem':<24}{'Size':>6}{'Used':>6}{'Avail':>6}{'Use%':>5} Mounted on"]
+    seen = set()
+    metrics = {}
+    for device, mount_point, fs_type in reader.mounts():
+        if mount_point in seen or (device.startswith("/") and device in seen):
+            continue
+        try:
+            total, used, free = reader.disk_usage(mount_point)
+        except OSError:
+            continue
+        if total == 0:
+            continue
+        seen.update((device, mount_point))
+        percent = f"{-(-used * 100 // (used + free))}%" if used + free else "-"
+        lines.append(f"{device:<24}{human_size(total):>6}{human_size(used):>6}{human_size(free):>6}{percent:>5} "
+                     f"{mount_point}")
+        if mount_point == "/":
+            metrics["root_size"] = Metric(total, "B")
+            metrics["root_available"] = Metric(free, "B")
+            metrics["root_usage"] = Metric(round(used * 100 / (used + free), 1) if used + free else 0, "%")
+    message = '\n'.join(lines)
+    if metrics.get("root_usage", Metric(0, "%")).value >= 90:
+        return warning(message, **metrics)
+    return passed(message, **metrics)
 
-def get_uptime():
-    with open("/proc/uptime", "r") as f:
-        uptime_seconds = float(f.read().split()[0])
-        uptime_str = str(datetime.timedelta(seconds=uptime_seconds))
-        return f"Uptime: {uptime_str}"
 
+def get_uptime():
+    uptime_seconds = float(reader.read_value("/proc/uptime").split()[0])
+    uptime_str = str(datetime.timedelta(seconds=uptime_seconds))
+    return passed(f"Uptime: {uptime_str}", uptime=Metric(uptime_seconds, "s"))
 
 
 if __name__ == "__main__":
-    test_results = master_test()
+    parser = argparse.ArgumentParser(description="Raspberry Pi hardware diagnostics")
+    parser.add_argument("--monitor", action="store_true",
+                        help="continuously sample temperature, clocks, utilization and voltage instead of running "
+                             "the tests")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to monitor for (default 60)")
+    parser.add_argument("--rate", type=float, default=10.0, help="monitor samples per second (default 10)")
+    parser.add_argument("--capacity", type=int, default=6000,
+                        help="samples kept in the monitor ring buffer (default 6000)")
+    parser.add_argument("--json", action="store_true",
+                        help="write one JSON line per test to stdout (progress goes to stderr)")
+    parser.add_argument("--events", action="store_true",
+                        help="write plan, start, result and done events to stdout as JSON lines "
+                             "(progress goes to stderr)")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="stop at the first failure of a critical test (DIAG_CRITICAL_TESTS)")
+    parser.add_argument("--output", metavar="FILE", help="also write one JSON line per test to FILE")
+    parser.add_argument("--db", nargs="?", const="", metavar="PATH",
+                        help="store the results in the SQLite results database "
+                             "(default results.db next to this script)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report how long each module takes to import and exit")
+    args = parser.parse_args()
+
+    def terminate(signum, frame):
+        # Commands and isolated tests run in sessions of their own, so they'd outlive a terminated run
+        kill_all()
+        sys.exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    if args.profile_startup:
+        from startup_profile import profile_startup
+        profile_startup()
+    elif args.monitor:
+        run_monitor(reader, args.duration, args.rate, args.capacity)
+    else:
+        if args.json or args.events:
+            log_stream = sys.stderr
+        output = open(args.output, "w") if args.output else None
+        tests = build_tests()
+
+        def emit_start(test):
+            if args.events:
+                print(to_event_line("start", test=test.name), flush=True)
+
+        # Each result is written as soon as its test finishes, so readers can follow the run
+        def emit_result(test, result):
+            if args.events:
+                print(to_event_line("result", result, critical=test.name in CRITICAL_TESTS), flush=True)
+            elif args.json:
+                write_json_lines([result], sys.stdout)
+            if output:
+                write_json_lines([result], output)
+
+        if args.events:
+            print(to_event_line("plan", tests=[test.name for test in tests]), flush=True)
+        started_at = time.time()
+        test_results = master_test(tests, emit_start, emit_result, args.fail_fast)
+        if output:
+            output.close()
+        if args.events:
+            stopped_by = next((name for name, result in test_results.items() if is_critical_failure(result)), None)
+            counts = {}
+            for result in test_results.values():
+                counts[result.status] = counts.get(result.status, 0) + 1
+            print(to_event_line("done", seconds=round(time.time() - started_at, 3), counts=counts,
+                                stopped_by=stopped_by if len(test_results) < len(tests) else None), flush=True)
+        if args.db is not None:
+            import results_db
+            args.db = args.db or results_db.DEFAULT_DB
+            info = board_info(reader)
+            connection = results_db.connect(args.db)
+            results_db.save_run(connection, info.serial, info.revision_code, board_version()["description"],
+                                test_results.values(), started_at)
+            connection.close()
+            log(f"Results stored in {args.db}")
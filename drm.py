@@ -0,0 +1,182 @@
+import array
+import fcntl
+import os
+import re
+import struct
+from collections import namedtuple
+
+# A display connector as the kernel's DRM subsystem sees it, from /sys/class/drm/cardN-<kind>-<index>
+#   kind:   connector type such as "HDMI-A", "DSI" or "Composite"
+#   status: "connected", "disconnected" or "unknown"
+#   modes:  modes the display offers, e.g. ["1920x1080", "1280x720"]
+#   edid:   parsed Edid, or None when there is none (official DSI panels don't have one)
+#   mode:   the mode currently being scanned out as (width, height, refresh Hz), or None when it isn't driven
+Connector = namedtuple("Connector", ["name", "card", "kind", "status", "enabled", "modes", "edid", "mode"])
+
+# Decoded EDID base block. preferred_mode is (width, height, refresh Hz) from the first detailed timing.
+Edid = namedtuple("Edid", ["manufacturer", "product_code", "serial", "year", "name", "preferred_mode", "checksum_ok"])
+
+EDID_HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+
+_CONNECTOR_NAME = re.compile(r"^card(\d+)-(.+)-(\d+)$")
+
+# DRM connector type ids (include/uapi/drm/drm_mode.h) -> the names used in sysfs
+CONNECTOR_TYPES = {
+    1: "VGA", 2: "DVI-I", 3: "DVI-D", 4: "DVI-A", 5: "Composite", 6: "SVIDEO", 7: "LVDS", 8: "Component",
+    9: "DIN", 10: "DP", 11: "HDMI-A", 12: "HDMI-B", 13: "TV", 14: "eDP", 15: "Virtual", 16: "DSI", 17: "DPI",
+    18: "Writeback", 19: "SPI", 20: "USB",
+}
+
+
+def parse_edid(data):
+    """Decode an EDID blob. Returns an Edid, or None if `data` isn't one."""
+    if len(data) < 128 or data[:8] != EDID_HEADER:
+        return None
+    # Every 128 byte block (the base block and any extensions) sums to 0 mod 256
+    checksum_ok = all(sum(data[i:i + 128]) % 256 == 0 for i in range(0, len(data) - len(data) % 128, 128))
+
+    # Three 5 bit letters, 1 = "A"
+    vendor = struct.unpack(">H", data[8:10])[0]
+    manufacturer = "".join(chr(((vendor >> shift) & 0x1f) + 64) for shift in (10, 5, 0))
+    product_code, serial = struct.unpack("<HI", data[10:16])
+    year = data[17] + 1990
+
+    name = None
+    preferred_mode = None
+    for offset in (54, 72, 90, 108):
+        descriptor = data[offset:offset + 18]
+        pixel_clock = struct.unpack("<H", descriptor[:2])[0]
+        if pixel_clock:
+            if preferred_mode is None:
+                width = descriptor[2] | ((descriptor[4] & 0xf0) << 4)
+                h_blank = descriptor[3] | ((descriptor[4] & 0x0f) << 8)
+                height = descriptor[5] | ((descriptor[7] & 0xf0) << 4)
+                v_blank = descriptor[6] | ((descriptor[7] & 0x0f) << 8)
+                refresh = pixel_clock * 10000 / ((width + h_blank) * (height + v_blank))
+                preferred_mode = (width, height, round(refresh, 2))
+        elif descriptor[3] == 0xfc:
+            name = descriptor[5:18].split(b"\n")[0].decode("ascii", "replace").strip()
+    return Edid(manufacturer, product_code, serial, year, name, preferred_mode, checksum_ok)
+
+
+def _ioc(number, size):
+    # _IOWR('d', number, size)
+    return (3 << 30) | (size << 16) | (ord("d") << 8) | number
+
+
+CARD_RES = struct.Struct("4Q8I")
+GET_CONNECTOR = struct.Struct("4Q12I")
+GET_ENCODER = struct.Struct("5I")
+MODE_INFO = struct.Struct("I10H3I32s")
+GET_CRTC = struct.Struct("QIIIIIII")
+DRM_IOCTL_MODE_GETRESOURCES = _ioc(0xA0, CARD_RES.size)
+DRM_IOCTL_MODE_GETCRTC = _ioc(0xA1, GET_CRTC.size + MODE_INFO.size)
+DRM_IOCTL_MODE_GETENCODER = _ioc(0xA6, GET_ENCODER.size)
+DRM_IOCTL_MODE_GETCONNECTOR = _ioc(0xA7, GET_CONNECTOR.size)
+
+
+def _address(buffer):
+    return buffer.buffer_info()[0] if len(buffer) else 0
+
+
+def current_modes(device):
+    """
+    Ask a DRM device (e.g. /dev/dri/card1) which mode each connector is being driven with, without becoming DRM
+    master. Returns {(kind, index): (width, height, refresh Hz)} for the connectors with an active CRTC.
+    """
+    fd = os.open(device, os.O_RDWR | os.O_CLOEXEC)
+    try:
+        # The first call returns the counts, the second fills in the ids
+        request = bytearray(CARD_RES.size)
+        fcntl.ioctl(fd, DRM_IOCTL_MODE_GETRESOURCES, request)
+        counts = CARD_RES.unpack(request)[4:8]
+        crtcs, connectors, encoders = (array.array("I", [0] * count) for count in counts[1:])
+        request = bytearray(CARD_RES.pack(0, _address(crtcs), _address(connectors), _address(encoders),
+                                          0, *counts[1:], 0, 0, 0, 0))
+        fcntl.ioctl(fd, DRM_IOCTL_MODE_GETRESOURCES, request)
+
+        modes = {}
+        for connector_id in connectors:
+            # Room for one mode, so the kernel reports the connector without probing it again
+            mode_array = array.array("B", bytes(MODE_INFO.size))
+            request = bytearray(GET_CONNECTOR.pack(0, _address(mode_array), 0, 0, 1, 0, 0, 0, connector_id,
+                                                   0, 0, 0, 0, 0, 0, 0))
+            fcntl.ioctl(fd, DRM_IOCTL_MODE_GETCONNECTOR, request)
+            fields = GET_CONNECTOR.unpack(request)
+            encoder_id, connector_type, type_index = fields[7], fields[9], fields[10]
+            if not encoder_id:
+                continue
+            request = bytearray(GET_ENCODER.pack(encoder_id, 0, 0, 0, 0))
+            fcntl.ioctl(fd, DRM_IOCTL_MODE_GETENCODER, request)
+            crtc_id = GET_ENCODER.unpack(request)[2]
+            if not crtc_id:
+                continue
+            request = bytearray(GET_CRTC.pack(0, 0, crtc_id, 0, 0, 0, 0, 0) + bytes(MODE_INFO.size))
+            fcntl.ioctl(fd, DRM_IOCTL_MODE_GETCRTC, request)
+            mode_valid = GET_CRTC.unpack_from(request)[7]
+            mode = MODE_INFO.unpack_from(request, GET_CRTC.size)
+            if mode_valid:
+                clock, width, htotal, height, vtotal = mode[0], mode[1], mode[4], mode[6], mode[9]
+                refresh = round(clock * 1000 / (htotal * vtotal), 2) if htotal and vtotal else mode[11]
+                modes[(CONNECTOR_TYPES.get(connector_type, "Unknown"), type_index)] = (width, height, refresh)
+        return modes
+    finally:
+        os.close(fd)
+
+
+def list_connectors(reader, with_modes=True):
+    """Every display connector of every DRM card, except writeback connectors. Returns a list of Connectors."""
+    connectors = []
+    card_modes = {}
+    for name in reader.list_dir("/sys/class/drm"):
+        match = _CONNECTOR_NAME.match(name)
+        if not match or match.group(2) == "Writeback":
+            continue
+        card, kind, index = int(match.group(1)), match.group(2), int(match.group(3))
+        base = f"/sys/class/drm/{name}"
+        if with_modes and card not in card_modes:
+            try:
+                card_modes[card] = current_modes(reader.path(f"/dev/dri/card{card}"))
+            except OSError:
+                # No access to the device node, or a driver without modesetting
+                card_modes[card] = {}
+        try:
+            with open(reader.path(f"{base}/edid"), "rb") as f:
+                edid = parse_edid(f.read())
+        except OSError:
+            edid = None
+        connectors.append(Connector(
+            name=f"{kind}-{index}",
+            card=card,
+            kind=kind,
+            status=reader.read_value(f"{base}/status", "unknown"),
+            enabled=reader.read_value(f"{base}/enabled") == "enabled",
+            modes=reader.read_lines(f"{base}/modes"),
+            edid=edid,
+            mode=card_modes.get(card, {}).get((kind, index)),
+        ))
+    return connectors
+
+
+def format_mode(mode):
+    width, height, refresh = mode
+    return f"{width}x{height}@{refresh:g}Hz"
+
+
+def describe_connector(connector):
+    """e.g. "HDMI-A-1: DEL DELL U2415 (2019), preferred 1920x1200@59.95Hz, showing 1920x1200@60Hz"."""
+    parts = []
+    if connector.edid:
+        edid = connector.edid
+        parts.append(f"{edid.manufacturer} {edid.name or hex(edid.product_code)} ({edid.year})")
+        if edid.preferred_mode:
+            parts.append(f"preferred {format_mode(edid.preferred_mode)}")
+        if not edid.checksum_ok:
+            parts.append("EDID checksum mismatch")
+    elif connector.status == "connected":
+        parts.append("no EDID")
+    if connector.mode:
+        parts.append(f"showing {format_mode(connector.mode)}")
+    elif connector.status == "connected":
+        parts.append(f"{len(connector.modes)} modes")
+    return f"{connector.name}: {', '.join(parts) or connector.status}"
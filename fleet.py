@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import signal
+import sys
+import time
+
+DEFAULT_COMMAND = "sudo python3 ~/raspberry-pi-diagnostics/diagnostics.py --json"
+
+
+def read_inventory(path):
+    """
+    Read an inventory file: one host per line (anything ssh accepts, e.g. pi@10.0.0.12), optionally followed by a
+    label. Blank lines and lines starting with # are ignored. Returns a list of (host, label) tuples.
+    """
+    hosts = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            host, _, label = line.partition(" ")
+            hosts.append((host, label.strip() or host))
+    return hosts
+
+
+class SSHTransport:
+    """Runs the diagnostics command on a board over ssh, without ever prompting for a password."""
+
+    def __init__(self, command=DEFAULT_COMMAND, ssh_options=None):
+        self.command = command
+        self.ssh_options = ssh_options or ["-o", "BatchMode=yes", "-o", "ConnectTimeout=10",
+                                           "-o", "StrictHostKeyChecking=accept-new"]
+
+    def argv(self, host):
+        return ["ssh", *self.ssh_options, host, self.command]
+
+
+class LocalTransport:
+    """
+    Runs a local command in place of ssh, as a stand-in for testing the orchestrator without any boards.
+    The target host is passed in the DIAG_FLEET_HOST environment variable and substituted for {host} in the command.
+    """
+
+    def __init__(self, command):
+        self.command = command
+
+    def argv(self, host):
+        return ["sh", "-c", self.command.replace("{host}", shlex.quote(host))]
+
+
+async def _run_command(argv, timeout, env):
+    process = await asyncio.create_subprocess_exec(*argv, stdin=asyncio.subprocess.DEVNULL,
+                                                   stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                   env=env, start_new_session=True)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        # Kill the whole session so an ssh ProxyCommand or a local child shell doesn't outlive the attempt
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise
+    return process.returncode, stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace")
+
+
+def parse_output(stdout):
+    """Return the diagnostics output as JSON where possible (a document, or one record per line), else None."""
+    try:
+        document = json.loads(stdout)
+        # A single JSON line parses as a whole document too; it's still one record
+        return [document] if isinstance(document, dict) else document
+    except ValueError:
+        pass
+    records = []
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records or None
+
+
+async def run_host(host, label, transport, timeout, retries):
+    """Run diagnostics on one host, retrying failed attempts. Returns a report record for the host."""
+    env = dict(os.environ, DIAG_FLEET_HOST=host)
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            returncode, stdout, stderr = await _run_command(transport.argv(host), timeout, env)
+            status = "ok" if returncode == 0 else "error"
+            error = None if returncode == 0 else (stderr.strip().splitlines() or [f"exit code {returncode}"])[-1]
+        except asyncio.TimeoutError:
+            returncode, stdout, stderr = None, "", ""
+            status, error = "timeout", f"no result within {timeout:g}s"
+        except OSError as e:
+            returncode, stdout, stderr = None, "", ""
+            status, error = "error", str(e)
+
+        if status == "ok" or attempt > retries:
+            break
+        await asyncio.sleep(min(2 ** attempt, 30))
+
+    results = parse_output(stdout)
+    return {
+        "host": host,
+        "label": label,
+        "status": status,
+        "error": error,
+        "attempts": attempt,
+        "seconds": round(time.monotonic() - start, 3),
+        "returncode": returncode,
+        "results": results,
+        # Raw output is only kept when it couldn't be parsed, to keep the report compact
+        "output": stdout if results is None else None,
+    }
+
+
+async def run_fleet(hosts, transport, concurrency=32, timeout=600.0, retries=1, on_result=None):
+    """
+    Run diagnostics on every (host, label) at once, with at most `concurrency` running at a time.
+    `on_result` is called with each host's report record as soon as it finishes. Returns all records.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(host, label):
+        async with semaphore:
+            return await run_host(host, label, transport, timeout, retries)
+
+    records = []
+    for finished in asyncio.as_completed([limited(host, label) for host, label in hosts]):
+        record = await finished
+        records.append(record)
+        if on_result:
+            on_result(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Raspberry Pi diagnostics across a fleet of boards in parallel")
+    parser.add_argument("inventory", help="file listing one host per line")
+    parser.add_argument("--concurrency", type=int, default=32, help="boards tested at the same time (default 32)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds allowed per attempt (default 600)")
+    parser.add_argument("--retries", type=int, default=1, help="retries for a failed or timed out board (default 1)")
+    parser.add_argument("--report", default="fleet_report.jsonl", help="aggregated report, one JSON line per board")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh")
+    parser.add_argument("--command", default=None,
+                        help=f"command to run; for ssh it runs on the board (default: {DEFAULT_COMMAND}), for local "
+                             "it runs here with {host} replaced by the host name")
+    args = parser.parse_args()
+
+    hosts = read_inventory(args.inventory)
+    if args.transport == "ssh":
+        transport = SSHTransport(args.command or DEFAULT_COMMAND)
+    elif args.command:
+        transport = LocalTransport(args.command)
+    else:
+        parser.error("--transport local needs a --command")
+
+    counts = {}
+    start = time.monotonic()
+    with open(args.report, "w") as report:
+        def on_result(record):
+            report.write(json.dumps(record) + "\n")
+            report.flush()
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            print(f"[{sum(counts.values())}/{len(hosts)}] {record['label']}: {record['status']} "
+                  f"({record['seconds']:.1f}s){' - ' + record['error'] if record['error'] else ''}")
+
+        asyncio.run(run_fleet(hosts, transport, args.concurrency, args.timeout, args.retries, on_result))
+
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"Tested {len(hosts)} boards in {time.monotonic() - start:.1f}s: {summary}. Report written to {args.report}")
+    return 0 if counts.get("ok", 0) == len(hosts) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
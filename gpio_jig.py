@@ -0,0 +1,343 @@
+import fcntl
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+# Physical header pin -> BCM GPIO number. The first 26 pins are the same on the 26 pin header of later Model A/B
+# boards (the very first Model B revision swapped a few of them).
+BOARD_TO_BCM = {
+    3: 2, 5: 3, 7: 4, 8: 14, 10: 15, 11: 17, 12: 18, 13: 27, 15: 22, 16: 23, 18: 24, 19: 10, 21: 9, 22: 25,
+    23: 11, 24: 8, 26: 7, 27: 0, 28: 1, 29: 5, 31: 6, 32: 12, 33: 13, 35: 19, 36: 16, 37: 26, 38: 20, 40: 21,
+}
+
+# The pairs of physical pins the standard loopback jig wires together. Pins 3 and 5 are left out because the board's
+# I2C pull-up resistors hold them high.
+DEFAULT_JIG = "7-8,10-11,12-13,15-16,18-19,21-22,23-24,26-29,27-28,31-32,33-35,36-37,38-40"
+
+# Time for a level to settle after the drivers change
+SETTLE_SECONDS = 0.00002
+
+# One problem found by the jig test. `pairs` holds the jig pairs involved, as (pin, pin) tuples of header pins.
+#   stuck high / stuck low: the pair reads the same level whatever is driven
+#   open:                   the receiving pin only ever reads its pull resistor, so the wire or a pin is broken
+#   bridged:                a pin follows the driver of another pair, so two pairs are shorted together
+JigFault = namedtuple("JigFault", ["kind", "pairs"])
+
+
+def parse_jig(spec):
+    """Parse a jig map such as "7-8,10-11" into a list of (pin, pin) tuples of header pin numbers."""
+    pairs = []
+    for item in spec.split(","):
+        if item.strip():
+            a, b = item.split("-")
+            pairs.append((int(a), int(b)))
+    return pairs
+
+
+def _mask(gpios):
+    mask = 0
+    for gpio in gpios:
+        mask |= 1 << gpio
+    return mask
+
+
+class SimulatedBank:
+    """
+    A GPIO bank wired up like a jig, with optional faults, for testing without hardware.
+    `wires` are (gpio, gpio) pairs; `stuck` maps a gpio to the level it's stuck at; `open` gpios are disconnected from
+    their wire; `bridges` are extra (gpio, gpio) shorts. Shorted outputs driving different levels read low.
+    """
+
+    def __init__(self, wires, stuck=None, open=(), bridges=()):
+        self.stuck = dict(stuck or {})
+        self.outputs = []
+        self.inputs = []
+        self.pull = 0
+        self.driven = 0
+        self.reads = 0
+        # Group the pins into nets of everything electrically connected
+        self.net = {}
+        for a, b in list(wires) + list(bridges):
+            self.net.setdefault(a, {a})
+            self.net.setdefault(b, {b})
+        for a, b in list(wires) + list(bridges):
+            if (a, b) in bridges or (a not in open and b not in open):
+                merged = self.net[a] | self.net[b]
+                for gpio in merged:
+                    self.net[gpio] = merged
+
+    def configure(self, outputs, inputs, pull_up):
+        self.outputs, self.inputs = list(outputs), list(inputs)
+        self.pull = 1 if pull_up else 0
+
+    def write(self, mask):
+        self.driven = mask
+
+    def _level(self, gpio):
+        net = self.net.get(gpio, {gpio})
+        stuck = [self.stuck[pin] for pin in net if pin in self.stuck]
+        if stuck:
+            return min(stuck)
+        driven = [(self.driven >> pin) & 1 for pin in net if pin in self.outputs]
+        return min(driven) if driven else self.pull
+
+    def read(self):
+        self.reads += 1
+        return _mask(gpio for gpio in self.inputs if self._level(gpio))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GpiomemBank:
+    """
+    Bank 0 (GPIO 0-31) of the BCM2835/6/7 and BCM2711 through the registers mapped by /dev/gpiomem, so a whole
+    pattern is written with two register stores and read back with one load. The function selects and pulls in use
+    are put back on close.
+    """
+
+    # Register word offsets
+    GPFSEL0, GPSET0, GPCLR0, GPLEV0 = 0, 7, 10, 13
+    GPPUD, GPPUDCLK0 = 37, 38            # BCM2835/6/7
+    GPIO_PUP_PDN_CNTRL_REG0 = 57         # BCM2711
+
+    def __init__(self, bcm2711, path="/dev/gpiomem"):
+        self.bcm2711 = bcm2711
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self.map = mmap.mmap(fd, 4096)
+        finally:
+            os.close(fd)
+        self.regs = memoryview(self.map).cast("I")
+        self.saved = [self.regs[self.GPFSEL0 + i] for i in range(4)]
+        self.saved_pulls = [self.regs[self.GPIO_PUP_PDN_CNTRL_REG0 + i] for i in range(2)] if bcm2711 else None
+        self.outputs = 0
+        self.inputs = 0
+
+    def _select(self, gpios, function):
+        for gpio in gpios:
+            index, shift = self.GPFSEL0 + gpio // 10, (gpio % 10) * 3
+            self.regs[index] = (self.regs[index] & ~(7 << shift)) | (function << shift)
+
+    def _pull(self, gpios, pull_up):
+        if self.bcm2711:
+            # Two bits per pin: 1 pull-up, 2 pull-down
+            for gpio in gpios:
+                index, shift = self.GPIO_PUP_PDN_CNTRL_REG0 + gpio // 16, (gpio % 16) * 2
+                self.regs[index] = (self.regs[index] & ~(3 << shift)) | ((1 if pull_up else 2) << shift)
+        else:
+            # Set the control signal, then clock it into the chosen pins, waiting 150 cycles after each step
+            self.regs[self.GPPUD] = 2 if pull_up else 1
+            time.sleep(0.00001)
+            self.regs[self.GPPUDCLK0] = _mask(gpios)
+            time.sleep(0.00001)
+            self.regs[self.GPPUD] = 0
+            self.regs[self.GPPUDCLK0] = 0
+
+    def configure(self, outputs, inputs, pull_up):
+        self._select(inputs, 0)
+        self._pull(inputs, pull_up)
+        self.regs[self.GPCLR0] = _mask(outputs)
+        self._select(outputs, 1)
+        self.outputs, self.inputs = _mask(outputs), _mask(inputs)
+
+    def write(self, mask):
+        self.regs[self.GPSET0] = mask & self.outputs
+        self.regs[self.GPCLR0] = ~mask & self.outputs & 0xffffffff
+
+    def read(self):
+        return self.regs[self.GPLEV0] & self.inputs
+
+    def close(self):
+        for i, value in enumerate(self.saved):
+            self.regs[self.GPFSEL0 + i] = value
+        if self.saved_pulls:
+            for i, value in enumerate(self.saved_pulls):
+                self.regs[self.GPIO_PUP_PDN_CNTRL_REG0 + i] = value
+        self.regs.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _ioc(direction, number, size):
+    return (direction << 30) | (size << 16) | (0xB4 << 8) | number
+
+
+# GPIO character device ABI v1 (linux/gpio.h)
+CHIPINFO = struct.Struct("32s32sI")
+HANDLE_REQUEST = struct.Struct("64II64B32sIi")
+HANDLE_DATA = struct.Struct("64B")
+GPIO_GET_CHIPINFO_IOCTL = _ioc(2, 0x01, CHIPINFO.size)
+GPIO_GET_LINEHANDLE_IOCTL = _ioc(3, 0x03, HANDLE_REQUEST.size)
+GPIOHANDLE_GET_LINE_VALUES_IOCTL = _ioc(3, 0x08, HANDLE_DATA.size)
+GPIOHANDLE_SET_LINE_VALUES_IOCTL = _ioc(3, 0x09, HANDLE_DATA.size)
+GPIOHANDLE_REQUEST_INPUT, GPIOHANDLE_REQUEST_OUTPUT = 1 << 0, 1 << 1
+GPIOHANDLE_REQUEST_BIAS_PULL_UP, GPIOHANDLE_REQUEST_BIAS_PULL_DOWN = 1 << 5, 1 << 6
+
+# Labels of the gpiochips that drive the 40 pin header
+HEADER_CHIP_LABELS = (b"pinctrl-bcm2835", b"pinctrl-bcm2711", b"pinctrl-rp1")
+
+
+def find_header_chip(dev="/dev"):
+    """Return the path of the gpiochip that drives the header pins, or None."""
+    for name in sorted(os.listdir(dev)):
+        if not name.startswith("gpiochip"):
+            continue
+        path = os.path.join(dev, name)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            info = bytearray(CHIPINFO.size)
+            fcntl.ioctl(fd, GPIO_GET_CHIPINFO_IOCTL, info)
+            if CHIPINFO.unpack(info)[1].rstrip(b"\0") in HEADER_CHIP_LABELS:
+                return path
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return None
+
+
+class GpiochipBank:
+    """
+    GPIO lines requested through the kernel's gpiochip character device, which works on every model including the
+    Pi 5. All outputs are one line handle and all inputs another, so a pattern is one ioctl and a read-back is one more.
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR)
+        self.output_handle = self.input_handle = None
+        self.outputs = self.inputs = []
+
+    def _request(self, lines, flags):
+        request = bytearray(HANDLE_REQUEST.pack(*(list(lines) + [0] * (64 - len(lines))), flags, *([0] * 64),
+                                                b"diagnostics", len(lines), 0))
+        fcntl.ioctl(self.fd, GPIO_GET_LINEHANDLE_IOCTL, request)
+        return HANDLE_REQUEST.unpack(request)[-1]
+
+    def _release(self):
+        for handle in (self.output_handle, self.input_handle):
+            if handle is not None:
+                os.close(handle)
+        self.output_handle = self.input_handle = None
+
+    def configure(self, outputs, inputs, pull_up):
+        self._release()
+        self.outputs, self.inputs = list(outputs), list(inputs)
+        self.output_handle = self._request(self.outputs, GPIOHANDLE_REQUEST_OUTPUT)
+        pull = GPIOHANDLE_REQUEST_BIAS_PULL_UP if pull_up else GPIOHANDLE_REQUEST_BIAS_PULL_DOWN
+        self.input_handle = self._request(self.inputs, GPIOHANDLE_REQUEST_INPUT | pull)
+
+    def write(self, mask):
+        values = [(mask >> gpio) & 1 for gpio in self.outputs]
+        fcntl.ioctl(self.output_handle, GPIOHANDLE_SET_LINE_VALUES_IOCTL,
+                    bytearray(HANDLE_DATA.pack(*(values + [0] * (64 - len(values))))))
+
+    def read(self):
+        data = bytearray(HANDLE_DATA.size)
+        fcntl.ioctl(self.input_handle, GPIOHANDLE_GET_LINE_VALUES_IOCTL, data)
+        return _mask(gpio for gpio, value in zip(self.inputs, data) if value)
+
+    def close(self):
+        # Released lines go back to inputs
+        self._release()
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_bank(backend="auto", processor=None, pairs=()):
+    """
+    Open a GPIO bank: "gpiochip", "gpiomem", "simulated" (a fault-free jig wired as `pairs`), or "auto" for the
+    gpiochip driving the header, falling back to /dev/gpiomem on kernels without one.
+    """
+    if backend == "simulated":
+        return SimulatedBank([(BOARD_TO_BCM[a], BOARD_TO_BCM[b]) for a, b in pairs])
+    if backend in ("auto", "gpiochip"):
+        chip = find_header_chip()
+        if chip:
+            return GpiochipBank(chip)
+        if backend == "gpiochip":
+            raise OSError("No gpiochip drives the GPIO header.")
+    if processor not in ("BCM2835", "BCM2836", "BCM2837", "BCM2711"):
+        raise OSError(f"/dev/gpiomem access isn't supported on {processor or 'this processor'}.")
+    return GpiomemBank(processor == "BCM2711")
+
+
+def _walk(bank, drivers, receivers, pull_up):
+    """
+    Drive a walking one (or, with pull-ups, a walking zero) across `drivers` and read every receiver after each step.
+    Returns one read-back bitmask per step.
+    """
+    bank.configure(drivers, receivers, pull_up)
+    all_high = _mask(drivers)
+    readings = []
+    for driver in drivers:
+        bank.write(all_high & ~(1 << driver) if pull_up else 1 << driver)
+        time.sleep(SETTLE_SECONDS)
+        readings.append(bank.read())
+    return readings
+
+
+def _check(bank, drivers, receivers):
+    """Walk ones and zeros from `drivers` to `receivers`. Returns {(kind, i, j)} with indexes into the pair list."""
+    ones = _walk(bank, drivers, receivers, pull_up=False)
+    zeros = _walk(bank, drivers, receivers, pull_up=True)
+    found = set()
+    for j, receiver in enumerate(receivers):
+        ones_levels = [(reading >> receiver) & 1 for reading in ones]
+        zeros_levels = [(reading >> receiver) & 1 for reading in zeros]
+        levels = set(ones_levels + zeros_levels)
+        if levels == {1}:
+            found.add(("stuck high", j, j))
+            continue
+        if levels == {0}:
+            found.add(("stuck low", j, j))
+            continue
+        bridged = False
+        for i in range(len(drivers)):
+            if i != j and (ones_levels[i] or not zeros_levels[i]):
+                found.add(("bridged", min(i, j), max(i, j)))
+                bridged = True
+        if not bridged and (not ones_levels[j] or zeros_levels[j]):
+            found.add(("open", j, j))
+    return found
+
+
+def run_jig_test(bank, pairs):
+    """
+    Test a loopback jig of (pin, pin) header pin pairs in both directions with walking ones and walking zeros.
+    Returns (list of JigFault, seconds taken).
+    """
+    start = time.perf_counter()
+    side_a = [BOARD_TO_BCM[a] for a, _ in pairs]
+    side_b = [BOARD_TO_BCM[b] for _, b in pairs]
+    found = _check(bank, side_a, side_b) | _check(bank, side_b, side_a)
+    bank.write(0)
+    faults = [JigFault(kind, (pairs[i],) if i == j else (pairs[i], pairs[j]))
+              for kind, i, j in sorted(found, key=lambda fault: (fault[1], fault[2], fault[0]))]
+    return faults, time.perf_counter() - start
+
+
+def format_fault(fault):
+    pairs = " and ".join(f"{a}-{b}" for a, b in fault.pairs)
+    return f"pins {pairs} {fault.kind}"
@@ -0,0 +1,297 @@
+import fcntl
+import re
+import socket
+import struct
+import time
+from collections import namedtuple
+
+# Linux Bluetooth sockets (include/net/bluetooth/hci.h); not every Python build defines the names
+AF_BLUETOOTH = getattr(socket, "AF_BLUETOOTH", 31)
+BTPROTO_HCI = getattr(socket, "BTPROTO_HCI", 1)
+SOL_HCI = getattr(socket, "SOL_HCI", 0)
+HCI_FILTER = getattr(socket, "HCI_FILTER", 2)
+
+HCI_COMMAND_PKT = 0x01
+HCI_EVENT_PKT = 0x04
+EVT_CMD_COMPLETE = 0x0e
+EVT_CMD_STATUS = 0x0f
+EVT_LE_META = 0x3e
+LE_ADVERTISING_REPORT = 0x02
+
+# Command opcodes: (OGF << 10) | OCF
+READ_LOCAL_VERSION = 0x1001
+LE_SET_SCAN_PARAMETERS = 0x200b
+LE_SET_SCAN_ENABLE = 0x200c
+
+HCI_UP = 1 << 0
+MAX_DEVICES = 16
+
+
+def _ior(number):
+    # _IOR('H', number, int)
+    return (2 << 30) | (4 << 16) | (ord("H") << 8) | number
+
+
+HCIGETDEVLIST = _ior(210)
+HCIGETDEVINFO = _ior(211)
+
+# struct hci_dev_info: dev_id, name, bdaddr, flags, type, features, pkt_type, link_policy, link_mode, ACL/SCO MTUs
+# and packet counts, and 10 counters of struct hci_dev_stats
+DEV_INFO = struct.Struct("=H8s6sIB8s3xIIIHHHH10I")
+
+# HCI/LMP version numbers -> Bluetooth Core specification
+VERSIONS = {0: "1.0b", 1: "1.1", 2: "1.2", 3: "2.0", 4: "2.1", 5: "3.0", 6: "4.0", 7: "4.1", 8: "4.2", 9: "5.0",
+            10: "5.1", 11: "5.2", 12: "5.3", 13: "5.4"}
+
+# Company identifiers of the controllers found on and plugged into Raspberry Pis
+MANUFACTURERS = {2: "Intel", 10: "Qualcomm (CSR)", 15: "Broadcom", 29: "Qualcomm", 93: "Realtek", 305: "Cypress"}
+
+# (byte, bit) of LMP features page 0 -> name, for the features worth reporting
+FEATURES = [(3, 1, "EDR 2 Mbit/s"), (3, 2, "EDR 3 Mbit/s"), (4, 6, "LE"), (6, 3, "secure simple pairing")]
+
+_CONTROLLER_NAME = re.compile(r"^hci(\d+)$")
+
+# A Bluetooth controller. up is None and the version fields are None when the source can't tell (sysfs);
+# blocked is True when rfkill has turned the radio off.
+Controller = namedtuple("Controller", ["dev_id", "name", "address", "up", "blocked", "hci_version", "lmp_version",
+                                       "manufacturer", "features"])
+
+# Summary of an LE scan: devices maps each address heard to its strongest RSSI in dBm
+ScanSummary = namedtuple("ScanSummary", ["devices", "rssi_min", "rssi_max", "rssi_mean", "seconds"])
+
+
+def rfkill_blocked(reader, name):
+    """True when an rfkill switch blocks the controller, None when it has none."""
+    for entry in reader.list_dir(f"/sys/class/bluetooth/{name}"):
+        if entry.startswith("rfkill"):
+            # 1 is unblocked, 0 soft blocked and 2 hard blocked
+            return reader.read_value(f"/sys/class/bluetooth/{name}/{entry}/state") != "1"
+    return None
+
+
+def _check(reply, opcode):
+    if not reply:
+        raise OSError(f"HCI command {opcode:#06x} returned no status")
+    if reply[0] != 0:
+        raise OSError(f"HCI command {opcode:#06x} failed with status {reply[0]:#04x}")
+    return reply
+
+
+def parse_advertising_reports(data):
+    """Yield (address, RSSI) for each report in an LE Advertising Report event (after its subevent code)."""
+    count, offset = data[0], 1
+    for _ in range(count):
+        if offset + 9 > len(data):
+            return
+        address = ":".join(f"{byte:02X}" for byte in reversed(data[offset + 2:offset + 8]))
+        length = data[offset + 8]
+        rssi_offset = offset + 9 + length
+        if rssi_offset >= len(data):
+            return
+        yield address, struct.unpack_from("=b", data, rssi_offset)[0]
+        offset = rssi_offset + 1
+
+
+class HciBackend:
+    """Controllers queried over a raw AF_BLUETOOTH HCI socket. Raises OSError when the kernel has no Bluetooth."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.sock = socket.socket(AF_BLUETOOTH, socket.SOCK_RAW, BTPROTO_HCI)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _device_socket(self, dev_id, timeout=1.0):
+        sock = socket.socket(AF_BLUETOOTH, socket.SOCK_RAW, BTPROTO_HCI)
+        try:
+            sock.bind((dev_id,))
+            # Only events, and only the command replies and LE reports (struct hci_ufilter)
+            events = [EVT_CMD_COMPLETE, EVT_CMD_STATUS, EVT_LE_META]
+            mask = [sum(1 << event for event in events if event < 32),
+                    sum(1 << (event - 32) for event in events if event >= 32)]
+            sock.setsockopt(SOL_HCI, HCI_FILTER, struct.pack("=IIIH2x", 1 << HCI_EVENT_PKT, *mask, 0))
+            sock.settimeout(timeout)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _command(self, sock, opcode, params=b""):
+        """Send a command and return its Command Complete parameters, starting with the status."""
+        sock.send(struct.pack("=BHB", HCI_COMMAND_PKT, opcode, len(params)) + params)
+        while True:
+            packet = sock.recv(260)
+            if len(packet) < 3 or packet[0] != HCI_EVENT_PKT:
+                continue
+            event, data = packet[1], packet[3:]
+            if event == EVT_CMD_COMPLETE and len(data) >= 3 and struct.unpack_from("=H", data, 1)[0] == opcode:
+                return data[3:]
+            if event == EVT_CMD_STATUS and len(data) >= 4 and struct.unpack_from("=H", data, 2)[0] == opcode \
+                    and data[0] != 0:
+                return data[:1]
+
+    def controllers(self):
+        request = bytearray(struct.pack("=H2x", MAX_DEVICES) + bytes(8 * MAX_DEVICES))
+        fcntl.ioctl(self.sock.fileno(), HCIGETDEVLIST, request)
+        count = struct.unpack_from("=H", request)[0]
+        return [self._controller(struct.unpack_from("=H", request, 4 + 8 * i)[0]) for i in range(count)]
+
+    def _controller(self, dev_id):
+        info = bytearray(DEV_INFO.size)
+        struct.pack_into("=H", info, 0, dev_id)
+        fcntl.ioctl(self.sock.fileno(), HCIGETDEVINFO, info)
+        fields = DEV_INFO.unpack(info)
+        name = fields[1].split(b"\0")[0].decode()
+        up = bool(fields[3] & HCI_UP)
+        hci_version = lmp_version = manufacturer = None
+        if up:
+            # Read Local Version Information: status, HCI version and revision, LMP version, manufacturer, subversion.
+            # Sending commands needs CAP_NET_RAW; without it the controller is still reported, just without a version.
+            try:
+                with self._device_socket(dev_id) as sock:
+                    reply = _check(self._command(sock, READ_LOCAL_VERSION), READ_LOCAL_VERSION)
+                _, hci_version, _, lmp_version, manufacturer, _ = struct.unpack_from("=BBHBHH", reply)
+            except PermissionError:
+                pass
+        return Controller(dev_id, name, ":".join(f"{byte:02X}" for byte in reversed(fields[2])), up,
+                          rfkill_blocked(self.reader, name), hci_version, lmp_version, manufacturer, fields[5])
+
+    def le_scan(self, dev_id, seconds):
+        """Passively scan for LE advertisers for `seconds`. Returns {address: [RSSI readings]}."""
+        readings = {}
+        with self._device_socket(dev_id) as sock:
+            # Passive scanning, 10 ms interval and window, public address, no whitelist
+            _check(self._command(sock, LE_SET_SCAN_PARAMETERS, struct.pack("=BHHBB", 0, 0x10, 0x10, 0, 0)),
+                   LE_SET_SCAN_PARAMETERS)
+            # Enabled, without filtering duplicates so every advertisement gives an RSSI reading
+            _check(self._command(sock, LE_SET_SCAN_ENABLE, b"\x01\x00"), LE_SET_SCAN_ENABLE)
+            try:
+                deadline = time.monotonic() + seconds
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    sock.settimeout(remaining)
+                    try:
+                        packet = sock.recv(260)
+                    except socket.timeout:
+                        break
+                    if len(packet) > 4 and packet[1] == EVT_LE_META and packet[3] == LE_ADVERTISING_REPORT:
+                        for address, rssi in parse_advertising_reports(packet[4:]):
+                            readings.setdefault(address, []).append(rssi)
+            finally:
+                sock.settimeout(1.0)
+                self._command(sock, LE_SET_SCAN_ENABLE, b"\x00\x00")
+        return readings
+
+
+class SysfsBackend:
+    """Controllers listed in /sys/class/bluetooth. Names and rfkill state only; no scanning."""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def controllers(self):
+        controllers = []
+        for name in self.reader.list_dir("/sys/class/bluetooth"):
+            match = _CONTROLLER_NAME.match(name)
+            if match:
+                controllers.append(Controller(int(match.group(1)), name, None, None, rfkill_blocked(self.reader, name),
+                                              None, None, None, None))
+        return controllers
+
+    def le_scan(self, dev_id, seconds):
+        raise OSError("Scanning needs a raw HCI socket, which isn't available")
+
+
+class FakeBackend:
+    """A simulated Bluetooth 5.0 controller with a few advertisers in range, for trying the tests without one."""
+
+    # A Pi 4's onboard controller: Cypress, Bluetooth 5.0, LE, EDR and secure simple pairing
+    CONTROLLER = Controller(0, "hci0", "DC:A6:32:00:00:01", True, False, 9, 9, 305,
+                            bytes([0xbf, 0xfe, 0xcf, 0xfe, 0xdb, 0xff, 0x7b, 0x87]))
+    ADVERTISERS = {"C0:FF:EE:00:00:01": [-48, -50, -47], "C0:FF:EE:00:00:02": [-71, -69],
+                   "C0:FF:EE:00:00:03": [-88]}
+
+    def __init__(self, reader=None, controllers=None, advertisers=None):
+        self._controllers = [self.CONTROLLER] if controllers is None else controllers
+        self.advertisers = self.ADVERTISERS if advertisers is None else advertisers
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def controllers(self):
+        return list(self._controllers)
+
+    def le_scan(self, dev_id, seconds):
+        return {address: list(rssi) for address, rssi in self.advertisers.items()}
+
+
+def open_backend(backend, reader):
+    """
+    backend: "auto" (a raw HCI socket, or /sys/class/bluetooth when the kernel has no Bluetooth sockets), "hci",
+    "sysfs" or "fake".
+    """
+    if backend == "fake":
+        return FakeBackend(reader)
+    if backend == "sysfs":
+        return SysfsBackend(reader)
+    if backend == "hci":
+        return HciBackend(reader)
+    if backend != "auto":
+        raise ValueError(f"Unknown Bluetooth backend {backend}")
+    try:
+        return HciBackend(reader)
+    except OSError:
+        return SysfsBackend(reader)
+
+
+def summarise_scan(readings, seconds):
+    strongest = {address: max(rssi) for address, rssi in readings.items() if rssi}
+    values = list(strongest.values())
+    if not values:
+        return ScanSummary({}, None, None, None, seconds)
+    return ScanSummary(strongest, min(values), max(values), sum(values) / len(values), seconds)
+
+
+def feature_names(features):
+    if not features:
+        return []
+    return [name for byte, bit, name in FEATURES if byte < len(features) and features[byte] & (1 << bit)]
+
+
+def format_controller(controller):
+    """e.g. "hci0 DC:A6:32:00:00:01, Bluetooth 5.0 (Cypress), LE, EDR 2 Mbit/s"."""
+    parts = [controller.name + (f" {controller.address}" if controller.address else "")]
+    if controller.lmp_version is not None:
+        version = VERSIONS.get(controller.lmp_version, f"LMP {controller.lmp_version}")
+        manufacturer = MANUFACTURERS.get(controller.manufacturer, f"manufacturer {controller.manufacturer}")
+        parts.append(f"Bluetooth {version} ({manufacturer})")
+    parts.extend(feature_names(controller.features))
+    if controller.blocked:
+        parts.append("blocked by rfkill")
+    elif controller.up is False:
+        parts.append("down")
+    return ", ".join(parts)
@@ -0,0 +1,256 @@
+import math
+import os
+import time
+from array import array
+
+THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+FREQ_PATH = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+VOLTAGE_PATH = "/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_voltage"
+STAT_PATH = "/proc/stat"
+# Only present on kernels with the Raspberry Pi firmware driver. Bits 0-3 are the "currently happening" flags:
+# under-voltage, ARM frequency capped, throttled, soft temperature limit.
+THROTTLED_PATH = "/sys/devices/platform/soc/soc:firmware/get_throttled"
+
+# Default alarm thresholds used for the time-above-threshold figures
+DEFAULT_THRESHOLDS = {
+    "temp_c": 80.0,  # The firmware starts throttling at 80°C (85°C hard limit)
+    "cpu_util_pct": 90.0,
+    "throttled": 0.5,  # Any current throttle flag set
+}
+
+
+class RingBuffer:
+    """
+    Fixed-size sample store for a set of numeric channels.
+
+    Each channel (and the timestamps) is one preallocated array of doubles, so appending a sample never allocates.
+    Once full, the oldest samples are overwritten.
+    """
+
+    def __init__(self, channels, capacity):
+        self.channels = list(channels)
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.data = {channel: array("d", bytes(8 * capacity)) for channel in self.channels}
+        self.count = 0  # Total samples ever appended
+
+    def append(self, timestamp, values):
+        index = self.count % self.capacity
+        self.timestamps[index] = timestamp
+        for channel, value in zip(self.channels, values):
+            self.data[channel][index] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def values(self, channel):
+        """Return the retained samples of a channel, oldest first."""
+        return self._ordered(self.data[channel])
+
+    def values_timestamps(self):
+        """Return the timestamps of the retained samples, oldest first."""
+        return self._ordered(self.timestamps)
+
+    def _ordered(self, data):
+        if self.count <= self.capacity:
+            return data[:self.count]
+        index = self.count % self.capacity
+        return data[index:] + data[:index]
+
+
+class _SysfsValue:
+    """Keeps a sysfs attribute open and re-reads it with pread, avoiding an open/close per sample."""
+
+    def __init__(self, path, scale=1.0, base=10):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.scale = scale
+        self.base = base
+
+    def read(self):
+        return int(os.pread(self.fd, 64, 0).split()[0], self.base) * self.scale
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _ThrottledFlags(_SysfsValue):
+    def __init__(self, path):
+        super().__init__(path, base=16)
+
+    def read(self):
+        # Only the "currently happening" bits; the sticky "has occurred" bits would mask recovery
+        return float(int(super().read()) & 0xf)
+
+
+class _CpuUtilization:
+    """CPU utilization since the previous sample, from the aggregate line of /proc/stat."""
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.last = self._times()
+
+    def _times(self):
+        fields = os.pread(self.fd, 256, 0).split(b"\n", 1)[0].split()[1:]
+        times = [int(field) for field in fields]
+        idle = times[3] + (times[4] if len(times) > 4 else 0)  # idle + iowait
+        return sum(times), idle
+
+    def read(self):
+        total, idle = self._times()
+        last_total, last_idle = self.last
+        self.last = (total, idle)
+        if total == last_total:
+            return 0.0
+        return 100.0 * (1 - (idle - last_idle) / (total - last_total))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_sources(reader):
+    """Return {channel: source} for every telemetry source this board exposes."""
+    candidates = [
+        ("temp_c", lambda: _SysfsValue(reader.path(THERMAL_PATH), 0.001)),
+        ("arm_freq_mhz", lambda: _SysfsValue(reader.path(FREQ_PATH), 0.001)),
+        ("cpu_util_pct", lambda: _CpuUtilization(reader.path(STAT_PATH))),
+        ("core_voltage", lambda: _SysfsValue(reader.path(VOLTAGE_PATH))),
+        ("throttled", lambda: _ThrottledFlags(reader.path(THROTTLED_PATH))),
+    ]
+    sources = {}
+    for channel, opener in candidates:
+        try:
+            source = opener()
+            source.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        sources[channel] = source
+    return sources
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sequence of numbers."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Monitor:
+    """
+    Samples the board's telemetry into a RingBuffer at a fixed rate.
+
+    Min, max, mean and time above threshold are running totals over the whole run; p95 is computed over the samples
+    still held in the buffer.
+    """
+
+    def __init__(self, reader, rate_hz=10.0, capacity=6000, thresholds=None):
+        self.sources = open_sources(reader)
+        self.period = 1.0 / rate_hz
+        self.buffer = RingBuffer(self.sources, capacity)
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        channels = len(self.sources)
+        self.minimum = array("d", [math.inf] * channels)
+        self.maximum = array("d", [-math.inf] * channels)
+        self.total = array("d", bytes(8 * channels))
+        self.above = array("d", bytes(8 * channels))  # Seconds spent above threshold
+        self.started = None
+        self.cpu_seconds = 0.0
+
+    def sample(self, timestamp):
+        values = [source.read() for source in self.sources.values()]
+        self.buffer.append(timestamp, values)
+        for i, (channel, value) in enumerate(zip(self.buffer.channels, values)):
+            if value < self.minimum[i]:
+                self.minimum[i] = value
+            if value > self.maximum[i]:
+                self.maximum[i] = value
+            self.total[i] += value
+            threshold = self.thresholds.get(channel)
+            if threshold is not None and value > threshold:
+                self.above[i] += self.period
+        return values
+
+    def run(self, duration, on_sample=None):
+        """Sample for `duration` seconds, sleeping between samples rather than polling."""
+        cpu_start = time.process_time()
+        self.started = time.monotonic()
+        next_tick = self.started
+        end = self.started + duration
+        try:
+            while next_tick < end:
+                values = self.sample(next_tick - self.started)
+                if on_sample:
+                    on_sample(self, values, next_tick - self.started)
+                next_tick += self.period
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind (e.g. the process was descheduled); skip the missed ticks rather than bursting
+                    next_tick = time.monotonic()
+        finally:
+            self.cpu_seconds = time.process_time() - cpu_start
+
+    def summary(self):
+        """Return {channel: {min, max, mean, p95, seconds_above, threshold}}."""
+        stats = {}
+        for i, channel in enumerate(self.buffer.channels):
+            if not self.buffer.count:
+                break
+            stats[channel] = {
+                "min": self.minimum[i],
+                "max": self.maximum[i],
+                "mean": self.total[i] / self.buffer.count,
+                "p95": percentile(self.buffer.values(channel), 0.95),
+                "seconds_above": self.above[i],
+                "threshold": self.thresholds.get(channel),
+            }
+        return stats
+
+    def overhead_percent(self):
+        """CPU time spent sampling as a percentage of one core over the elapsed run time."""
+        if self.started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return 100.0 * self.cpu_seconds / elapsed if elapsed else 0.0
+
+    def close(self):
+        for source in self.sources.values():
+            source.close()
+
+
+def format_summary(monitor):
+    lines = [f"{'Channel':<14}{'Min':>10}{'Max':>10}{'Mean':>10}{'P95':>10}{'Above':>14}"]
+    for channel, s in monitor.summary().items():
+        above = "-" if s["threshold"] is None else f"{s['seconds_above']:.1f}s>{s['threshold']:g}"
+        lines.append(f"{channel:<14}{s['min']:>10.2f}{s['max']:>10.2f}{s['mean']:>10.2f}{s['p95']:>10.2f}{above:>14}")
+    lines.append(f"{monitor.buffer.count} samples, sampling overhead {monitor.overhead_percent():.2f}% CPU")
+    return "\n".join(lines)
+
+
+def run_monitor(reader, duration, rate_hz=10.0, capacity=6000, report_every=10.0):
+    """
+    Run the continuous sampling mode, printing a status line every `report_every` seconds and a summary at the end.
+    """
+    monitor = Monitor(reader, rate_hz, capacity)
+    if not monitor.sources:
+        print("No telemetry sources found to monitor.")
+        return monitor
+    print(f"Monitoring {', '.join(monitor.sources)} at {rate_hz:g} Hz for {duration:g}s...")
+    every = max(1, int(report_every * rate_hz))
+
+    def report(monitor, values, elapsed):
+        if monitor.buffer.count % every == 0:
+            current = ", ".join(f"{channel}={value:.1f}" for channel, value in zip(monitor.buffer.channels, values))
+            print(f"[{elapsed:7.1f}s] {current}")
+
+    try:
+        monitor.run(duration, on_sample=report)
+    except KeyboardInterrupt:
+        print("Monitoring interrupted.")
+    finally:
+        monitor.close()
+    print(format_summary(monitor))
+    return monitor
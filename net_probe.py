@@ -0,0 +1,168 @@
+import asyncio
+import errno
+import os
+import socket
+import struct
+import time
+from collections import namedtuple
+
+# Not exported by every Python build; the value is fixed by the Linux ABI
+SO_BINDTODEVICE = getattr(socket, "SO_BINDTODEVICE", 25)
+
+# What to probe, as a comma separated list:
+#   gateway          TCP connect to the interface's default gateway
+#   dns              UDP DNS query to the first nameserver in /etc/resolv.conf
+#   tcp:HOST:PORT    TCP connect to any host, e.g. a server on the bench LAN
+#   dns:HOST[:PORT]  UDP DNS query to a specific server
+DEFAULT_TARGETS = "gateway,dns"
+DEFAULT_TIMEOUT = 0.5
+
+# Port used for "gateway": routers usually run a DNS forwarder, and a refused connection proves reachability anyway
+GATEWAY_PORT = 53
+
+# A resolved probe target, e.g. Target("gateway", "tcp", "192.168.1.1", 53)
+Target = namedtuple("Target", ["name", "protocol", "host", "port"])
+
+# The outcome of probing one target through one interface. `bound` is False when SO_BINDTODEVICE failed, and
+# bind_errno says why: EPERM means it wasn't permitted, in which case the kernel picked the route and the probe may
+# have left through another interface; any other error (ENODEV for a missing interface) stops the probe.
+ProbeResult = namedtuple("ProbeResult", ["interface", "target", "reachable", "seconds", "error", "bound",
+                                         "bind_errno"])
+
+
+def nameservers(reader):
+    servers = []
+    for line in reader.read_lines("/etc/resolv.conf"):
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] == "nameserver" and ":" not in fields[1]:
+            servers.append(fields[1])
+    return servers
+
+
+def _host_port(value, default_port):
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, default_port
+    return host, int(port)
+
+
+def resolve_targets(spec, reader, interface):
+    """
+    Turn a target list such as "gateway,dns,tcp:10.0.0.5:5201" into Targets for one interface.
+    Targets that don't exist for this interface (no default route, no nameserver) are left out.
+    """
+    targets = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item == "gateway":
+            gateway = reader.default_gateway(interface)
+            if gateway:
+                targets.append(Target("gateway", "tcp", gateway, GATEWAY_PORT))
+        elif item == "dns":
+            servers = nameservers(reader)
+            if servers:
+                targets.append(Target("dns", "dns", servers[0], 53))
+        elif item.startswith("tcp:"):
+            host, port = _host_port(item[4:], 80)
+            targets.append(Target(item, "tcp", host, port))
+        elif item.startswith("dns:"):
+            host, port = _host_port(item[4:], 53)
+            targets.append(Target(item, "dns", host, port))
+        elif item:
+            raise ValueError(f"Unknown probe target {item}")
+    return targets
+
+
+def _socket(interface, sock_type):
+    """A non-blocking socket bound to `interface`. Returns (socket, errno of the failed bind or None)."""
+    sock = socket.socket(socket.AF_INET, sock_type)
+    sock.setblocking(False)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.encode() + b"\0")
+    except OSError as e:
+        return sock, e.errno
+    return sock, None
+
+
+def _dns_query():
+    # A query for the root zone's NS records: header (random id, recursion desired, one question) and the question
+    query_id = struct.unpack("!H", os.urandom(2))[0]
+    return query_id, struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + b"\x00" + struct.pack("!HH", 2, 1)
+
+
+async def _probe_tcp(sock, target):
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sock_connect(sock, (target.host, target.port))
+    except ConnectionRefusedError:
+        # A RST came back from the target, so it's reachable even though nothing listens on the port
+        pass
+
+
+async def _probe_dns(sock, target):
+    loop = asyncio.get_running_loop()
+    query_id, query = _dns_query()
+    sock.connect((target.host, target.port))
+    await loop.sock_sendall(sock, query)
+    while True:
+        try:
+            reply = await loop.sock_recv(sock, 512)
+        except ConnectionRefusedError:
+            # ICMP port unreachable: the host answered, it just doesn't run a DNS server
+            return
+        # Any reply to our query counts, whatever its response code
+        if len(reply) >= 4 and struct.unpack("!H", reply[:2])[0] == query_id and reply[2] & 0x80:
+            return
+
+
+async def probe(interface, target, timeout=DEFAULT_TIMEOUT):
+    """Check whether one target answers through `interface` within `timeout` seconds."""
+    start = time.perf_counter()
+    sock = None
+    bind_errno = None
+    try:
+        sock, bind_errno = _socket(interface, socket.SOCK_STREAM if target.protocol == "tcp" else socket.SOCK_DGRAM)
+        # Binding needs CAP_NET_RAW; without it the probe still runs but follows the routing table. Any other
+        # failure means the interface can't be probed, and the routing table would test a different one.
+        if bind_errno not in (None, errno.EPERM):
+            raise OSError(bind_errno, f"{interface}: {os.strerror(bind_errno).lower()}")
+        check = _probe_tcp if target.protocol == "tcp" else _probe_dns
+        await asyncio.wait_for(check(sock, target), timeout)
+        reachable, error = True, None
+    except asyncio.TimeoutError:
+        reachable, error = False, f"no answer within {timeout * 1000:.0f} ms"
+    except OSError as e:
+        reachable, error = False, e.strerror or str(e)
+    finally:
+        if sock is not None:
+            sock.close()
+    return ProbeResult(interface, target, reachable, time.perf_counter() - start, error, bind_errno is None,
+                       bind_errno)
+
+
+async def probe_all(probes, timeout=DEFAULT_TIMEOUT):
+    """Run every (interface, Target) probe at once. Returns ProbeResults in the same order."""
+    return await asyncio.gather(*(probe(interface, target, timeout) for interface, target in probes))
+
+
+def probe_interfaces(interfaces, reader, spec=DEFAULT_TARGETS, timeout=DEFAULT_TIMEOUT):
+    """
+    Probe the targets in `spec` through each interface, all concurrently, so the whole check takes at most about
+    `timeout` seconds. Returns {interface: [ProbeResult]}.
+    """
+    probes = [(interface, target) for interface in interfaces for target in resolve_targets(spec, reader, interface)]
+    results = {interface: [] for interface in interfaces}
+    if probes:
+        for result in asyncio.run(probe_all(probes, timeout)):
+            results[result.interface].append(result)
+    return results
+
+
+def format_probe(result):
+    """One line summary, e.g. "gateway 192.168.1.1:53 reachable in 1.2 ms"."""
+    where = f"{result.target.host}:{result.target.port}"
+    if result.target.name in ("gateway", "dns"):
+        where = f"{result.target.name} {where}"
+    if result.reachable:
+        return f"{where} reachable in {result.seconds * 1000:.1f} ms"
+    return f"{where} unreachable ({result.error})"
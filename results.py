@@ -0,0 +1,100 @@
+import json
+from collections import namedtuple
+
+PASS = "pass"
+WARN = "warn"
+FAIL = "fail"
+SKIP = "skip"
+
+# A numeric measurement, e.g. Metric(52.1, "°C")
+Metric = namedtuple("Metric", ["value", "unit"])
+
+# The outcome of one diagnostic test. Test functions fill in status, message and metrics; the scheduler adds the
+# test's name and its wall time in seconds.
+TestResult = namedtuple("TestResult", ["name", "status", "message", "metrics", "duration"])
+
+
+def _result(status, message, metrics):
+    return TestResult(status=status, message=message, metrics=metrics, name="", duration=None)
+
+
+def passed(message, **metrics):
+    return _result(PASS, message, metrics)
+
+
+def warning(message, **metrics):
+    return _result(WARN, message, metrics)
+
+
+def failed(message, **metrics):
+    return _result(FAIL, message, metrics)
+
+
+def skipped(message, **metrics):
+    return _result(SKIP, message, metrics)
+
+
+def to_record(result):
+    """Return a JSON-serialisable dict for a TestResult."""
+    return {
+        "test": result.name,
+        "status": result.status,
+        "duration_s": None if result.duration is None else round(result.duration, 4),
+        "metrics": {name: {"value": metric.value, "unit": metric.unit} for name, metric in result.metrics.items()},
+        "message": result.message,
+    }
+
+
+def from_record(record):
+    """Rebuild a TestResult from a dict produced by to_record."""
+    metrics = {name: Metric(metric["value"], metric["unit"]) for name, metric in record.get("metrics", {}).items()}
+    return TestResult(record["test"], record["status"], record.get("message", ""), metrics, record.get("duration_s"))
+
+
+def to_json_line(result):
+    """Serialize a TestResult as one compact line of JSON."""
+    return json.dumps(to_record(result), separators=(",", ":"), ensure_ascii=False)
+
+
+def write_json_lines(results, stream):
+    """Write each TestResult to `stream` as a JSON line, flushing after each so readers see results immediately."""
+    for result in results:
+        stream.write(to_json_line(result) + "\n")
+        stream.flush()
+
+
+def to_event_line(event, result=None, **fields):
+    """
+    Serialize a progress event as one line of JSON: "plan", "start", "result" or "done". Result events carry the
+    to_record fields, so read_json_lines picks the results out of an event stream too.
+    """
+    record = {"event": event}
+    if result is not None:
+        record.update(to_record(result))
+    record.update(fields)
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+
+def read_json_lines(lines):
+    """Parse JSON lines written by write_json_lines back into TestResults, ignoring any other output."""
+    results = []
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "test" in record and "status" in record:
+            results.append(from_record(record))
+    return results
+
+
+def format_result(result):
+    """Human readable one-block summary of a TestResult."""
+    text = f"[{result.status.upper()}] {result.message}"
+    if result.metrics:
+        text += "\n" + ", ".join(f"{name}={metric.value:g}{' ' + metric.unit if metric.unit else ''}"
+                                  for name, metric in result.metrics.items())
+    return text
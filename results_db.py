@@ -0,0 +1,210 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+DEFAULT_DB = os.environ.get("DIAG_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    serial TEXT NOT NULL,
+    revision TEXT,
+    model TEXT,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    test TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration REAL,
+    message TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL,
+    unit TEXT,
+    PRIMARY KEY (result_id, name)
+) WITHOUT ROWID;
+-- Running totals per board and test, kept up to date by save_run so failure rates don't have to scan every result
+CREATE TABLE IF NOT EXISTS test_totals (
+    serial TEXT NOT NULL,
+    test TEXT NOT NULL,
+    revision TEXT,
+    model TEXT,
+    runs INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    PRIMARY KEY (serial, test)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_runs_serial ON runs(serial, started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_revision ON runs(revision);
+CREATE INDEX IF NOT EXISTS idx_results_test ON results(test, run_id);
+CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id, test);
+"""
+
+
+def connect(path=DEFAULT_DB):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def save_run(connection, serial, revision, model, results, started_at=None):
+    """
+    Store one diagnostics run (an iterable of TestResults) in a single transaction. Returns the new run id.
+    """
+    started_at = time.time() if started_at is None else started_at
+    serial = serial or "unknown"
+    with connection:
+        run_id = connection.execute("INSERT INTO runs (serial, revision, model, started_at) VALUES (?, ?, ?, ?)",
+                                    (serial, revision, model, started_at)).lastrowid
+        metric_rows = []
+        total_rows = []
+        for result in results:
+            result_id = connection.execute(
+                "INSERT INTO results (run_id, test, status, duration, message) VALUES (?, ?, ?, ?, ?)",
+                (run_id, result.name, result.status, result.duration, result.message)).lastrowid
+            metric_rows.extend((result_id, name, metric.value, metric.unit) for name, metric in result.metrics.items())
+            total_rows.append((serial, result.name, revision, model, int(result.status == "fail")))
+        connection.executemany("INSERT INTO metrics (result_id, name, value, unit) VALUES (?, ?, ?, ?)", metric_rows)
+        connection.executemany("""
+            INSERT INTO test_totals (serial, test, revision, model, runs, failures) VALUES (?, ?, ?, ?, 1, ?)
+            ON CONFLICT (serial, test) DO UPDATE SET runs = runs + 1, failures = failures + excluded.failures,
+                revision = excluded.revision, model = excluded.model
+        """, total_rows)
+    return run_id
+
+
+# Newest-first values of one metric for one board. CROSS JOIN pins the join order so SQLite walks the board's runs
+# through idx_runs_serial instead of every result of the test.
+_BOARD_METRIC_QUERY = """
+    SELECT metrics.value FROM runs CROSS JOIN results CROSS JOIN metrics
+    WHERE runs.serial = ? AND results.run_id = runs.id AND results.test = ?
+      AND metrics.result_id = results.id AND metrics.name = ?
+    ORDER BY runs.serial DESC, runs.started_at DESC
+    LIMIT ?
+"""
+
+
+def metric_trend(connection, test, metric, runs=10, min_rise=5.0):
+    """
+    Boards whose `metric` of `test` rose by more than `min_rise` between the oldest and newest of their last `runs`
+    runs. Returns (serial, revision, first value, last value, rise) rows, biggest rise first.
+    """
+    rows = []
+    boards = connection.execute("SELECT serial, revision FROM test_totals WHERE test = ?", (test,)).fetchall()
+    for serial, revision in boards:
+        values = [row[0] for row in connection.execute(_BOARD_METRIC_QUERY, (serial, test, metric, runs))]
+        if len(values) < 2 or values[0] is None or values[-1] is None:
+            continue
+        rise = values[0] - values[-1]
+        if rise > min_rise:
+            rows.append((serial, revision, values[-1], values[0], rise))
+    return sorted(rows, key=lambda row: row[4], reverse=True)
+
+
+def failure_rate(connection, test=None, group_by="revision", since=None):
+    """
+    Share of failed results grouped by board revision, model or serial, optionally for one test and only for runs
+    started after `since` (a unix time). Returns (group, test, runs, failures, rate) rows, worst first.
+    """
+    if group_by not in ("revision", "model", "serial"):
+        raise ValueError(f"Can't group failures by {group_by}")
+    if since is None:
+        # All-time rates come straight from the running totals
+        return connection.execute(f"""
+            SELECT {group_by}, test, SUM(runs) AS total, SUM(failures) AS failed,
+                   ROUND(100.0 * SUM(failures) / SUM(runs), 1) AS rate
+            FROM test_totals
+            WHERE :test IS NULL OR test = :test
+            GROUP BY {group_by}, test
+            HAVING failed > 0
+            ORDER BY rate DESC, failed DESC
+        """, {"test": test}).fetchall()
+    return connection.execute(f"""
+        SELECT runs.{group_by}, results.test, COUNT(*) AS total,
+               SUM(results.status = 'fail') AS failed,
+               ROUND(100.0 * SUM(results.status = 'fail') / COUNT(*), 1) AS rate
+        FROM runs CROSS JOIN results
+        WHERE runs.started_at >= :since AND results.run_id = runs.id AND (:test IS NULL OR results.test = :test)
+        GROUP BY runs.{group_by}, results.test
+        HAVING failed > 0
+        ORDER BY rate DESC, failed DESC
+    """, {"test": test, "since": since}).fetchall()
+
+
+def board_history(connection, serial, limit=20):
+    """The latest runs of one board: (started_at, revision, passed, warned, failed, skipped) rows, newest first."""
+    return connection.execute("""
+        SELECT runs.started_at, runs.revision,
+               SUM(results.status = 'pass'), SUM(results.status = 'warn'),
+               SUM(results.status = 'fail'), SUM(results.status = 'skip')
+        FROM runs JOIN results ON results.run_id = runs.id
+        WHERE runs.serial = ?
+        GROUP BY runs.id
+        ORDER BY runs.started_at DESC
+        LIMIT ?
+    """, (serial, limit)).fetchall()
+
+
+def _print_rows(headers, rows):
+    rows = [["-" if value is None else f"{value:g}" if isinstance(value, float) else str(value) for value in row]
+            for row in rows]
+    widths = [max([len(header)] + [len(row[i]) for row in rows]) for i, header in enumerate(headers)]
+    print("  ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the stored diagnostics results")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"results database (default {DEFAULT_DB})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    trend = commands.add_parser("trend", help="boards whose metric rose over their last N runs")
+    trend.add_argument("--test", default="CPU/Memory Burn-in")
+    trend.add_argument("--metric", default="temperature_p95")
+    trend.add_argument("--runs", type=int, default=10)
+    trend.add_argument("--rise", type=float, default=5.0)
+
+    failures = commands.add_parser("failures", help="failure rate per test grouped by revision, model or serial")
+    failures.add_argument("--test", default=None)
+    failures.add_argument("--by", choices=["revision", "model", "serial"], default="revision")
+    failures.add_argument("--days", type=float, default=None, help="only count runs from the last N days")
+
+    history = commands.add_parser("history", help="latest runs of one board")
+    history.add_argument("serial")
+    history.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"No results database at {args.db}")
+    connection = connect(args.db)
+
+    start = time.perf_counter()
+    if args.command == "trend":
+        rows = metric_trend(connection, args.test, args.metric, args.runs, args.rise)
+        headers = ["Serial", "Revision", "First", "Last", "Rise"]
+    elif args.command == "failures":
+        since = time.time() - args.days * 86400 if args.days else None
+        rows = failure_rate(connection, args.test, args.by, since)
+        headers = [args.by.capitalize(), "Test", "Runs", "Failures", "Rate %"]
+    else:
+        rows = [(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[0])),) + tuple(row[1:])
+                for row in board_history(connection, args.serial, args.limit)]
+        headers = ["Started", "Revision", "Pass", "Warn", "Fail", "Skip"]
+    elapsed = time.perf_counter() - start
+
+    _print_rows(headers, rows)
+    print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,45 +1,172 @@
-import subprocess
+import argparse
+import contextlib
 import json
 import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from results import FAIL, from_record, format_result
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def run_script(script_name):
     os.system(f"python3 {script_name}")
 
 
-def capture_script_output(script_name):
-    result = subprocess.run(["python3", script_name], capture_output=True, text=True)
-    return result.stdout
+def _signal_group(process, signum):
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        pass
 
 
-def display_human_readable(test_results):
-    if not test_results:
-        print("No results to display. Exiting.")
-        return
-    parsed_results = json.loads(test_results)
-    for key, value in parsed_results.items():
-        print(f"{key}:\n{'-' * len(key)}")
-        if isinstance(value, dict):
-            for sub_key, sub_value in value.items():
-                print(f"  {sub_key}: {sub_value}")
-        else:
-            print(value)
-        print("=" * 40)
+def stream_events(script_name, args=(), log=None, tick=None):
+    """
+    Run the diagnostics with --events and yield each event as a dict as soon as it's written. With `tick`, None is
+    yielded whenever that many seconds pass without an event. Closing the generator early stops the diagnostics.
+    """
+    # A session of its own, so it can be stopped as a whole process group; Ctrl-C here reaches it through the finally
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, script_name), "--events", *args],
+                               stdout=subprocess.PIPE, stderr=log or subprocess.DEVNULL, text=True, bufsize=1,
+                               start_new_session=True)
+    lines = queue.Queue()
 
+    def pump():
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
 
-if __name__ == "__main__":
-    run_script("dependencies_check.py")  # This will allow user interaction
-    test_results = capture_script_output("diagnostics.py")
+    threading.Thread(target=pump, name="events", daemon=True).start()
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=tick)
+            except queue.Empty:
+                yield None
+                continue
+            if line is None:
+                break
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(event, dict) and "event" in event:
+                yield event
+    finally:
+        if process.poll() is None:
+            # The diagnostics pass SIGTERM on to the commands and test workers they run in sessions of their own
+            _signal_group(process, signal.SIGTERM)
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                _signal_group(process, signal.SIGKILL)
+        process.wait()
+
+
+class ProgressView:
+    """
+    Prints each result as its event arrives. On a terminal the last line shows the tests still running and for how
+    long, redrawn in place.
+    """
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.live = stream.isatty()
+        self.total = 0
+        self.finished = 0
+        self.running = {}
+
+    def _write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def clear(self):
+        if self.live:
+            self._write("\r\033[K")
 
-    if not test_results:
+    def refresh(self):
+        if not self.live or not self.running:
+            return
+        now = time.monotonic()
+        running = ", ".join(f"{name} {now - started:.0f}s" for name, started in self.running.items())
+        line = f"[{self.finished}/{self.total}] running: {running}"
+        width = shutil.get_terminal_size().columns - 1
+        self._write("\r\033[K" + (line if len(line) <= width else line[:width - 3] + "..."))
+
+    def handle(self, event):
+        kind = event["event"]
+        if kind == "plan":
+            self.total = len(event["tests"])
+            self._write(f"Running {self.total} tests\n")
+        elif kind == "start":
+            self.running[event["test"]] = time.monotonic()
+        elif kind == "result":
+            result = from_record(event)
+            self.running.pop(result.name, None)
+            self.finished += 1
+            self.clear()
+            self._write(f"[{self.finished}/{self.total}] {result.name} ({result.duration or 0:.1f}s)\n"
+                        f"  {format_result(result).replace(chr(10), chr(10) + '  ')}\n")
+        elif kind == "done":
+            self.clear()
+            counts = ", ".join(f"{count} {status}" for status, count in sorted(event["counts"].items()))
+            self._write(f"Finished in {event['seconds']:.1f}s: {counts or 'no results'}\n")
+        self.refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check dependencies, then run the diagnostics with live progress")
+    parser.add_argument("--json", action="store_true",
+                        help="print the raw JSON line events instead of the progress view")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="stop the run at the first failure of a critical test (DIAG_CRITICAL_TESTS)")
+    parser.add_argument("--log", metavar="FILE", help="write the diagnostics' own progress log to FILE")
+    args = parser.parse_args()
+
+    run_script("dependencies_check.py")  # Asks once before installing anything missing
+
+    view = ProgressView()
+    log = open(args.log, "w") if args.log else None
+    any_failed = False
+    got_events = False
+    try:
+        events = stream_events("diagnostics.py", log=log, tick=None if args.json else 1.0)
+        # Leaving the loop early closes the stream, which stops the diagnostics
+        with contextlib.closing(events):
+            for event in events:
+                if event is None:
+                    view.refresh()
+                    continue
+                got_events = True
+                if args.json:
+                    print(json.dumps(event), flush=True)
+                else:
+                    view.handle(event)
+                if event["event"] == "result" and event["status"] == FAIL:
+                    any_failed = True
+                    if args.fail_fast and event.get("critical"):
+                        view.clear()
+                        print(f"Stopping: the critical {event['test']} test failed.", file=sys.stderr)
+                        break
+    except KeyboardInterrupt:
+        view.clear()
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        if log:
+            log.close()
+
+    if not got_events:
         print("No test results obtained. Exiting.")
-        exit()
-
-    choice = input("Do you want the output in a human-readable form (h/human) or as JSON (j/json)? ").strip().lower()
-    if choice in ['human', 'h']:
-        display_human_readable(test_results)
-    elif choice in ['json', 'j']:
-        print(test_results)
-    else:
-        print("Invalid choice. Exiting.")
-        exit()
\ No newline at end of file
+        return 2
+    return 1 if any_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+from commands import kill_commands, kill_all_commands, share_session
+from results import Metric, TestResult, passed, failed, skipped
+
+# A single diagnostic test.
+#   resources: tags such as "network", "display", "gpio" or "audio". Two tests sharing a tag never run together, and
+#              a test tagged EXCLUSIVE runs with nothing else.
+#   depends:   names of tests that must have finished before this one starts.
+#   timeout:   seconds the test may run before the watchdog stops it, or None for the schedule's default.
+#   isolate:   run the test in a worker process that can be killed outright, for tests that can hang in Python code
+#              (pygame event loops, GPIO register access) rather than in a command.
+Test = namedtuple("Test", ["name", "func", "resources", "depends", "timeout", "isolate"],
+                  defaults=((), (), None, False))
+
+DEFAULT_WORKERS = 4
+# Seconds a stopped test's thread has to finish before its resource tags are released anyway. A thread stuck in a C
+# call or an uninterruptible read may never return, and waiting on it would hang the run the watchdog is protecting.
+STOP_GRACE = 5.0
+# The tag of a test that has to have the board to itself, such as a burn-in that loads every core
+EXCLUSIVE = "exclusive"
+
+# Worker processes are forked, so they start at once and share the parent's configuration and imports
+_fork = multiprocessing.get_context("fork")
+
+# Every test started, so kill_all can stop the ones still running
+_workers = weakref.WeakSet()
+
+
+class MissingDependency(Exception):
+    """Raised by a test that can't run because an optional module isn't installed. The test is reported as skipped."""
+
+
+def require(module_name):
+    """
+    Import an optional dependency the first time a test needs it, so that headless runs never pay for modules
+    such as pygame and a missing module skips only the tests that use it.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise MissingDependency(f"{module_name} is not installed ({e}).") from e
+
+
+def _call(test):
+    try:
+        result = test.func()
+        if not isinstance(result, TestResult):
+            result = passed(str(result))
+    except MissingDependency as e:
+        result = skipped(str(e))
+    except Exception as e:
+        result = failed(f"Error during {test.name} test: {e}")
+    return result
+
+
+def _run_one(test, done_queue):
+    start = time.perf_counter()
+    result = _call(test)
+    done_queue.put((test, result._replace(name=test.name, duration=time.perf_counter() - start)))
+
+
+def _isolated_main(test, sender):
+    # A session of its own, so the watchdog can kill the worker and every command it started together
+    os.setsid()
+    share_session()
+    sender.send(_call(test))
+
+
+class _Worker:
+    """A running test: a thread, which for an isolated test waits on the worker process doing the work."""
+
+    def __init__(self, test, done_queue, isolate):
+        self.process = None
+        self.killed = False
+        _workers.add(self)
+        target = self._run_isolated if isolate else _run_one
+        self.thread = threading.Thread(target=target, args=(test, done_queue), name=f"test-{test.name}", daemon=True)
+        self.thread.start()
+
+    def _run_isolated(self, test, done_queue):
+        start = time.perf_counter()
+        receiver, sender = _fork.Pipe(duplex=False)
+        self.process = _fork.Process(target=_isolated_main, args=(test, sender), name=f"test-{test.name}",
+                                     daemon=True)
+        self.process.start()
+        sender.close()
+        if self.killed:
+            self.kill()
+        try:
+            result = receiver.recv()
+        except EOFError:
+            self.process.join()
+            result = failed(f"{test.name} test worker exited with code {self.process.exitcode}.")
+        self.process.join()
+        done_queue.put((test, result._replace(name=test.name, duration=time.perf_counter() - start)))
+
+    def kill(self):
+        """
+        Stop the test: kill its worker process, or the commands its thread is waiting on. A thread stuck in Python
+        code can't be stopped, but it's a daemon thread and its result is ignored.
+        """
+        self.killed = True
+        if self.process is not None and self.process.pid:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                # The worker hasn't called setsid yet, so there's no group to kill; it can't have started anything
+                self.process.kill()
+        elif self.thread.ident is not None:
+            kill_commands(self.thread.ident)
+
+
+def kill_all():
+    """
+    Kill every test still running and the commands they started, all of which run in sessions of their own and so
+    would outlive the process that started them. For a SIGTERM handler.
+    """
+    for worker in list(_workers):
+        if worker.thread.is_alive():
+            worker.kill()
+    kill_all_commands()
+
+
+def _is_runnable(test, finished, busy_resources, idle):
+    if any(dep not in finished for dep in test.depends):
+        return False
+    if EXCLUSIVE in test.resources:
+        return idle
+    return EXCLUSIVE not in busy_resources and not busy_resources.intersection(test.resources)
+
+
+def schedule(tests, max_workers=DEFAULT_WORKERS, on_start=None, default_timeout=None, run_timeout=None,
+             isolate=True):
+    """
+    Run tests concurrently and yield (test, TestResult) tuples as each one completes.
+
+    Tests are started in list order whenever a worker is free, their dependencies have finished and none of their
+    resource tags are held by a running test. Each test runs in a daemon thread, or a worker process when it's marked
+    `isolate` and `isolate` is set here, so a hung test can never keep the interpreter alive once the caller has given
+    up on it.
+
+    A watchdog stops any test that runs longer than its timeout (`default_timeout` when it has none) and reports it
+    as failed. Its resource tags stay held until its thread has actually finished, so a test stuck in Python code
+    never overlaps with one it conflicts with, or until STOP_GRACE seconds have passed, after which the thread is
+    abandoned. Once `run_timeout` seconds have passed, running tests are
+    stopped the same way and tests that haven't started are skipped, so the whole run has a hard upper bound.
+    """
+    names = {test.name for test in tests}
+    for test in tests:
+        unknown = [dep for dep in test.depends if dep not in names]
+        if unknown:
+            raise ValueError(f"Test {test.name} depends on unknown test(s): {', '.join(unknown)}")
+
+    pending = list(tests)
+    finished = set()
+    busy_resources = set()
+    # Test name -> (test, worker, started, deadline)
+    running = {}
+    # Tests the watchdog stopped whose threads haven't finished yet, still holding their resource tags:
+    # test name -> (test, time to give up on the thread)
+    stopping = {}
+    done_queue = queue.Queue()
+    run_deadline = time.monotonic() + run_timeout if run_timeout else None
+
+    def stop(name, message, **metrics):
+        test, worker, started, _ = running.pop(name)
+        worker.kill()
+        finished.add(name)
+        stopping[name] = (test, time.monotonic() + STOP_GRACE)
+        return test, failed(message, **metrics)._replace(name=name, duration=time.monotonic() - started)
+
+    while pending or running:
+        for test in list(pending):
+            if len(running) >= max_workers:
+                break
+            if not _is_runnable(test, finished, busy_resources, not running and not stopping):
+                continue
+            pending.remove(test)
+            busy_resources.update(test.resources)
+            if on_start:
+                on_start(test)
+            timeout = test.timeout if test.timeout is not None else default_timeout
+            started = time.monotonic()
+            deadline = started + timeout if timeout else None
+            running[test.name] = (test, _Worker(test, done_queue, isolate and test.isolate), started, deadline)
+
+        if not running and not stopping:
+            # Nothing is running and nothing can start, so the remaining dependencies can never be satisfied.
+            raise ValueError(f"Circular test dependencies: {', '.join(test.name for test in pending)}")
+
+        deadlines = [entry[3] for entry in running.values()] + [entry[1] for entry in stopping.values()]
+        deadlines = [deadline for deadline in deadlines + [run_deadline] if deadline is not None]
+        try:
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            test, result = done_queue.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            if run_deadline is not None and now >= run_deadline:
+                for name in list(running):
+                    yield stop(name, f"Stopped when the run's {run_timeout:g}s time limit ran out.")
+                for test in pending:
+                    yield test, skipped(f"Not started: the run's {run_timeout:g}s time limit ran out.")._replace(
+                        name=test.name, duration=0.0)
+                return
+            for name, (test, _, started, deadline) in list(running.items()):
+                if deadline is not None and now >= deadline:
+                    limit = deadline - started
+                    yield stop(name, f"Timed out after {limit:g}s.", timeout=Metric(round(limit, 3), "s"))
+            for name, (test, give_up) in list(stopping.items()):
+                if now >= give_up:
+                    # Already reported as timed out; its thread is a daemon and whatever it returns is ignored
+                    del stopping[name]
+                    busy_resources.difference_update(test.resources)
+            continue
+
+        if test.name in stopping:
+            # A test the watchdog already stopped, finishing after all: its resources are free now
+            del stopping[test.name]
+            busy_resources.difference_update(test.resources)
+            continue
+        if test.name not in running:
+            # A thread given up on after STOP_GRACE, whose tags have already been released
+            continue
+        del running[test.name]
+        finished.add(test.name)
+        busy_resources.difference_update(test.resources)
+        yield test, result
+
+
+def run_tests(tests, max_workers=DEFAULT_WORKERS, on_start=None, on_result=None, **limits):
+    """
+    Run tests concurrently and return their TestResults keyed by test name, in the original list order.
+    `limits` are passed on to schedule (default_timeout, run_timeout, isolate).
+    """
+    results = {}
+    for test, result in schedule(tests, max_workers, on_start, **limits):
+        results[test.name] = result
+        if on_result:
+            on_result(test, result)
+
+    return {test.name: results[test.name] for test in tests}
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules only imported by the tests that need them
+OPTIONAL_MODULES = ["psutil", "pygame", "numpy"]
+
+
+def import_times(module_name):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    Returns a list of (module, self microseconds, cumulative microseconds, depth), or None if the import failed.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                             cwd=SCRIPT_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                             env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT="1"))
+    if process.returncode != 0:
+        return None
+    times = []
+    for line in process.stderr.splitlines():
+        # e.g. "import time:       357 |        986 |   encodings"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return times
+
+
+def startup_seconds(module_name):
+    """Wall time to import a module in a fresh interpreter, without the -X importtime overhead."""
+    code = f"import time; start = time.perf_counter(); import {module_name}; print(time.perf_counter() - start)"
+    process = subprocess.run([sys.executable, "-c", code], cwd=SCRIPT_DIR, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, text=True)
+    return float(process.stdout.strip()) if process.returncode == 0 else None
+
+
+def profile_startup(module_name="diagnostics", top=15):
+    """Print the slowest modules imported at startup and the cost of each optional dependency."""
+    times = import_times(module_name)
+    if times is None:
+        print(f"Importing {module_name} failed.")
+        return
+    total = startup_seconds(module_name)
+    if total is None:
+        print(f"Timing the import of {module_name} failed.")
+        return
+    print(f"Importing {module_name} takes {total * 1000:.1f} ms ({len(times)} modules)")
+    print(f"{'Module':<40}{'Self ms':>10}{'Total ms':>10}")
+    for name, self_us, cumulative_us, depth in sorted(times, key=lambda t: t[2], reverse=True)[:top]:
+        print(f"{'  ' * depth + name:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+    print("\nOptional dependencies, imported only by the tests that use them:")
+    for optional in OPTIONAL_MODULES:
+        optional_times = import_times(optional)
+        if optional_times is None:
+            print(f"{optional:<40}{'not installed':>20}")
+        else:
+            print(f"{optional:<40}{optional_times[-1][2] / 1000:>17.1f} ms")
@@ -0,0 +1,146 @@
+import mmap
+import os
+import random
+import time
+
+SEQUENTIAL_BLOCK = 1024 * 1024
+RANDOM_BLOCK = 4096
+
+
+def aligned_buffer(size):
+    """Return a page-aligned, writable buffer (anonymous mmap) as required by O_DIRECT."""
+    return mmap.mmap(-1, size)
+
+
+def open_uncached(path, flags):
+    """
+    Open a file bypassing the page cache with O_DIRECT where the filesystem allows it.
+    Returns (fd, direct) - filesystems such as tmpfs reject O_DIRECT, in which case a normal fd is returned and the
+    caller has to drop the cache with posix_fadvise instead.
+    """
+    direct_flag = getattr(os, "O_DIRECT", 0)
+    if direct_flag:
+        try:
+            return os.open(path, flags | direct_flag, 0o600), True
+        except OSError:
+            pass
+    return os.open(path, flags, 0o600), False
+
+
+def drop_cache(fd):
+    if hasattr(os, "posix_fadvise"):
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _sequential_write(path, size, deadline):
+    buffer = aligned_buffer(SEQUENTIAL_BLOCK)
+    buffer.write(os.urandom(SEQUENTIAL_BLOCK))  # Incompressible, in case the card or controller compresses
+    fd, direct = open_uncached(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    written = 0
+    try:
+        start = time.perf_counter()
+        while written < size and time.perf_counter() < deadline:
+            written += os.write(fd, buffer)
+        os.fsync(fd)
+        elapsed = time.perf_counter() - start
+        if not direct:
+            drop_cache(fd)
+    finally:
+        os.close(fd)
+        buffer.close()
+    return written, elapsed
+
+
+def _sequential_read(path, size, deadline):
+    buffer = aligned_buffer(SEQUENTIAL_BLOCK)
+    fd, direct = open_uncached(path, os.O_RDONLY)
+    read = 0
+    try:
+        if not direct:
+            drop_cache(fd)
+        start = time.perf_counter()
+        while read < size and time.perf_counter() < deadline:
+            count = os.readv(fd, [buffer])
+            if not count:
+                break
+            read += count
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+        buffer.close()
+    return read, elapsed
+
+
+def _random_io(path, size, deadline, write):
+    """4K random reads or writes at aligned offsets within the first `size` bytes of the file."""
+    buffer = aligned_buffer(RANDOM_BLOCK)
+    if write:
+        buffer.write(os.urandom(RANDOM_BLOCK))
+    blocks = size // RANDOM_BLOCK
+    if not blocks:
+        return 0, 0.0
+    fd, direct = open_uncached(path, os.O_RDWR)
+    operations = 0
+    rng = random.Random(0)
+    try:
+        if not direct:
+            drop_cache(fd)
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            # Check the clock every 64 operations so timing doesn't dominate fast devices
+            for _ in range(64):
+                offset = rng.randrange(blocks) * RANDOM_BLOCK
+                if write:
+                    os.pwrite(fd, buffer, offset)
+                else:
+                    os.preadv(fd, [buffer], offset)
+            operations += 64
+        if write:
+            os.fsync(fd)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+        buffer.close()
+    return operations, elapsed
+
+
+def run_storage_benchmark(directory, size=64 * 1024 * 1024, time_limit=10.0):
+    """
+    Benchmark the filesystem holding `directory` with sequential 1 MiB and random 4 KiB read/write phases.
+
+    At most `size` bytes are written and the whole run is kept within roughly `time_limit` seconds: the sequential
+    phases get half of it and the random phases a quarter each. Returns a dict of MB/s and IOPS figures.
+    """
+    size -= size % SEQUENTIAL_BLOCK
+    if size < SEQUENTIAL_BLOCK:
+        raise ValueError("Benchmark size must be at least 1 MiB")
+
+    path = os.path.join(directory, f".storage_bench_{os.getpid()}")
+    phase = time_limit / 4
+    try:
+        written, write_seconds = _sequential_write(path, size, time.perf_counter() + phase)
+        read, read_seconds = _sequential_read(path, written, time.perf_counter() + phase)
+        random_reads, random_read_seconds = _random_io(path, written, time.perf_counter() + phase, write=False)
+        random_writes, random_write_seconds = _random_io(path, written, time.perf_counter() + phase, write=True)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    return {
+        "bytes_tested": written,
+        "seq_write_mb_s": written / write_seconds / 1e6 if write_seconds else 0.0,
+        "seq_read_mb_s": read / read_seconds / 1e6 if read_seconds else 0.0,
+        "rand_read_iops": random_reads / random_read_seconds if random_read_seconds else 0.0,
+        "rand_write_iops": random_writes / random_write_seconds if random_write_seconds else 0.0,
+    }
+
+
+def run_read_benchmark(path, size=64 * 1024 * 1024, time_limit=5.0):
+    """
+    Sequential 1 MiB reads from the start of an existing file or block device, bypassing the page cache. Nothing is
+    written, so it's safe on a device holding data. Reads at most `size` bytes for at most `time_limit` seconds and
+    returns a dict with the MB/s and the bytes read.
+    """
+    read, seconds = _sequential_read(path, max(size, SEQUENTIAL_BLOCK), time.perf_counter() + time_limit)
+    return {"bytes_read": read, "seq_read_mb_s": read / seconds / 1e6 if seconds else 0.0}
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from monitor import Monitor, DEFAULT_THRESHOLDS
+from scheduler import require, MissingDependency
+
+MAX_FREQ_PATH = "/sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq"
+
+# Each compute operation hashes this block and checks the digest, so a core that miscalculates under load
+# (marginal PSU, overheating) shows up as errors rather than just a slower score.
+KERNEL_BLOCK = bytes(range(256)) * 256  # 64 KiB
+KERNEL_DIGEST = hashlib.sha256(KERNEL_BLOCK).digest()
+
+# Clock samples taken while the workers are still starting up are ignored, since the governor hasn't ramped up yet
+WARMUP_SECONDS = 1.5
+
+MEMORY_PATTERNS = [0x00, 0xFF, 0xAA, 0x55]
+MEMORY_CHUNK = 1024 * 1024
+
+
+def _compute_kernel(duration):
+    """Hash KERNEL_BLOCK repeatedly for `duration` seconds. Returns (operations, errors, seconds)."""
+    operations = 0
+    errors = 0
+    start = time.perf_counter()
+    end = start + duration
+    while time.perf_counter() < end:
+        for _ in range(16):
+            if hashlib.sha256(KERNEL_BLOCK).digest() != KERNEL_DIGEST:
+                errors += 1
+        operations += 16
+    return operations, errors, time.perf_counter() - start
+
+
+def cpu_stress(duration, workers=None):
+    """Run the compute kernel on every core at once. Returns a list of (ops/s, errors) per worker."""
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_compute_kernel, duration) for _ in range(workers)]
+        results = [future.result() for future in futures]
+    return [(operations / seconds, errors) for operations, errors, seconds in results]
+
+
+def memory_stress(size, deadline):
+    """
+    Fill `size` bytes with each test pattern and read it back, until every pattern is done or `deadline` passes.
+    Returns (bytes moved, seconds, mismatched chunks).
+    """
+    size -= size % MEMORY_CHUNK
+    if size <= 0:
+        return 0, 0.0, 0
+    # Chunks are written with slice copies and checked with NumPy, or by slicing out a copy to compare without it.
+    # Comparing a memoryview goes byte by byte in the interpreter, which measures Python rather than the memory.
+    try:
+        np = require("numpy")
+    except MissingDependency:
+        np = None
+    buffer = bytearray(size)
+    array = np.frombuffer(buffer, np.uint8) if np else None
+    moved = 0
+    mismatches = 0
+    start = time.perf_counter()
+    for pattern in MEMORY_PATTERNS:
+        if time.perf_counter() >= deadline:
+            break
+        chunk = bytes([pattern]) * MEMORY_CHUNK
+        for offset in range(0, size, MEMORY_CHUNK):
+            buffer[offset:offset + MEMORY_CHUNK] = chunk
+        for offset in range(0, size, MEMORY_CHUNK):
+            if array is not None:
+                mismatches += bool((array[offset:offset + MEMORY_CHUNK] != pattern).any())
+            else:
+                mismatches += buffer[offset:offset + MEMORY_CHUNK] != chunk
+        moved += 2 * size
+    return moved, time.perf_counter() - start, mismatches
+
+
+def run_burn_in(reader, duration, memory_bytes):
+    """
+    Load every core and sweep `memory_bytes` of RAM for `duration` seconds while monitoring clocks and temperature.
+
+    Returns a dict with per-core ops/s, compute errors, memory GB/s, memory mismatches and whether the ARM clock
+    dropped below its maximum, the temperature crossed the throttle point or the firmware reported throttling.
+    """
+    monitor = Monitor(reader, rate_hz=2.0, capacity=max(16, int(duration * 2) + 4))
+    sampler = threading.Thread(target=monitor.run, args=(duration,), daemon=True)
+    sampler.start()
+
+    memory_result = {}
+
+    def sweep_memory():
+        try:
+            memory_result["value"] = memory_stress(memory_bytes, time.perf_counter() + duration)
+        except Exception as e:
+            memory_result["error"] = e
+
+    # The memory sweep runs alongside the compute workers so the board sees both loads at once
+    memory_thread = threading.Thread(target=sweep_memory, daemon=True)
+    memory_thread.start()
+    try:
+        per_core = cpu_stress(duration)
+    finally:
+        memory_thread.join()
+        sampler.join()
+        monitor.close()
+
+    if "error" in memory_result:
+        raise RuntimeError(f"Memory sweep failed: {memory_result['error']}") from memory_result["error"]
+    moved, memory_seconds, mismatches = memory_result["value"]
+    stats = monitor.summary()
+    max_freq_mhz = (reader.read_int(MAX_FREQ_PATH) or 0) / 1000
+    temp = stats.get("temp_c")
+    throttled = stats.get("throttled")
+
+    min_freq_mhz = None
+    if "arm_freq_mhz" in monitor.sources:
+        timestamps = monitor.buffer.values_timestamps()
+        loaded = [freq for freq, at in zip(monitor.buffer.values("arm_freq_mhz"), timestamps) if at >= WARMUP_SECONDS]
+        min_freq_mhz = min(loaded) if loaded else None
+
+    return {
+        "ops_per_second": [ops for ops, _ in per_core],
+        "compute_errors": sum(errors for _, errors in per_core),
+        "memory_gb_per_second": moved / memory_seconds / 1e9 if memory_seconds else 0.0,
+        "memory_mismatches": mismatches,
+        "min_freq_mhz": min_freq_mhz,
+        "max_freq_mhz": max_freq_mhz or None,
+        "freq_dropped": bool(min_freq_mhz and max_freq_mhz and min_freq_mhz < max_freq_mhz),
+        "max_temp_c": temp["max"] if temp else None,
+        "temp_p95_c": temp["p95"] if temp else None,
+        "over_temp": bool(temp and temp["max"] >= DEFAULT_THRESHOLDS["temp_c"]),
+        "firmware_throttled": bool(throttled and throttled["max"] > 0),
+    }
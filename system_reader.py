@@ -0,0 +1,127 @@
+import os
+
+# Column names of /proc/net/dev, in file order
+NET_DEV_FIELDS = [
+    "rx_bytes", "rx_packets", "rx_errs", "rx_drop", "rx_fifo", "rx_frame", "rx_compressed", "rx_multicast",
+    "tx_bytes", "tx_packets", "tx_errs", "tx_drop", "tx_fifo", "tx_colls", "tx_carrier", "tx_compressed",
+]
+
+
+def _unescape_mount_field(field):
+    # /proc/mounts escapes spaces, tabs, newlines and backslashes as 3 digit octal, e.g. "\040"
+    if "\\" not in field:
+        return field
+    return field.encode().decode("unicode_escape")
+
+
+class SystemReader:
+    """
+    Reads kernel state straight from /proc, /sys and statvfs without spawning any processes.
+
+    Every path is resolved relative to `root`, so the same code can be pointed at a recorded or hand-built copy of
+    /proc and /sys for testing.
+    """
+
+    def __init__(self, root="/"):
+        self.root = root
+
+    def path(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def exists(self, path):
+        return os.path.exists(self.path(path))
+
+    def read_text(self, path, default=None):
+        try:
+            with open(self.path(path), "r") as f:
+                return f.read()
+        except OSError:
+            return default
+
+    def read_value(self, path, default=None):
+        text = self.read_text(path)
+        return default if text is None else text.strip()
+
+    def read_int(self, path, default=None):
+        try:
+            return int(self.read_value(path))
+        except (TypeError, ValueError):
+            return default
+
+    def read_lines(self, path):
+        text = self.read_text(path)
+        return [] if text is None else text.splitlines()
+
+    def list_dir(self, path):
+        try:
+            return sorted(os.listdir(self.path(path)))
+        except OSError:
+            return []
+
+    def net_interfaces(self):
+        return self.list_dir("/sys/class/net")
+
+    def interface_attr(self, interface, attr, default=None):
+        return self.read_value(f"/sys/class/net/{interface}/{attr}", default)
+
+    def carrier(self, interface):
+        """Return True/False for the link state, or None when it can't be read (e.g. the interface is down)."""
+        value = self.interface_attr(interface, "carrier")
+        if value is None or value == "":
+            return None
+        return value == "1"
+
+    def loaded_modules(self):
+        return {line.split()[0] for line in self.read_lines("/proc/modules") if line.strip()}
+
+    def net_dev(self):
+        """Return {interface: {counter: value}} parsed from /proc/net/dev."""
+        stats = {}
+        # The first two lines are column headers
+        for line in self.read_lines("/proc/net/dev")[2:]:
+            if ":" not in line:
+                continue
+            name, counters = line.split(":", 1)
+            values = [int(value) for value in counters.split()]
+            stats[name.strip()] = dict(zip(NET_DEV_FIELDS, values))
+        return stats
+
+    def default_gateway(self, interface):
+        """Return the IPv4 default gateway routed through an interface, from /proc/net/route, or None."""
+        # The first line holds the column headers; addresses are little-endian hex
+        for line in self.read_lines("/proc/net/route")[1:]:
+            fields = line.split()
+            if len(fields) >= 3 and fields[0] == interface and fields[1] == "00000000":
+                gateway = int(fields[2], 16)
+                if gateway:
+                    return ".".join(str((gateway >> shift) & 0xff) for shift in (0, 8, 16, 24))
+        return None
+
+    def mounts(self):
+        """Return a list of (device, mount point, filesystem type) tuples from /proc/mounts."""
+        mounts = []
+        for line in self.read_lines("/proc/mounts"):
+            fields = line.split()
+            if len(fields) >= 3:
+                mounts.append((_unescape_mount_field(fields[0]), _unescape_mount_field(fields[1]), fields[2]))
+        return mounts
+
+    def disk_usage(self, mount_point):
+        """Return (total, used, free) bytes for a mount point, with free being the space available to non-root users."""
+        st = os.statvfs(self.path(mount_point))
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        free = st.f_bavail * st.f_frsize
+        return total, used, free
+
+
+def human_size(num_bytes):
+    """Format a byte count the way `df -h` does, e.g. 29G or 512M."""
+    size = float(num_bytes)
+    for unit in ["B", "K", "M", "G", "T"]:
+        if size < 1024 or unit == "T":
+            break
+        size /= 1024
+    if unit == "B":
+        return str(int(size))
+    return f"{size:.1f}{unit}" if size < 10 else f"{size:.0f}{unit}"
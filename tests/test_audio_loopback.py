@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import diagnostics
+from audio_loopback import AudioError, analyse_capture, loopback
+
+
+def audio_result(monkeypatch, backend):
+    monkeypatch.setattr(diagnostics, "AUDIO_BACKEND", backend)
+    return diagnostics.audio_jack_test()
+
+
+def test_clean_pipe_passes(monkeypatch):
+    result = audio_result(monkeypatch, "pipe")
+    assert result.status == "pass"
+    assert result.metrics["left_dropouts"].value == 0
+
+
+def test_pipe_dropout_is_reported(monkeypatch):
+    result = audio_result(monkeypatch, "pipe:dropout")
+    assert result.status == "fail"
+    assert result.metrics["left_dropouts"].value == 1
+    assert "1 dropout" in result.message
+
+
+def test_silent_pipe_has_no_signal():
+    data, channels = loopback("pipe:silent")
+    with pytest.raises(AudioError, match="No signal"):
+        analyse_capture(data, channels)
+
+
+def test_file_backend_reads_a_capture(tmp_path):
+    data, channels = loopback("pipe")
+    path = tmp_path / "capture.raw"
+    path.write_bytes(data)
+    replayed, replayed_channels = loopback(f"file:{path}", channels=channels)
+    assert replayed == data and replayed_channels == 2
+    assert all(stats.dropouts == 0 for stats in analyse_capture(replayed, replayed_channels))
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import diagnostics
+from camera import DEFAULT_HEIGHT, DEFAULT_WIDTH, analyse_frame, luma_plane, synthetic_frame
+
+
+def camera_result(monkeypatch, pattern):
+    monkeypatch.setattr(diagnostics, "CAMERA_SOURCE", f"synthetic:{pattern}")
+    return diagnostics.camera_port_test()
+
+
+def test_scene_passes(monkeypatch):
+    assert camera_result(monkeypatch, "scene").status == "pass"
+
+
+@pytest.mark.parametrize("pattern, message", [("black", "black frame"), ("noise", "noise rather than an image")])
+def test_dead_sensor_fails(monkeypatch, pattern, message):
+    result = camera_result(monkeypatch, pattern)
+    assert result.status == "fail"
+    assert message in result.message
+
+
+def test_stuck_pixels_warn(monkeypatch):
+    result = camera_result(monkeypatch, "stuck")
+    assert result.status == "warn"
+    assert "stuck pixels" in result.message
+
+
+def test_stuck_pixels_are_counted():
+    stats = analyse_frame(luma_plane(synthetic_frame("stuck"), DEFAULT_WIDTH, DEFAULT_HEIGHT))
+    clean = analyse_frame(luma_plane(synthetic_frame("scene"), DEFAULT_WIDTH, DEFAULT_HEIGHT))
+    assert stats.hot_pixels > 0 and stats.dead_pixels > 0
+    assert clean.hot_pixels == clean.dead_pixels == 0
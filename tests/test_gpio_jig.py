@@ -0,0 +1,25 @@
+from gpio_jig import BOARD_TO_BCM, DEFAULT_JIG, JigFault, SimulatedBank, parse_jig, run_jig_test
+
+PAIRS = parse_jig(DEFAULT_JIG)
+WIRES = [(BOARD_TO_BCM[a], BOARD_TO_BCM[b]) for a, b in PAIRS]
+
+
+def test_intact_jig_has_no_faults():
+    faults, _ = run_jig_test(SimulatedBank(WIRES), PAIRS)
+    assert faults == []
+
+
+def test_broken_pin_is_open():
+    faults, _ = run_jig_test(SimulatedBank(WIRES, open=[BOARD_TO_BCM[12]]), PAIRS)
+    assert JigFault("open", ((12, 13),)) in faults
+    assert all(fault.pairs == ((12, 13),) for fault in faults)
+
+
+def test_stuck_pin():
+    faults, _ = run_jig_test(SimulatedBank(WIRES, stuck={BOARD_TO_BCM[16]: 1}), PAIRS)
+    assert JigFault("stuck high", ((15, 16),)) in faults
+
+
+def test_bridged_pairs():
+    faults, _ = run_jig_test(SimulatedBank(WIRES, bridges=[(BOARD_TO_BCM[8], BOARD_TO_BCM[10])]), PAIRS)
+    assert JigFault("bridged", ((7, 8), (10, 11))) in faults
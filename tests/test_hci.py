@@ -0,0 +1,44 @@
+import os
+
+import diagnostics
+from hci import FakeBackend, SysfsBackend, format_controller
+from system_reader import SystemReader
+
+
+def sysfs_reader(root, rfkill_state):
+    path = os.path.join(root, "sys/class/bluetooth/hci0/rfkill0")
+    os.makedirs(path)
+    with open(os.path.join(path, "state"), "w") as f:
+        f.write(f"{rfkill_state}\n")
+    return SystemReader(root)
+
+
+def test_fake_controller_and_scan(monkeypatch):
+    monkeypatch.setattr(diagnostics, "BLUETOOTH_BACKEND", "fake")
+    monkeypatch.setattr(diagnostics, "BLUETOOTH_SCAN_SECONDS", 1)
+    result = diagnostics.get_bluetooth_info()
+    assert result.status == "pass"
+    assert "Bluetooth 5.0 (Cypress)" in result.message
+    assert result.metrics["devices"].value == 3
+    assert result.metrics["rssi_max"].value == -47
+
+
+def test_fake_backend_without_advertisers_warns(monkeypatch):
+    monkeypatch.setattr(diagnostics, "BLUETOOTH_BACKEND", "fake")
+    monkeypatch.setattr(diagnostics, "BLUETOOTH_SCAN_SECONDS", 1)
+    monkeypatch.setattr(FakeBackend, "ADVERTISERS", {})
+    assert diagnostics.get_bluetooth_info().status == "warn"
+
+
+def test_sysfs_lists_controller(tmp_path):
+    controllers = SysfsBackend(sysfs_reader(str(tmp_path), 1)).controllers()
+    assert [(controller.name, controller.blocked) for controller in controllers] == [("hci0", False)]
+
+
+def test_sysfs_blocked_controller_warns(tmp_path, monkeypatch):
+    monkeypatch.setattr(diagnostics, "BLUETOOTH_BACKEND", "sysfs")
+    monkeypatch.setattr(diagnostics, "reader", sysfs_reader(str(tmp_path), 0))
+    result = diagnostics.bluetooth_availability()
+    assert result.status == "warn"
+    assert "blocked by rfkill" in result.message
+    assert format_controller(SysfsBackend(diagnostics.reader).controllers()[0]) == "hci0, blocked by rfkill"
@@ -0,0 +1,37 @@
+import asyncio
+import errno
+import socket
+
+import pytest
+
+from net_probe import Target, probe, format_probe
+
+
+def test_probe_reaches_a_local_listener():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    try:
+        port = listener.getsockname()[1]
+        result = asyncio.run(probe("lo", Target(f"tcp:127.0.0.1:{port}", "tcp", "127.0.0.1", port)))
+    finally:
+        listener.close()
+    assert result.reachable
+    assert result.bind_errno in (None, errno.EPERM)
+    assert "reachable in" in format_probe(result)
+
+
+def test_probe_reports_a_missing_interface():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    try:
+        port = listener.getsockname()[1]
+        result = asyncio.run(probe("nosuch0", Target("gateway", "tcp", "127.0.0.1", port)))
+    finally:
+        listener.close()
+    if result.bind_errno == errno.EPERM:
+        pytest.skip("binding to an interface needs CAP_NET_RAW, and the kernel checks that first")
+    assert not result.reachable
+    assert result.bind_errno == errno.ENODEV
+    assert result.error == "nosuch0: no such device"
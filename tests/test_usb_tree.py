@@ -0,0 +1,66 @@
+import os
+
+from system_reader import SystemReader
+from usb_tree import PORT_MAPS, list_devices, fell_back, root_hubs
+
+PI4 = 0x11
+USB_DEVICES = "sys/bus/usb/devices"
+
+
+def write(root, path, value):
+    path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb" if isinstance(value, bytes) else "w") as f:
+        f.write(value)
+
+
+def pi4_tree(root, name, speed, version, bos=b""):
+    """A Pi 4's two buses, the VL805's internal hub and a USB stick called `name`."""
+    for hub, (hub_speed, ports) in {"usb1": (480, 1), "usb2": (5000, 4), "1-1": (480, 4)}.items():
+        for attr, value in {"speed": hub_speed, "maxchild": ports, "bDeviceClass": "09", "version": " 2.10"}.items():
+            write(root, f"{USB_DEVICES}/{hub}/{attr}", f"{value}\n")
+    for attr, value in {"speed": speed, "version": version, "bDeviceClass": "00", "product": "Bench Stick"}.items():
+        write(root, f"{USB_DEVICES}/{name}/{attr}", f"{value}\n")
+    write(root, f"{USB_DEVICES}/{name}/{name}:1.0/bInterfaceClass", "08\n")
+    if bos:
+        write(root, f"{USB_DEVICES}/{name}/bos_descriptors", bos)
+    return SystemReader(root)
+
+
+def stick(reader, name):
+    return next(device for device in list_devices(reader) if device.name == name)
+
+
+def test_stick_at_high_speed_on_usb3_port_fell_back(tmp_path):
+    # A USB 3 stick that falls back enumerates on the USB 2 bus with bcdUSB 2.10
+    reader = pi4_tree(str(tmp_path), "1-1.1", 480, " 2.10")
+    assert fell_back(stick(reader, "1-1.1"), PORT_MAPS[PI4], root_hubs(reader)) is True
+
+
+def test_stick_at_superspeed_did_not_fall_back(tmp_path):
+    reader = pi4_tree(str(tmp_path), "2-1", 5000, " 3.20")
+    assert fell_back(stick(reader, "2-1"), PORT_MAPS[PI4], root_hubs(reader)) is False
+
+
+def test_stick_on_usb2_port_did_not_fall_back(tmp_path):
+    reader = pi4_tree(str(tmp_path), "1-1.3", 480, " 2.00")
+    assert fell_back(stick(reader, "1-1.3"), PORT_MAPS[PI4], root_hubs(reader)) is False
+
+
+def test_superspeed_capability_in_bos_descriptor(tmp_path):
+    # BOS header, USB 2.0 extension, SuperSpeed USB device capability
+    bos = bytes([5, 0x0f, 22, 0, 2]) + bytes([7, 0x10, 0x02, 0x1e, 0xf4, 0, 0]) + \
+        bytes([10, 0x10, 0x03, 0, 0x0e, 0, 1, 0x0a, 0xff, 0x07])
+    reader = pi4_tree(str(tmp_path), "1-1.1", 480, " 2.10", bos)
+    assert stick(reader, "1-1.1").max_speed == 5000
+
+
+def test_usb_ports_test_fails_a_fallen_back_stick(tmp_path, monkeypatch):
+    import diagnostics
+    root = str(tmp_path)
+    reader = pi4_tree(root, "1-1.1", 480, " 2.10")
+    write(root, "proc/cpuinfo", "Revision\t: c03114\nModel\t\t: Raspberry Pi 4 Model B Rev 1.4\n")
+    monkeypatch.setattr(diagnostics, "reader", reader)
+    result = diagnostics.usb_ports_test()
+    assert result.status == "fail"
+    assert "USB 3 port 1" in result.message
@@ -0,0 +1,198 @@
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+from net_probe import SO_BINDTODEVICE
+
+DEFAULT_PORT = 5201
+DEFAULT_STREAMS = 4
+DEFAULT_DURATION = 5.0
+LATENCY_SAMPLES = 20
+
+# Every connection starts with a header: magic, mode and how long to run for
+MAGIC = b"PIPT"
+HEADER = struct.Struct("!4scd")
+UPLOAD, DOWNLOAD, ECHO = b"u", b"d", b"e"
+COUNT = struct.Struct("!Q")
+
+# Sent straight from the page cache with sendfile, so no payload is ever copied through Python
+BLOCK_SIZE = 1024 * 1024
+RECEIVE_SIZE = 256 * 1024
+
+
+def _payload_file():
+    """An in-memory file of BLOCK_SIZE zero bytes to sendfile() from."""
+    f = os.fdopen(os.memfd_create("throughput-payload"), "w+b")
+    f.truncate(BLOCK_SIZE)
+    return f
+
+
+def _send_for(sock, payload, duration):
+    """Send as fast as possible for `duration` seconds. Returns the number of bytes sent."""
+    deadline = time.monotonic() + duration
+    sent = 0
+    while time.monotonic() < deadline:
+        sent += sock.sendfile(payload, 0, BLOCK_SIZE)
+    return sent
+
+
+def _receive_all(sock):
+    """Receive into one reused buffer until the peer closes. Returns the number of bytes received."""
+    buffer = memoryview(bytearray(RECEIVE_SIZE))
+    received = 0
+    while True:
+        count = sock.recv_into(buffer)
+        if not count:
+            return received
+        received += count
+
+
+def _read_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by the peer")
+        data += chunk
+    return data
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        magic, mode, duration = HEADER.unpack(_read_exact(self.request, HEADER.size))
+        if magic != MAGIC:
+            return
+        if mode == UPLOAD:
+            # Report what actually arrived, which is what the client's upload rate is based on
+            self.request.sendall(COUNT.pack(_receive_all(self.request)))
+        elif mode == DOWNLOAD:
+            with _payload_file() as payload:
+                _send_for(self.request, payload, duration)
+        elif mode == ECHO:
+            while True:
+                data = self.request.recv(64)
+                if not data:
+                    return
+                self.request.sendall(data)
+
+
+class ThroughputServer(socketserver.ThreadingTCPServer):
+    """The bench side: accepts any number of streams, one thread each."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="", port=DEFAULT_PORT):
+        super().__init__((host, port), _Handler)
+
+
+def _connect(host, port, mode, duration, interface, timeout):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    if interface:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, interface.encode() + b"\0")
+        except PermissionError:
+            # Needs CAP_NET_RAW; without it the kernel picks the route
+            pass
+    sock.connect((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(HEADER.pack(MAGIC, mode, duration))
+    return sock
+
+
+def _run_streams(host, port, mode, streams, duration, interface):
+    """Run `streams` parallel connections in one direction. Returns the transfer rate in bits per second."""
+    counts = [0] * streams
+    errors = []
+
+    def stream(index):
+        try:
+            # Allow for the server to be slow to start sending, but never hang for good
+            with _connect(host, port, mode, duration, interface, duration + 10) as sock:
+                if mode == UPLOAD:
+                    with _payload_file() as payload:
+                        _send_for(sock, payload, duration)
+                    sock.shutdown(socket.SHUT_WR)
+                    counts[index] = COUNT.unpack(_read_exact(sock, COUNT.size))[0]
+                else:
+                    counts[index] = _receive_all(sock)
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=stream, args=(i,), daemon=True) for i in range(streams)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    if errors:
+        raise errors[0]
+    return sum(counts) * 8 / elapsed
+
+
+def _latency(host, port, interface, samples=LATENCY_SAMPLES):
+    """Round trip times in seconds of small messages echoed by the server."""
+    times = []
+    with _connect(host, port, ECHO, 0, interface, 5) as sock:
+        for _ in range(samples):
+            start = time.perf_counter()
+            sock.sendall(b"x")
+            _read_exact(sock, 1)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def measure(host, port=DEFAULT_PORT, streams=DEFAULT_STREAMS, duration=DEFAULT_DURATION, interface=None):
+    """
+    Measure upload and download throughput to a ThroughputServer over `streams` parallel TCP connections for
+    `duration` seconds each, plus round trip latency and jitter. `interface` binds the client to one NIC (needs root).
+    Returns a dict of upload_mbps, download_mbps, latency_ms and jitter_ms.
+    """
+    times = _latency(host, port, interface)
+    # Jitter: the mean difference between consecutive round trips
+    jitter = sum(abs(b - a) for a, b in zip(times, times[1:])) / (len(times) - 1)
+    return {
+        "upload_mbps": _run_streams(host, port, UPLOAD, streams, duration, interface) / 1e6,
+        "download_mbps": _run_streams(host, port, DOWNLOAD, streams, duration, interface) / 1e6,
+        "latency_ms": sorted(times)[len(times) // 2] * 1000,
+        "jitter_ms": jitter * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure network throughput between a board and a bench host")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server = commands.add_parser("server", help="run on the bench host")
+    server.add_argument("--bind", default="")
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client = commands.add_parser("client", help="measure against a running server")
+    client.add_argument("host")
+    client.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client.add_argument("--streams", type=int, default=DEFAULT_STREAMS)
+    client.add_argument("--duration", type=float, default=DEFAULT_DURATION)
+    client.add_argument("--interface", default=None, help="bind to this interface, e.g. eth0 (needs root)")
+    args = parser.parse_args()
+
+    if args.command == "server":
+        with ThroughputServer(args.bind, args.port) as server:
+            print(f"Listening on port {args.port}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    result = measure(args.host, args.port, args.streams, args.duration, args.interface)
+    print(f"Upload: {result['upload_mbps']:.1f} Mbps, Download: {result['download_mbps']:.1f} Mbps, "
+          f"Latency: {result['latency_ms']:.2f} ms, Jitter: {result['jitter_ms']:.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import re
+import struct
+from collections import namedtuple
+
+USB_DEVICES = "/sys/bus/usb/devices"
+
+# sysfs names: "usb2" is bus 2's root hub, "2-1.3" the device on port 3 of the hub on port 1 of bus 2, and names with
+# a colon ("2-1.3:1.0") are interfaces
+_ROOT_HUB = re.compile(r"^usb(\d+)$")
+_DEVICE = re.compile(r"^(\d+)-([\d.]+)$")
+
+SUPERSPEED = 5000
+MASS_STORAGE_CLASS = "08"
+# BOS descriptor (USB 3.2 section 9.6.2) and the device capability types that mean the device can run at SuperSpeed
+BOS_DESCRIPTOR = 0x0f
+DEVICE_CAPABILITY = 0x10
+SUPERSPEED_CAPABILITIES = (0x03, 0x0a)
+
+# A USB device, from its sysfs attributes. Speeds are in Mbit/s:
+#   speed:     what the link negotiated
+#   max_speed: the fastest the device supports, 5000 for any USB 3 device (neither its BOS descriptor nor bcdUSB
+#              tell 3.x generations apart). A USB 3 device that came up at USB 2 speed reports bcdUSB 2.10, so it
+#              only shows as USB 3 through the SuperSpeed capability in its BOS descriptor.
+#   bus_speed: the fastest its bus runs, from the root hub
+#   max_power: milliamps the device asked the port for
+#   mass_storage: one of its interfaces is USB mass storage
+#   block_devices: names of the disks it provides when it's mass storage, e.g. ["sda"]
+UsbDevice = namedtuple("UsbDevice", ["name", "bus", "port_path", "speed", "max_speed", "bus_speed", "max_power",
+                                     "product", "vendor_id", "product_id", "is_hub", "mass_storage",
+                                     "block_devices"])
+
+# Physical ports per board type id (see board_info.BOARD_TYPES): sysfs device name -> (label, USB 3 port). A USB 3
+# port has two entries, one on the USB 2 bus and one on the USB 3 bus of the same controller, since a device comes up
+# on whichever pair of lines works. Boards without an entry are reported by sysfs name only.
+PORT_MAPS = {
+    # LAN9514 hub on 1-1, with the Ethernet controller on its first port
+    0x03: {"1-1.2": ("USB port 1", False), "1-1.3": ("USB port 2", False),
+           "1-1.4": ("USB port 3", False), "1-1.5": ("USB port 4", False)},
+    # VL805: the USB 2 lines go through its internal hub on 1-1, the USB 3 lines straight to its root hub
+    0x11: {"1-1.1": ("USB 3 port 1", True), "2-1": ("USB 3 port 1", True),
+           "1-1.2": ("USB 3 port 2", True), "2-2": ("USB 3 port 2", True),
+           "1-1.3": ("USB 2 port 1", False), "1-1.4": ("USB 2 port 2", False)},
+    # RP1 has two controllers, each with one USB 3 port and one USB 2 port
+    0x17: {"1-1": ("USB 3 port 1", True), "2-1": ("USB 3 port 1", True), "1-2": ("USB 2 port 1", False),
+           "3-1": ("USB 3 port 2", True), "4-1": ("USB 3 port 2", True), "3-2": ("USB 2 port 2", False)},
+}
+PORT_MAPS[0x04] = PORT_MAPS[0x08] = PORT_MAPS[0x03]  # 2B and 3B share the B+ layout
+
+
+def _speed(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _max_speed(version):
+    try:
+        version = float(version)
+    except (TypeError, ValueError):
+        return None
+    return SUPERSPEED if version >= 3 else 480 if version >= 2 else 12
+
+
+def superspeed_capable(reader, name):
+    """Whether the device's BOS descriptor lists a SuperSpeed or SuperSpeedPlus capability."""
+    try:
+        with open(reader.path(f"{USB_DEVICES}/{name}/bos_descriptors"), "rb") as f:
+            data = f.read()
+    except OSError:
+        return False
+    if len(data) < 5 or data[1] != BOS_DESCRIPTOR:
+        return False
+    offset, end = data[0], min(len(data), struct.unpack("<H", data[2:4])[0])
+    while offset + 3 <= end and data[offset] >= 3:
+        if data[offset + 1] == DEVICE_CAPABILITY and data[offset + 2] in SUPERSPEED_CAPABILITIES:
+            return True
+        offset += data[offset]
+    return False
+
+
+def mass_storage(reader, name):
+    return any(reader.read_value(f"{USB_DEVICES}/{name}/{interface}/bInterfaceClass") == MASS_STORAGE_CLASS
+               for interface in reader.list_dir(f"{USB_DEVICES}/{name}") if interface.startswith(f"{name}:"))
+
+
+def _milliamps(value):
+    match = re.match(r"(\d+)", value or "")
+    return int(match.group(1)) if match else None
+
+
+def block_devices(reader, name):
+    """The disks a mass-storage device provides, found under <interface>/hostN/targetN/N:N:N:N/block."""
+    base = f"{USB_DEVICES}/{name}"
+    disks = []
+    for interface in reader.list_dir(base):
+        if not interface.startswith(f"{name}:"):
+            continue
+        for host in reader.list_dir(f"{base}/{interface}"):
+            if not host.startswith("host"):
+                continue
+            for target in reader.list_dir(f"{base}/{interface}/{host}"):
+                if not target.startswith("target"):
+                    continue
+                for lun in reader.list_dir(f"{base}/{interface}/{host}/{target}"):
+                    disks.extend(reader.list_dir(f"{base}/{interface}/{host}/{target}/{lun}/block"))
+    return disks
+
+
+def root_hubs(reader):
+    """{bus number: (speed in Mbit/s, number of ports)} for each root hub."""
+    hubs = {}
+    for name in reader.list_dir(USB_DEVICES):
+        match = _ROOT_HUB.match(name)
+        if match:
+            hubs[int(match.group(1))] = (_speed(reader.read_value(f"{USB_DEVICES}/{name}/speed")),
+                                         reader.read_int(f"{USB_DEVICES}/{name}/maxchild", 0))
+    return hubs
+
+
+def list_devices(reader, hubs=None):
+    """Every device below the root hubs, in bus and port order."""
+    hubs = root_hubs(reader) if hubs is None else hubs
+    devices = []
+    for name in reader.list_dir(USB_DEVICES):
+        match = _DEVICE.match(name)
+        if not match:
+            continue
+        base = f"{USB_DEVICES}/{name}"
+        bus = int(match.group(1))
+        max_speed = SUPERSPEED if superspeed_capable(reader, name) else _max_speed(reader.read_value(f"{base}/version"))
+        devices.append(UsbDevice(
+            name, bus, match.group(2), _speed(reader.read_value(f"{base}/speed")), max_speed,
+            hubs.get(bus, (None, 0))[0], _milliamps(reader.read_value(f"{base}/bMaxPower")),
+            reader.read_value(f"{base}/product"), reader.read_value(f"{base}/idVendor"),
+            reader.read_value(f"{base}/idProduct"), reader.read_value(f"{base}/bDeviceClass") == "09",
+            mass_storage(reader, name), block_devices(reader, name)))
+    devices.sort(key=lambda device: (device.bus, [int(port) for port in device.port_path.split(".")]))
+    return devices
+
+
+def physical_port(device, port_map):
+    """The (label, USB 3 port) a device is plugged into, allowing for hubs in between, or None when unmapped."""
+    parts = device.name.split(".")
+    for length in range(len(parts), 0, -1):
+        port = port_map.get(".".join(parts[:length]))
+        if port:
+            return port
+    return None
+
+
+def fell_back(device, port_map, hubs):
+    """
+    Whether a device on a USB 3 port came up at USB 2 speed or slower: True for a USB 3 or mass-storage device on a
+    mapped USB 3 port (a bench stick is expected to be USB 3), None (can't tell) for a USB 3 device on an unmapped
+    port of a board with a USB 3 bus, and False otherwise.
+    """
+    if not device.speed or device.speed >= SUPERSPEED:
+        return False
+    usb3 = bool(device.max_speed and device.max_speed >= SUPERSPEED)
+    port = physical_port(device, port_map)
+    if port:
+        return port[1] and (usb3 or device.mass_storage)
+    if not usb3:
+        return False
+    return None if any(speed and speed >= SUPERSPEED for speed, _ in hubs.values()) else False
+
+
+def format_speed(mbps):
+    if mbps is None:
+        return "unknown speed"
+    return f"{mbps / 1000:g} Gbit/s" if mbps >= 1000 else f"{mbps:g} Mbit/s"
+
+
+def format_device(device, port_map=None):
+    """e.g. "1-1.1 (USB 3 port 1): Ultra [0781:5581], 480 Mbit/s (device 5 Gbit/s, bus 480 Mbit/s), 224 mA, sda"."""
+    port = physical_port(device, port_map or {})
+    text = device.name + (f" ({port[0]})" if port else "")
+    text += f": {device.product or 'unnamed device'} [{device.vendor_id}:{device.product_id}]"
+    text += f", {format_speed(device.speed)} (device {format_speed(device.max_speed)}, " \
+            f"bus {format_speed(device.bus_speed)})"
+    if device.max_power is not None:
+        text += f", {device.max_power} mA"
+    if device.is_hub:
+        text += ", hub"
+    if device.block_devices:
+        text += ", " + ", ".join(device.block_devices)
+    return text
@@ -0,0 +1,470 @@
+import argparse
+import errno
+import json
+import os
+import socket
+import struct
+import sys
+import time
+from collections import namedtuple
+
+# The survey replayed when no recording is given: a bench access point on 5 GHz with a few neighbours
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "nl80211-wlan0.json")
+
+# Generic netlink (linux/netlink.h, linux/genetlink.h)
+NETLINK_GENERIC = 16
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLA_F_NESTED = 0x8000
+NLA_TYPE_MASK = 0x3fff
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+# nl80211 (linux/nl80211.h)
+NL80211_CMD_GET_STATION = 17
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_TRIGGER_SCAN = 33
+NL80211_CMD_NEW_SCAN_RESULTS = 34
+NL80211_CMD_SCAN_ABORTED = 35
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_STA_INFO = 21
+NL80211_ATTR_SCAN_FREQUENCIES = 44
+NL80211_ATTR_SCAN_SSIDS = 45
+NL80211_ATTR_BSS = 47
+NL80211_BSS_BSSID = 1
+NL80211_BSS_FREQUENCY = 2
+NL80211_BSS_INFORMATION_ELEMENTS = 6
+NL80211_BSS_SIGNAL_MBM = 7
+NL80211_BSS_STATUS = 9
+NL80211_BSS_SEEN_MS_AGO = 10
+NL80211_BSS_STATUS_ASSOCIATED = 1
+NL80211_STA_INFO_SIGNAL = 7
+NL80211_STA_INFO_TX_BITRATE = 8
+NL80211_STA_INFO_TX_PACKETS = 10
+NL80211_STA_INFO_TX_RETRIES = 11
+NL80211_STA_INFO_TX_FAILED = 12
+NL80211_STA_INFO_SIGNAL_AVG = 13
+NL80211_STA_INFO_RX_BITRATE = 14
+NL80211_STA_INFO_BEACON_LOSS = 18
+NL80211_RATE_INFO_BITRATE = 1
+NL80211_RATE_INFO_BITRATE32 = 5
+
+NLMSGHDR = struct.Struct("=IHHII")
+GENLMSGHDR = struct.Struct("=BBH")
+NLATTR = struct.Struct("=HH")
+
+# Seconds to wait for a triggered scan to finish
+SCAN_TIMEOUT = 10.0
+
+# A network seen in a scan. signal_dbm is None when the driver doesn't report it in dBm.
+BSS = namedtuple("BSS", ["bssid", "ssid", "frequency", "channel", "signal_dbm", "associated", "seen_ms_ago"])
+
+# The link to the access point the interface is associated with. Fields the source can't report are None;
+# /proc/net/wireless only has the signal, retries and missed beacons.
+Link = namedtuple("Link", ["bssid", "ssid", "frequency", "signal_dbm", "signal_avg_dbm", "tx_bitrate_mbps",
+                           "rx_bitrate_mbps", "tx_packets", "tx_retries", "tx_failed", "beacon_loss"])
+
+# What survey() found. source is "nl80211", "replay" or "proc"; scanned is False when the networks are the
+# driver's cached results (no scan could be started) or there are none.
+WifiReport = namedtuple("WifiReport", ["interface", "source", "scanned", "networks", "link", "seconds"])
+
+# Signal strength grades, strongest first; anything weaker is "poor"
+SIGNAL_GRADES = [(-55, "excellent"), (-67, "good"), (-75, "fair")]
+
+
+def _align4(length):
+    return (length + 3) & ~3
+
+
+def nla(attr_type, payload):
+    """Encode one netlink attribute."""
+    return NLATTR.pack(NLATTR.size + len(payload), attr_type) + payload + bytes(_align4(len(payload)) - len(payload))
+
+
+def parse_attrs(data):
+    """Decode a run of netlink attributes into {type: payload}."""
+    attrs = {}
+    offset = 0
+    while offset + NLATTR.size <= len(data):
+        length, attr_type = NLATTR.unpack_from(data, offset)
+        if length < NLATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + NLATTR.size:offset + length]
+        offset += _align4(length)
+    return attrs
+
+
+def parse_messages(data):
+    """Split a buffer into netlink messages. Yields (type, flags, seq, payload, raw message)."""
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, flags, seq, data[offset + NLMSGHDR.size:offset + length], data[offset:offset + length]
+        offset += _align4(length)
+
+
+def _u32(data):
+    return struct.unpack("=I", data[:4])[0]
+
+
+def frequency_channel(frequency):
+    if frequency == 2484:
+        return 14
+    if 2412 <= frequency < 2484:
+        return (frequency - 2407) // 5
+    if 5000 <= frequency < 5925:
+        return (frequency - 5000) // 5
+    if 5950 <= frequency <= 7125:
+        return (frequency - 5950) // 5
+    return None
+
+
+def channel_frequency(channel):
+    """MHz of a 2.4 or 5 GHz channel number."""
+    if channel == 14:
+        return 2484
+    return 2407 + 5 * channel if channel < 14 else 5000 + 5 * channel
+
+
+def _ssid(elements):
+    # Information elements are (id, length, data); the SSID is element 0. Hidden networks have an empty one.
+    offset = 0
+    while offset + 2 <= len(elements):
+        element_id, length = elements[offset], elements[offset + 1]
+        if element_id == 0:
+            return elements[offset + 2:offset + 2 + length].decode("utf-8", "replace").strip("\0")
+        offset += 2 + length
+    return ""
+
+
+def parse_bss(payload):
+    """A BSS from one NL80211_CMD_GET_SCAN reply (without the genetlink header), or None."""
+    bss = parse_attrs(parse_attrs(payload).get(NL80211_ATTR_BSS, b""))
+    if NL80211_BSS_BSSID not in bss:
+        return None
+    frequency = _u32(bss[NL80211_BSS_FREQUENCY]) if NL80211_BSS_FREQUENCY in bss else None
+    signal = struct.unpack("=i", bss[NL80211_BSS_SIGNAL_MBM][:4])[0] / 100 if NL80211_BSS_SIGNAL_MBM in bss else None
+    return BSS(
+        bssid=":".join(f"{byte:02x}" for byte in bss[NL80211_BSS_BSSID]),
+        ssid=_ssid(bss.get(NL80211_BSS_INFORMATION_ELEMENTS, b"")),
+        frequency=frequency,
+        channel=frequency_channel(frequency) if frequency else None,
+        signal_dbm=signal,
+        associated=NL80211_BSS_STATUS in bss and _u32(bss[NL80211_BSS_STATUS]) == NL80211_BSS_STATUS_ASSOCIATED,
+        seen_ms_ago=_u32(bss[NL80211_BSS_SEEN_MS_AGO]) if NL80211_BSS_SEEN_MS_AGO in bss else None,
+    )
+
+
+def _bitrate(data):
+    # Units of 100 kbit/s; the 32 bit field is only present when the rate doesn't fit in 16
+    if data is None:
+        return None
+    rate = parse_attrs(data)
+    if NL80211_RATE_INFO_BITRATE32 in rate:
+        return _u32(rate[NL80211_RATE_INFO_BITRATE32]) / 10
+    if NL80211_RATE_INFO_BITRATE in rate:
+        return struct.unpack("=H", rate[NL80211_RATE_INFO_BITRATE][:2])[0] / 10
+    return None
+
+
+def parse_station(payload, networks=()):
+    """A Link from one NL80211_CMD_GET_STATION reply, named after the matching network in `networks`."""
+    attrs = parse_attrs(payload)
+    info = parse_attrs(attrs.get(NL80211_ATTR_STA_INFO, b""))
+    bssid = ":".join(f"{byte:02x}" for byte in attrs.get(NL80211_ATTR_MAC, b""))
+    network = next((bss for bss in networks if bss.bssid == bssid), None)
+
+    def signed(field):
+        return struct.unpack("=b", info[field][:1])[0] if field in info else None
+
+    def counter(field):
+        return _u32(info[field]) if field in info else None
+
+    return Link(
+        bssid=bssid or None,
+        ssid=network.ssid if network else None,
+        frequency=network.frequency if network else None,
+        signal_dbm=signed(NL80211_STA_INFO_SIGNAL),
+        signal_avg_dbm=signed(NL80211_STA_INFO_SIGNAL_AVG),
+        tx_bitrate_mbps=_bitrate(info.get(NL80211_STA_INFO_TX_BITRATE)),
+        rx_bitrate_mbps=_bitrate(info.get(NL80211_STA_INFO_RX_BITRATE)),
+        tx_packets=counter(NL80211_STA_INFO_TX_PACKETS),
+        tx_retries=counter(NL80211_STA_INFO_TX_RETRIES),
+        tx_failed=counter(NL80211_STA_INFO_TX_FAILED),
+        beacon_loss=counter(NL80211_STA_INFO_BEACON_LOSS),
+    )
+
+
+class Nl80211:
+    """
+    A generic netlink socket talking to nl80211, the interface of cfg80211 wireless drivers. Raises OSError when
+    the kernel has no generic netlink or no nl80211 (cfg80211 isn't loaded).
+
+    Set `recorded` to a dict to keep the raw replies to get_scan and get_station, for replaying with ReplayNl80211.
+    """
+
+    def __init__(self, timeout=2.0):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self.timeout = timeout
+        self.seq = int(time.time())
+        self.events = []
+        self.recorded = None
+        try:
+            self.sock.bind((0, 0))
+            self.sock.settimeout(timeout)
+            reply = self._request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY, nla(CTRL_ATTR_FAMILY_NAME, b"nl80211\0"))
+        except OSError:
+            self.sock.close()
+            raise
+        family = parse_attrs(reply[0])
+        self.family_id = struct.unpack("=H", family[CTRL_ATTR_FAMILY_ID][:2])[0]
+        self.groups = {}
+        for group in parse_attrs(family.get(CTRL_ATTR_MCAST_GROUPS, b"")).values():
+            fields = parse_attrs(group)
+            self.groups[fields[CTRL_ATTR_MCAST_GRP_NAME].rstrip(b"\0").decode()] = \
+                _u32(fields[CTRL_ATTR_MCAST_GRP_ID])
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, family, command, attrs=b"", dump=False, record=None):
+        """Send a request and return the attribute payloads of the replies. Raises OSError for a netlink error."""
+        self.seq += 1
+        # Dumps end with NLMSG_DONE; other requests ask for an acknowledgement to know when the replies are over
+        flags = NLM_F_REQUEST | (NLM_F_DUMP if dump else NLM_F_ACK)
+        body = GENLMSGHDR.pack(command, 1, 0) + attrs
+        self.sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(body), family, flags, self.seq, 0) + body)
+        payloads = []
+        raw = []
+        while True:
+            done = False
+            for msg_type, _, seq, payload, message in parse_messages(self.sock.recv(1 << 18)):
+                if seq != self.seq:
+                    # A multicast event, such as a scan finishing
+                    self.events.append((msg_type, payload))
+                    continue
+                raw.append(message)
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from("=i", payload)[0]
+                    if error:
+                        raise OSError(-error, f"Generic netlink command {command} failed: {os.strerror(-error)}")
+                    done = True
+                elif msg_type == NLMSG_DONE:
+                    done = True
+                else:
+                    payloads.append(payload[GENLMSGHDR.size:])
+            if done:
+                break
+        if record and self.recorded is not None:
+            self.recorded[record] = b"".join(raw)
+        return payloads
+
+    def trigger_scan(self, ifindex, frequencies=(), timeout=SCAN_TIMEOUT):
+        """
+        Scan for networks, on the given frequencies (MHz) or all of them, and wait for the scan to finish.
+        Returns False when no scan could be started, as without CAP_NET_ADMIN, or it didn't finish in time.
+        """
+        if "scan" not in self.groups:
+            return False
+        self.sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, self.groups["scan"])
+        # One empty SSID makes it an active scan for any network, as `iw scan` does
+        attrs = nla(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex))
+        attrs += nla(NL80211_ATTR_SCAN_SSIDS | NLA_F_NESTED, nla(1, b""))
+        if frequencies:
+            attrs += nla(NL80211_ATTR_SCAN_FREQUENCIES | NLA_F_NESTED,
+                         b"".join(nla(i, struct.pack("=I", frequency)) for i, frequency in enumerate(frequencies)))
+        try:
+            self._request(self.family_id, NL80211_CMD_TRIGGER_SCAN, attrs)
+        except PermissionError:
+            return False
+        except OSError as e:
+            # Someone else's scan is already running; its results will do
+            if e.errno != errno.EBUSY:
+                raise
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                while self.events:
+                    msg_type, payload = self.events.pop(0)
+                    command = payload[0] if payload else None
+                    if msg_type == self.family_id and command in (NL80211_CMD_NEW_SCAN_RESULTS,
+                                                                  NL80211_CMD_SCAN_ABORTED):
+                        attrs = parse_attrs(payload[GENLMSGHDR.size:])
+                        if _u32(attrs.get(NL80211_ATTR_IFINDEX, b"\0\0\0\0")) == ifindex:
+                            return command == NL80211_CMD_NEW_SCAN_RESULTS
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.sock.settimeout(remaining)
+                for msg_type, _, _, payload, _ in parse_messages(self.sock.recv(1 << 18)):
+                    self.events.append((msg_type, payload))
+        except socket.timeout:
+            return False
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def get_scan(self, ifindex):
+        """The networks in the driver's latest scan results, parsed as each reply arrives."""
+        replies = self._request(self.family_id, NL80211_CMD_GET_SCAN,
+                                nla(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex)), dump=True, record="get_scan")
+        return [bss for bss in map(parse_bss, replies) if bss]
+
+    def get_station(self, ifindex, networks=()):
+        """The Link to the access point, or None when the interface isn't associated."""
+        replies = self._request(self.family_id, NL80211_CMD_GET_STATION,
+                                nla(NL80211_ATTR_IFINDEX, struct.pack("=I", ifindex)), dump=True,
+                                record="get_station")
+        return parse_station(replies[0], networks) if replies else None
+
+
+class ReplayNl80211:
+    """Serves nl80211 replies recorded with `python3 wifi.py record`, for testing without a wireless card."""
+
+    def __init__(self, path=FIXTURE):
+        with open(path) as f:
+            recording = json.load(f)
+        self.replies = {name: bytes.fromhex(data) for name, data in recording["replies"].items()}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def _payloads(self, name):
+        return [payload[GENLMSGHDR.size:] for msg_type, _, _, payload, _ in parse_messages(self.replies.get(name, b""))
+                if msg_type not in (NLMSG_ERROR, NLMSG_DONE)]
+
+    def trigger_scan(self, ifindex, frequencies=(), timeout=SCAN_TIMEOUT):
+        return False
+
+    def get_scan(self, ifindex):
+        return [bss for bss in map(parse_bss, self._payloads("get_scan")) if bss]
+
+    def get_station(self, ifindex, networks=()):
+        replies = self._payloads("get_station")
+        return parse_station(replies[0], networks) if replies else None
+
+
+def proc_link(reader, interface):
+    """The link as /proc/net/wireless reports it (wireless extensions), or None when it isn't listed."""
+    # The first two lines are column headers; the level is in dBm on cfg80211 drivers
+    for line in reader.read_lines("/proc/net/wireless")[2:]:
+        name, _, counters = line.partition(":")
+        fields = counters.split()
+        if name.strip() != interface or len(fields) < 10:
+            continue
+        level = float(fields[2].rstrip("."))
+        return Link(None, None, None, level if level < 0 else None, None, None, None, None, int(fields[7]), None,
+                    int(fields[9]))
+    return None
+
+
+def survey(interface, reader, replay=None, scan=True, frequencies=()):
+    """
+    Scan for networks and read the link's state over nl80211, or from a recording when `replay` is a path (True
+    replays FIXTURE). Falls back to /proc/net/wireless, which has the link's signal but no scan, when nl80211 isn't
+    available.
+    Returns a WifiReport with the networks strongest first.
+    """
+    start = time.perf_counter()
+    if replay is True:
+        replay = FIXTURE
+    try:
+        connection = ReplayNl80211(replay) if replay else Nl80211()
+    except OSError:
+        return WifiReport(interface, "proc", False, [], proc_link(reader, interface), time.perf_counter() - start)
+    with connection:
+        ifindex = 0 if replay else socket.if_nametoindex(interface)
+        scanned = scan and connection.trigger_scan(ifindex, frequencies)
+        networks = connection.get_scan(ifindex)
+        link = connection.get_station(ifindex, networks)
+    networks.sort(key=lambda bss: -999 if bss.signal_dbm is None else bss.signal_dbm, reverse=True)
+    return WifiReport(interface, "replay" if replay else "nl80211", scanned, networks, link,
+                      time.perf_counter() - start)
+
+
+def grade(signal_dbm):
+    if signal_dbm is None:
+        return "unknown"
+    for threshold, name in SIGNAL_GRADES:
+        if signal_dbm >= threshold:
+            return name
+    return "poor"
+
+
+def format_bss(bss):
+    signal = "?" if bss.signal_dbm is None else f"{bss.signal_dbm:g} dBm"
+    return f"{bss.ssid or '(hidden)'} ch {bss.channel} {signal}{' (associated)' if bss.associated else ''}"
+
+
+def record(interface, path, frequencies=()):
+    """Scan and save the raw nl80211 replies to `path` as a fixture for ReplayNl80211."""
+    with Nl80211() as connection:
+        connection.recorded = {}
+        ifindex = socket.if_nametoindex(interface)
+        connection.trigger_scan(ifindex, frequencies)
+        connection.get_station(ifindex, connection.get_scan(ifindex))
+        replies = connection.recorded
+    with open(path, "w") as f:
+        json.dump({"interface": interface, "recorded_at": time.time(),
+                   "replies": {name: data.hex() for name, data in replies.items()}}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wi-Fi scan and link quality over nl80211")
+    parser.add_argument("command", choices=["show", "record"], help="show a survey, or record nl80211 replies")
+    parser.add_argument("interface", nargs="?", default="wlan0")
+    parser.add_argument("--file", help="record: where to save the replies; show: replay them instead of scanning")
+    parser.add_argument("--replay", action="store_true", help="show: replay --file, or the bundled fixture without it")
+    parser.add_argument("--channels", help="only scan these channels, e.g. 1,6,11")
+    parser.add_argument("--no-scan", action="store_true", help="show: use the driver's cached scan results")
+    args = parser.parse_args()
+    frequencies = [channel_frequency(int(channel)) for channel in args.channels.split(",")] if args.channels else []
+
+    if args.command == "record":
+        if not args.file:
+            parser.error("record needs --file")
+        record(args.interface, args.file, frequencies)
+        print(f"Recorded nl80211 replies for {args.interface} into {args.file}")
+        return 0
+
+    from system_reader import SystemReader
+    report = survey(args.interface, SystemReader(os.environ.get("DIAG_ROOT", "/")), args.file or args.replay,
+                    not args.no_scan, frequencies)
+    print(f"{report.interface} via {report.source} in {report.seconds:.2f}s"
+          f"{'' if report.scanned else ' (cached scan results)' if report.networks else ''}")
+    for bss in report.networks:
+        print(f"  {bss.bssid}  {format_bss(bss)}")
+    if report.link:
+        print(f"Link: {report.link._asdict()}, {grade(report.link.signal_dbm)}")
+    else:
+        print("Not associated")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())